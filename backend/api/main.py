@@ -1,30 +1,96 @@
-from typing import Any, Dict, List
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-from app.config import BOT_USERNAME
-from app.db import (
-    init_db,
-    get_user,
-    get_all_users,
-    get_completed_steps,
-    get_user_pandas,
-    get_referrals_count,
-    update_user,
+from app.config import (
+    AUTH_REQUIRED,
+    BOT_USERNAME,
+    METRICS_ENABLED,
+    PROFILER_ENABLED,
+    PROFILER_INTERVAL,
+    WEBHOOK_IN_API,
+    WEBHOOK_URL,
 )
-from app.course import COURSE_STEPS, get_next_step_for_user
-from app.rating import sort_users_by_rating, rating_score, level_from_xp, rank_name_from_level
+from app.db import user_cache
+from app.storage import boosters, storage
+from app.auth import (
+    AuthError,
+    Session,
+    check_session_key,
+    encode_session,
+    issue_session,
+    profile_version,
+    verify_init_data,
+    verify_session,
+)
+from app.boosters import XP_BOOSTER, COINS_BOOSTER
+from app.catalog import (
+    CATALOG,
+    CATALOG_SECTIONS,
+    CATALOG_VERSION,
+    SKILL_UNLOCKS,
+    STORY_UNLOCKS,
+    CatalogEntry,
+)
+from app.course import COURSE_STEPS, next_step_after
+from app.rating import rating_score, level_from_xp, rank_name_from_level
 from app.shop import list_pandas, buy_panda, PANDAS
-from app.achievements import get_user_achievements_full, ensure_user_achievements_up_to_date
-from app.skills import get_skills_for_level
-from app.storyline import get_unlocked_chapters
-from app.stars import list_products
-from pydantic import BaseModel
+from app.achievements import get_user_achievements_full, record_progress
+from app.skills import unlocked_skills_count
+from app.storyline import unlocked_chapters_count
+from app.fulfilment import fulfil
+from app.fastjson import dumps
+from app.metrics import MetricsMiddleware, render as render_metrics
+from app.profiler import SamplingProfiler, profile_for
+from app.models import User, UserSnapshot
+from bot.main import create_webhook_server
+from bot.webhook import SECRET_HEADER
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AUTH_REQUIRED:
+        check_session_key()
+    else:
+        print("⚠️ AUTH_REQUIRED=0: requests are trusted without session tokens (local debugging only)")
+    # пул соединений (SQLite) открывается в storage.init и живёт всё время работы API
+    await storage.init()
+    await user_cache.start()
+    await boosters.start()
+    if webhook is not None:
+        await webhook.startup()
+    print("✅ API started")
+    yield
+    # бот дорабатывает принятые апдейты, пока пул и кэш ещё открыты
+    if webhook is not None:
+        await webhook.shutdown()
+    # сначала сбрасываем накопленные изменения юзеров, потом закрываем пул
+    await boosters.stop()
+    await user_cache.stop()
+    await storage.close()
 
 
-app = FastAPI(title="Traffic Panda API")
+class FastJSONResponse(JSONResponse):
+    """
+    JSON через app.fastjson (orjson, если установлен) — те же байты, что у
+    JSONResponse. Эндпоинты возвращают его сами, поэтому FastAPI не гоняет
+    ответ через jsonable_encoder и валидацию по аннотации: билдеры и так
+    отдают готовые dict/list из примитивов.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+app = FastAPI(
+    title="Traffic Panda API",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,20 +100,137 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if WEBHOOK_IN_API and not WEBHOOK_URL:
+    raise RuntimeError("WEBHOOK_IN_API=1 requires WEBHOOK_URL")
+# Бот внутри API: апдейты приходят на путь из WEBHOOK_URL, пул и кэш юзеров общие
+webhook = create_webhook_server(own_pool=False) if WEBHOOK_IN_API else None
 
-@app.on_event("startup")
-async def on_startup():
-    await init_db()
-    print("✅ API started")
+if METRICS_ENABLED:
+    # добавлен последним — внешний слой, время считается с учётом CORS
+    app.add_middleware(MetricsMiddleware)
 
 
-# ===== Профиль =====
+# ===== Каталог статического контента =====
+
+# Версионированный URL (/catalog?v=<версия>) не меняется никогда — кэшируем навсегда;
+# без версии клиент перепроверяет раз в 5 минут через If-None-Match
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, max-age=300"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def catalog_response(entry: CatalogEntry, request: Request) -> Response:
+    versioned = request.query_params.get("v") == CATALOG_VERSION
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": IMMUTABLE_CACHE if versioned else REVALIDATE_CACHE,
+    }
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+@app.get("/catalog")
+async def get_catalog(request: Request) -> Response:
+    return catalog_response(CATALOG, request)
+
+
+@app.get("/catalog/{section}")
+async def get_catalog_section(section: str, request: Request) -> Response:
+    entry = CATALOG_SECTIONS.get(section)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Catalog section not found")
+    return catalog_response(entry, request)
+
+
+# ===== Авторизация =====
+# initData проверяется один раз в /auth/session; дальше клиент шлёт
+# Authorization: Bearer <токен>, и запрос от имени user_id проверяется
+# одним HMAC по токену, без БД.
+
+def _bearer_token(request: Request) -> Optional[str]:
+    header = request.headers.get("authorization")
+    if not header:
+        return None
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Invalid Authorization header")
+    return token.strip()
+
+
+def request_session(request: Request) -> Optional[Session]:
+    token = _bearer_token(request)
+    if token is None:
+        if AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Session token required")
+        return None
+    try:
+        return verify_session(token)
+    except AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+def authorize(request: Request, user_id: int):
+    """Запрос от имени user_id: токен (если есть или обязателен) должен быть выдан ему."""
+    session = request_session(request)
+    if session is not None and session.user_id != user_id:
+        raise HTTPException(status_code=403, detail="Session belongs to another user")
+
+
+async def authorize_path_user(user_id: int, request: Request):
+    # async — чтобы FastAPI не гонял проверку через threadpool
+    authorize(request, user_id)
+
+
+USER_AUTH = [Depends(authorize_path_user)]
+
+
+class AuthSessionRequest(BaseModel):
+    init_data: str
+
 
-@app.get("/profile/{user_id}")
-async def get_profile(user_id: int) -> Dict[str, Any]:
-    user = await get_user(user_id)
-    owned = await get_user_pandas(user.user_id)
+@app.post("/auth/session")
+async def auth_session(req: AuthSessionRequest, request: Request) -> FastJSONResponse:
+    try:
+        tg_user = verify_init_data(req.init_data)
+    except AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    version = profile_version(tg_user.username)
+
+    # Продление: живой токен того же юзера с тем же профилем — юзер уже
+    # заведён и username актуален, в БД не ходим
+    current = None
+    try:
+        token = _bearer_token(request)
+        current = verify_session(token) if token else None
+    except (AuthError, HTTPException):
+        pass
+    if current is None or current.user_id != tg_user.user_id or current.profile_version != version:
+        user = await storage.get_user(tg_user.user_id, tg_user.username)
+        if user.username != tg_user.username:
+            await storage.set_username(user.user_id, tg_user.username)
+
+    session = issue_session(tg_user.user_id, version)
+    return FastJSONResponse({
+        "token": encode_session(session),
+        "user_id": session.user_id,
+        "profile_version": session.profile_version,
+        "expires_at": session.expires_at,
+    })
+
+
+# ===== Профиль =====
 
+def build_profile(user: User, owned: List[str], achievements_count: int) -> Dict[str, Any]:
     main_panda_id = None
     if owned:
         main_panda_id = max(
@@ -60,9 +243,6 @@ async def get_profile(user_id: int) -> Dict[str, Any]:
     else:
         avatar_url = "/img/pandas/base_panda.png"
 
-    achievements = await get_user_achievements_full(user.user_id)
-    earned_count = sum(1 for a in achievements if a["earned"])
-
     return {
         "user_id": user.user_id,
         "username": user.username,
@@ -74,16 +254,31 @@ async def get_profile(user_id: int) -> Dict[str, Any]:
         "rating_score": int(rating_score(user)),
         "avatar_url": avatar_url,
         "owned_pandas": owned,
-        "achievements_count": earned_count,
+        "achievements_count": achievements_count,
+        "boosters": [
+            {"kind": kind, "multiplier": multiplier, "expires_at": expires_at}
+            for kind, (multiplier, expires_at) in boosters.for_user(user.user_id).items()
+        ],
     }
 
 
+async def load_profile(user_id: int) -> Dict[str, Any]:
+    user = await storage.get_user(user_id)
+    owned = await storage.get_user_pandas(user.user_id)
+
+    earned = await storage.get_user_achievements(user.user_id)
+    return build_profile(user, owned, len(earned))
+
+
+@app.get("/profile/{user_id}", dependencies=USER_AUTH)
+async def get_profile(user_id: int) -> FastJSONResponse:
+    return FastJSONResponse(await load_profile(user_id))
+
+
 # ===== Рейтинг =====
 
-@app.get("/rating")
-async def get_rating(limit: int = 10) -> Dict[str, Any]:
-    users = await get_all_users()
-    top = sort_users_by_rating(users)[:limit]
+async def build_rating(limit: int = 10) -> Dict[str, Any]:
+    top = await storage.get_top_users(limit)
     return {
         "items": [
             {
@@ -98,32 +293,62 @@ async def get_rating(limit: int = 10) -> Dict[str, Any]:
     }
 
 
-# ===== Прогресс обучения =====
+@app.get("/rating")
+async def get_rating(limit: int = 10) -> FastJSONResponse:
+    return FastJSONResponse(await build_rating(limit))
+
+
+@app.get("/rating/me/{user_id}", dependencies=USER_AUTH)
+async def get_my_rating(user_id: int, around: int = 5) -> FastJSONResponse:
+    user = await storage.get_user(user_id)
+    around = max(0, min(around, 50))
+    rank, total, window = await storage.get_rating_neighbourhood(user.user_id, around)
+    my_index = next((i for i, u in enumerate(window) if u.user_id == user.user_id), None)
+    if my_index is None:
+        # юзер только что создан в другом процессе или шарде и ещё не виден читателю
+        raise HTTPException(status_code=404, detail="User is not in the rating yet")
+    first_rank = rank - my_index
+
+    return FastJSONResponse({
+        "rank": rank,
+        "total": total,
+        # доля игроков, которые ниже в рейтинге
+        "percentile": round(100 * (total - rank) / total, 2) if total else 0,
+        "items": [
+            {
+                "rank": first_rank + idx,
+                "user_id": u.user_id,
+                "username": u.username,
+                "level": u.level,
+                "rank_name": u.rank_name,
+                "rating_score": int(rating_score(u)),
+                "is_me": u.user_id == user.user_id,
+            }
+            for idx, u in enumerate(window)
+        ],
+    })
 
-@app.get("/course-progress/{user_id}")
-async def get_course_progress(user_id: int) -> Dict[str, Any]:
-    user = await get_user(user_id)
-    completed = await get_completed_steps(user.user_id)
-    next_step = await get_next_step_for_user(user.user_id)
-
-    next_step_payload = None
-    if next_step:
-        next_step_payload = {
-            "id": next_step.id,
-            "module_id": next_step.module_id,
-            "title": next_step.title,
-            "content": next_step.content,
-            "question": next_step.question,
-            "options": next_step.options,
-        }
 
+# ===== Прогресс обучения =====
+
+def build_course_progress(completed: List[str]) -> Dict[str, Any]:
+    # текст шага клиент берёт из каталога (раздел course) по next_step_id
+    next_step = next_step_after(completed)
     return {
+        "catalog_version": CATALOG_VERSION,
         "completed_step_ids": completed,
-        "next_step": next_step_payload,
+        "next_step_id": next_step.id if next_step else None,
         "total_steps": len(COURSE_STEPS),
     }
 
 
+@app.get("/course-progress/{user_id}", dependencies=USER_AUTH)
+async def get_course_progress(user_id: int) -> FastJSONResponse:
+    user = await storage.get_user(user_id)
+    completed = await storage.get_completed_steps(user.user_id)
+    return FastJSONResponse(build_course_progress(completed))
+
+
 class CourseAnswerRequest(BaseModel):
     user_id: int
     step_id: str
@@ -131,8 +356,9 @@ class CourseAnswerRequest(BaseModel):
 
 
 @app.post("/course/answer")
-async def answer_course_step(req: CourseAnswerRequest) -> Dict[str, Any]:
-    user = await get_user(req.user_id)
+async def answer_course_step(req: CourseAnswerRequest, request: Request) -> FastJSONResponse:
+    authorize(request, req.user_id)
+    user = await storage.get_user(req.user_id)
     step = COURSE_STEPS.get(req.step_id)
     if not step:
         raise HTTPException(status_code=404, detail="Step not found")
@@ -140,51 +366,58 @@ async def answer_course_step(req: CourseAnswerRequest) -> Dict[str, Any]:
     correct = req.answer_index == step.correct_index
 
     if correct:
-        user.xp += step.reward_xp
-        user.coins += step.reward_coins
+        reward_xp = step.reward_xp * boosters.multiplier(user.user_id, XP_BOOSTER)
+        reward_coins = step.reward_coins * boosters.multiplier(user.user_id, COINS_BOOSTER)
+        user.xp += reward_xp
+        user.coins += reward_coins
         user.level = level_from_xp(user.xp)
         user.rank_name = rank_name_from_level(user.level)
-        await update_user(user)
-        await ensure_user_achievements_up_to_date(user.user_id)
-        message = f"Верно! Награда: +{step.reward_xp} XP, +{step.reward_coins} монет 🪙"
+        await storage.update_user(user)
+        await storage.mark_step_completed(user.user_id, step.id)
+        completed = await storage.get_completed_steps(user.user_id)
+        await record_progress(user.user_id, steps_completed=len(completed), level=user.level)
+        message = f"Верно! Награда: +{reward_xp} XP, +{reward_coins} монет 🪙"
     else:
+        completed = await storage.get_completed_steps(user.user_id)
         message = "Неправильный ответ. Попробуй ещё раз 👀"
 
-    profile = await get_profile(user.user_id)
-    course_progress = await get_course_progress(user.user_id)
+    profile = await load_profile(user.user_id)
+    course_progress = build_course_progress(completed)
 
-    return {
+    return FastJSONResponse({
         "correct": correct,
         "message": message,
         "profile": profile,
         "course_progress": course_progress,
-    }
+    })
 
 
 # ===== Магазин панд =====
 
-@app.get("/shop/pandas/{user_id}")
-async def shop_pandas(user_id: int) -> Dict[str, Any]:
-    user = await get_user(user_id)
-    owned = set(await get_user_pandas(user.user_id))
-    pandas = list_pandas()
+def build_shop(user: User, owned_ids: List[str]) -> Dict[str, Any]:
+    # описание панд — в каталоге (раздел pandas), здесь только состояние юзера
+    owned = set(owned_ids)
+    items = [
+        {
+            "id": p.id,
+            "owned": p.id in owned,
+            "can_afford": (user.coins >= p.price) and (p.id not in owned),
+        }
+        for p in list_pandas()
+    ]
+    return {
+        "catalog_version": CATALOG_VERSION,
+        "items": items,
+        "coins": user.coins,
+        "hourly_income": user.hourly_income,
+    }
 
-    items = []
-    for p in pandas:
-        items.append(
-            {
-                "id": p.id,
-                "name": p.name,
-                "price": p.price,
-                "income_bonus": p.income_bonus,
-                "description": p.description,
-                "image_url": p.image_url,
-                "owned": p.id in owned,
-                "can_afford": (user.coins >= p.price) and (p.id not in owned),
-            }
-        )
 
-    return {"items": items, "coins": user.coins, "hourly_income": user.hourly_income}
+@app.get("/shop/pandas/{user_id}", dependencies=USER_AUTH)
+async def shop_pandas(user_id: int) -> FastJSONResponse:
+    user = await storage.get_user(user_id)
+    owned = await storage.get_user_pandas(user.user_id)
+    return FastJSONResponse(build_shop(user, owned))
 
 
 class BuyPandaRequest(BaseModel):
@@ -193,73 +426,46 @@ class BuyPandaRequest(BaseModel):
 
 
 @app.post("/shop/buy")
-async def shop_buy(req: BuyPandaRequest) -> Dict[str, Any]:
-    user = await get_user(req.user_id)
+async def shop_buy(req: BuyPandaRequest, request: Request) -> FastJSONResponse:
+    authorize(request, req.user_id)
+    user = await storage.get_user(req.user_id)
 
     if req.panda_id not in PANDAS:
         raise HTTPException(status_code=404, detail="Panda not found")
 
     try:
-        await buy_panda(user, req.panda_id)
+        user = await buy_panda(user, req.panda_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    profile = await get_profile(user.user_id)
-    return {
+    owned = await storage.get_user_pandas(user.user_id)
+    await record_progress(user.user_id, pandas_owned=len(owned), level=user.level)
+
+    profile = await load_profile(user.user_id)
+    return FastJSONResponse({
         "status": "ok",
         "user": profile,
-    }
+    })
 
 
 # ===== Задания (пока статические) =====
 
-@app.get("/tasks/{user_id}")
-async def get_tasks(user_id: int) -> Dict[str, Any]:
-    tasks = [
-        {
-            "id": "day1_learn",
-            "title": "Завершить День 1 обучения",
-            "description": "Пройди первые уроки и ответь на вопросы.",
-            "reward_xp": 100,
-            "reward_coins": 15_000,
-            "type": "learn",
-            "is_completed": False,
-        },
-        {
-            "id": "invite_friend",
-            "title": "Пригласить друга",
-            "description": "Поделись реферальной ссылкой и приведи друга.",
-            "reward_xp": 100,
-            "reward_coins": 25_000,
-            "type": "social",
-            "is_completed": False,
-        },
-        {
-            "id": "exam_pass",
-            "title": "Пройти экзамен",
-            "description": "Ответь на все экзаменационные вопросы.",
-            "reward_xp": 300,
-            "reward_coins": 50_000,
-            "type": "exam",
-            "is_completed": False,
-        },
-    ]
-    return {"items": tasks}
+@app.get("/tasks/{user_id}", dependencies=USER_AUTH)
+async def get_tasks(user_id: int, request: Request) -> Response:
+    return catalog_response(CATALOG_SECTIONS["tasks"], request)
 
 
 # ===== Ачивки =====
 
-@app.get("/achievements/{user_id}")
-async def get_achievements(user_id: int) -> Dict[str, Any]:
+@app.get("/achievements/{user_id}", dependencies=USER_AUTH)
+async def get_achievements(user_id: int) -> FastJSONResponse:
     items = await get_user_achievements_full(user_id)
-    return {"items": items}
+    return FastJSONResponse({"items": items})
 
 
 # ===== Друзья =====
 
-@app.get("/friends/{user_id}")
-async def get_friends(user_id: int) -> Dict[str, Any]:
-    referrals = await get_referrals_count(user_id)
+def build_friends(user_id: int, referrals: int) -> Dict[str, Any]:
     link = None
     if BOT_USERNAME:
         link = f"https://t.me/{BOT_USERNAME}?start={user_id}"
@@ -269,117 +475,61 @@ async def get_friends(user_id: int) -> Dict[str, Any]:
     }
 
 
-# ===== Skills =====
+@app.get("/friends/{user_id}", dependencies=USER_AUTH)
+async def get_friends(user_id: int) -> FastJSONResponse:
+    referrals = await storage.get_referrals_count(user_id)
+    return FastJSONResponse(build_friends(user_id, referrals))
 
-@app.get("/skills/{user_id}")
-async def get_skills(user_id: int) -> Dict[str, Any]:
-    user = await get_user(user_id)
-    skills = get_skills_for_level(user.level)
-    return {
-        "items": [
-            {
-                "id": s.id,
-                "branch": s.branch,
-                "name": s.name,
-                "description": s.description,
-                "level_required": s.level_required,
-            }
-            for s in skills
-        ]
-    }
 
+# ===== Skills =====
 
-# ===== Story =====
+def build_skills(level: int) -> Dict[str, Any]:
+    return SKILL_UNLOCKS.data(unlocked_skills_count(level))
 
-@app.get("/story/{user_id}")
-async def get_story(user_id: int) -> Dict[str, Any]:
-    completed = await get_completed_steps(user_id)
-    chapters = get_unlocked_chapters(len(completed))
-    return {
-        "items": [
-            {
-                "id": c.id,
-                "day": c.day,
-                "title": c.title,
-                "text": c.text,
-            }
-            for c in sorted(chapters, key=lambda ch: ch.day)
-        ]
-    }
 
+@app.get("/skills/{user_id}", dependencies=USER_AUTH)
+async def get_skills(user_id: int) -> Response:
+    user = await storage.get_user(user_id)
+    body = SKILL_UNLOCKS.body(unlocked_skills_count(user.level))
+    return Response(content=body, media_type="application/json")
 
-# ===== Stars mock-buy (симуляция покупки через Stars) =====
 
-class StarsMockBuyRequest(BaseModel):
-    user_id: int
-    product_id: str
+# ===== Story =====
 
+def build_story(completed_count: int) -> Dict[str, Any]:
+    return STORY_UNLOCKS.data(unlocked_chapters_count(completed_count))
 
-@app.post("/stars/mock-buy")
-async def stars_mock_buy(req: StarsMockBuyRequest):
-    user = await get_user(req.user_id)
-
-    # Примитивная симуляция покупки продукта
-    if req.product_id == "coins_small":
-        user.coins += 50_000
-        msg = "Начислено 50 000 монет 🪙"
-    elif req.product_id == "coins_medium":
-        user.coins += 120_000
-        msg = "Начислено 120 000 монет 🪙"
-    elif req.product_id == "coins_big":
-        user.coins += 400_000
-        msg = "Начислено 400 000 монет 🪙"
-    elif req.product_id == "xp_boost":
-        user.xp += 500
-        msg = "Выдан XP бустер (+500 XP) ✨"
-    elif req.product_id == "coins_boost":
-        user.coins += 200_000
-        msg = "Выдан Coin бустер (+200 000 монет) 💰"
-    elif req.product_id == "mythic_panda":
-        from app.db import add_panda_purchase
-        await add_panda_purchase(user.user_id, "mythic")
-        msg = "Открыта Мифическая Панда ⭐"
-    elif req.product_id == "season_pass":
-        msg = "Season Pass активирован! 🎫"
-    else:
-        raise HTTPException(status_code=400, detail="Неизвестный продукт")
 
-    user.level = level_from_xp(user.xp)
-    user.rank_name = rank_name_from_level(user.level)
-    await update_user(user)
-    await ensure_user_achievements_up_to_date(user.user_id)
+@app.get("/story/{user_id}", dependencies=USER_AUTH)
+async def get_story(user_id: int) -> Response:
+    body = STORY_UNLOCKS.body(unlocked_chapters_count(await storage.count_completed_steps(user_id)))
+    return Response(content=body, media_type="application/json")
 
-    profile = await get_profile(user.user_id)
 
-    return {
-        "status": "ok",
-        "message": msg,
-        "profile": profile,
-    }
+# ===== Stars (donation products) =====
 
+@app.get("/stars/products")
+async def get_star_products(request: Request) -> Response:
+    return catalog_response(CATALOG_SECTIONS["stars_products"], request)
 
-# ===== Stars (donation products) =====
-class StarsMockBuyRequest(BaseModel):
-    user_id: int
-    product_id: str
 
+# ===== Bootstrap: всё для первого экрана Mini App за один запрос =====
 
-@app.get("/stars/products")
-async def get_star_products() -> Dict[str, Any]:
-    items = list_products()
-    return {
-        "items": [
-            {
-                "id": p.id,
-                "name_ru": p.name_ru,
-                "name_en": p.name_en,
-                "stars_price": p.stars_price,
-                "type": p.type,
-                "payload": p.payload,
-            }
-            for p in items
-        ]
-    }
+@app.get("/bootstrap/{user_id}", dependencies=USER_AUTH)
+async def bootstrap(user_id: int) -> FastJSONResponse:
+    snapshot: UserSnapshot = await storage.get_user_snapshot(user_id)
+    user = snapshot.user
+
+    return FastJSONResponse({
+        "catalog_version": CATALOG_VERSION,
+        "profile": build_profile(user, snapshot.pandas, len(snapshot.achievements)),
+        "shop": build_shop(user, snapshot.pandas),
+        "course_progress": build_course_progress(snapshot.completed_steps),
+        "rating": await build_rating(),
+        "story": build_story(len(snapshot.completed_steps)),
+        "skills": build_skills(user.level),
+        "friends": build_friends(user.user_id, snapshot.referrals_count),
+    })
 
 
 @app.get("/health")
@@ -387,50 +537,88 @@ async def health():
     return {"status": "ok"}
 
 
+# ===== Метрики и профилирование =====
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    text = render_metrics({
+        "user_cache_dirty": ("Несохранённые юзеры в write-behind кэше.", user_cache.dirty_count),
+        "boosters_active": ("Активные бустеры в реестре.", len(boosters)),
+        "webhook_pending_updates": (
+            "Принятые, но не обработанные апдейты бота.",
+            webhook.pool.pending if webhook is not None else 0,
+        ),
+    })
+    return Response(content=text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+profiler = SamplingProfiler(PROFILER_INTERVAL)
+
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0) -> Response:
+    """
+    Профиль event loop за seconds секунд в folded-формате:
+    curl -s 'localhost:8100/debug/profile?seconds=30' | flamegraph.pl > api.svg
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    try:
+        folded = await profile_for(profiler, max(0.1, min(seconds, 300.0)))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=folded, media_type="text/plain; charset=utf-8")
+
+
+# ===== Telegram webhook (WEBHOOK_IN_API=1) =====
+
+if webhook is not None:
+
+    @app.post(webhook.path, include_in_schema=False)
+    async def telegram_webhook(request: Request) -> Response:
+        status = await webhook.feed(request.headers.get(SECRET_HEADER), await request.body())
+        return Response(status_code=status)
+
+
+class StarsMockBuyRequest(BaseModel):
+    user_id: int
+    product_id: str
+    # один ключ на одно нажатие "купить": ретраи клиента не выдадут товар дважды
+    idempotency_key: Optional[str] = None
+
+
 @app.post("/stars/mock-buy")
-async def stars_mock_buy(req: StarsMockBuyRequest) -> Dict[str, Any]:
+async def stars_mock_buy(req: StarsMockBuyRequest, request: Request) -> FastJSONResponse:
     """
     Мок-покупка Stars: никакой реальной оплаты, просто выдаём бонусы.
     Потом этот endpoint можно заменить реальной интеграцией с Telegram Stars.
     """
-    user = await get_user(req.user_id)
-
-    # Примитивная логика бонусов
-    if req.product_id == "coins_small":
-        user.coins += 50_000
-        msg = "Начислено 50 000 монет 🪙"
-    elif req.product_id == "coins_medium":
-        user.coins += 120_000
-        msg = "Начислено 120 000 монет 🪙"
-    elif req.product_id == "coins_big":
-        user.coins += 400_000
-        msg = "Начислено 400 000 монет 🪙"
-    elif req.product_id == "xp_boost":
-        user.xp += 500
-        msg = "Выдан XP бустер (симуляция) +500 XP ✨"
-    elif req.product_id == "coins_boost":
-        user.coins += 200_000
-        msg = "Выдан Coin бустер (симуляция) +200 000 монет 💰"
-    elif req.product_id == "mythic_panda":
-        # можно привязать к отдельной “мифической” панде
-        from app.db import add_panda_purchase  # импорт внутри, чтобы не зациклить
-        await add_panda_purchase(user.user_id, "mythic")
-        msg = "Открыта Мифическая Панда ⭐"
-    elif req.product_id == "season_pass":
-        msg = "Season Pass (симуляция) активирован!"
-    else:
-        raise HTTPException(status_code=400, detail="Неизвестный продукт")
+    authorize(request, req.user_id)
+    user = await storage.get_user(req.user_id)
 
-    # Обновляем уровень/ранг и сохраняем пользователя
-    user.level = level_from_xp(user.xp)
-    user.rank_name = rank_name_from_level(user.level)
-    await update_user(user)
-    await ensure_user_achievements_up_to_date(user.user_id)
+    # Что выдавать, берётся из payload продукта (app.fulfilment)
+    try:
+        user, msg, replayed = await fulfil(
+            user.user_id,
+            req.product_id,
+            charge_id=f"mock:{req.user_id}:{req.idempotency_key}" if req.idempotency_key else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    profile = await get_profile(user.user_id)
+    if not replayed:
+        await record_progress(
+            user.user_id,
+            level=user.level,
+            pandas_owned=len(await storage.get_user_pandas(user.user_id)),
+        )
 
-    return {
+    profile = await load_profile(user.user_id)
+
+    return FastJSONResponse({
         "status": "ok",
         "message": msg,
         "profile": profile,
-    }
+    })
@@ -1,15 +1,8 @@
 from dataclasses import dataclass
-from typing import Dict
-
-from .db import (
-    get_user,
-    get_completed_steps,
-    get_user_pandas,
-    get_referrals_count,
-    get_user_achievements,
-    add_user_achievement,
-)
+from typing import Any, Dict, Iterable, List, Optional
+
 from .rating import level_from_xp
+from .storage import storage
 
 
 @dataclass
@@ -88,45 +81,87 @@ ACHIEVEMENTS: Dict[str, Achievement] = {
 }
 
 
-async def ensure_user_achievements_up_to_date(user_id: int):
-    user = await get_user(user_id)
-    completed_steps = await get_completed_steps(user_id)
-    pandas = await get_user_pandas(user_id)
-    referrals = await get_referrals_count(user_id)
-    user_level = level_from_xp(user.xp)
+# condition_type -> ачивки этого типа по возрастанию порога.
+# Событие "изменился счётчик X" проверяет только свой список.
+ACHIEVEMENTS_BY_CONDITION: Dict[str, List[Achievement]] = {}
+for _ach in sorted(ACHIEVEMENTS.values(), key=lambda a: a.threshold):
+    ACHIEVEMENTS_BY_CONDITION.setdefault(_ach.condition_type, []).append(_ach)
+
+
+def find_new_achievements(counters: Dict[str, int], already: Iterable[str]) -> List[str]:
+    """
+    Чистая проверка: counters — только изменившиеся счётчики
+    (steps_completed / level / pandas_owned / referrals).
+    """
+    already = set(already)
+    new_ids = []
+    for condition_type, value in counters.items():
+        for ach in ACHIEVEMENTS_BY_CONDITION.get(condition_type, ()):
+            if ach.threshold > value:
+                break
+            if ach.id not in already:
+                new_ids.append(ach.id)
+    return new_ids
+
+
+async def record_progress(
+    user_id: int,
+    earned: Optional[Iterable[str]] = None,
+    **counters: int,
+) -> List[str]:
+    """
+    Доменное событие прогресса юзера, например:
+        await record_progress(user_id, steps_completed=5, level=3)
+    Вызывается из мест, где счётчики уже посчитаны (ответ на урок, покупка,
+    реферал). Новые ачивки пишутся одной пачкой. Возвращает их id.
+    """
+    if not any(
+        ach.threshold <= value
+        for condition_type, value in counters.items()
+        for ach in ACHIEVEMENTS_BY_CONDITION.get(condition_type, ())[:1]
+    ):
+        # ни один счётчик не дотягивает даже до минимального порога
+        return []
+
+    if earned is None:
+        earned = await storage.get_user_achievements(user_id)
+    new_ids = find_new_achievements(counters, earned)
+    if new_ids:
+        await storage.add_user_achievements(user_id, new_ids)
+    return new_ids
 
-    already = set(await get_user_achievements(user_id))
 
-    for ach in ACHIEVEMENTS.values():
-        if ach.id in already:
-            continue
+async def ensure_user_achievements_up_to_date(user_id: int) -> List[str]:
+    """
+    Полный пересчёт всех условий — для бэкфилла юзеров, которые выполнили
+    условия до появления событий (python -m backfill.main). В запросах не используется.
+    """
+    user = await storage.get_user(user_id)
+    completed_steps = await storage.get_completed_steps(user_id)
+    pandas = await storage.get_user_pandas(user_id)
+    referrals = await storage.get_referrals_count(user_id)
+    return await record_progress(
+        user_id,
+        steps_completed=len(completed_steps),
+        level=level_from_xp(user.xp),
+        pandas_owned=len(pandas),
+        referrals=referrals,
+    )
 
-        ok = False
-        if ach.condition_type == "steps_completed":
-            ok = len(completed_steps) >= ach.threshold
-        elif ach.condition_type == "level":
-            ok = user_level >= ach.threshold
-        elif ach.condition_type == "pandas_owned":
-            ok = len(pandas) >= ach.threshold
-        elif ach.condition_type == "referrals":
-            ok = referrals >= ach.threshold
 
-        if ok:
-            await add_user_achievement(user_id, ach.id)
+def achievements_payload(earned_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    earned_ids = set(earned_ids)
+    return [
+        {
+            "id": ach.id,
+            "name": ach.name,
+            "description": ach.description,
+            "earned": ach.id in earned_ids,
+        }
+        for ach in ACHIEVEMENTS.values()
+    ]
 
 
 async def get_user_achievements_full(user_id: int):
-    await ensure_user_achievements_up_to_date(user_id)
-    earned_ids = set(await get_user_achievements(user_id))
-
-    result = []
-    for ach in ACHIEVEMENTS.values():
-        result.append(
-            {
-                "id": ach.id,
-                "name": ach.name,
-                "description": ach.description,
-                "earned": ach.id in earned_ids,
-            }
-        )
-    return result
+    earned_ids = await storage.get_user_achievements(user_id)
+    return achievements_payload(earned_ids)
@@ -0,0 +1,135 @@
+import hashlib
+import hmac
+import json
+import time
+from base64 import urlsafe_b64encode
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from .config import BOT_TOKEN, INIT_DATA_MAX_AGE, SESSION_SECRET, SESSION_TTL
+
+
+class AuthError(ValueError):
+    pass
+
+
+@dataclass
+class TelegramUser:
+    user_id: int
+    username: Optional[str]
+    auth_date: int
+
+
+@dataclass
+class Session:
+    user_id: int
+    profile_version: str
+    expires_at: int
+
+
+# ===== initData Mini App =====
+# https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+
+@lru_cache(maxsize=4)
+def webapp_secret_key(bot_token: str) -> bytes:
+    """HMAC_SHA256(bot_token, "WebAppData") — от токена бота, считаем один раз."""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def verify_init_data(
+    init_data: str,
+    bot_token: str = BOT_TOKEN,
+    max_age: int = INIT_DATA_MAX_AGE,
+    now: Optional[int] = None,
+) -> TelegramUser:
+    """Проверяет подпись Telegram.WebApp.initData и достаёт из неё юзера. Ошибки — AuthError."""
+    if not bot_token:
+        raise AuthError("BOT_TOKEN is not set")
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", "")
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    expected = hmac.new(webapp_secret_key(bot_token), check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(received.encode(), expected.encode()):
+        raise AuthError("Invalid initData signature")
+
+    try:
+        auth_date = int(fields["auth_date"])
+        user = json.loads(fields["user"])
+        user_id = int(user["id"])
+    except (KeyError, ValueError, TypeError):
+        raise AuthError("Malformed initData")
+    now = int(time.time()) if now is None else now
+    if max_age and now - auth_date > max_age:
+        raise AuthError("initData expired")
+    return TelegramUser(user_id=user_id, username=user.get("username"), auth_date=auth_date)
+
+
+def profile_version(username: Optional[str]) -> str:
+    """Отпечаток данных профиля Telegram, которые мы храним (сейчас — username)."""
+    return hashlib.sha256((username or "").encode()).hexdigest()[:8]
+
+
+# ===== Токен сессии =====
+# "<user_id>.<profile_version>.<expires_at>.<подпись>": проверка — один HMAC
+# по короткой строке и compare_digest, без БД и без разбора initData.
+
+def _session_key() -> Optional[bytes]:
+    if SESSION_SECRET:
+        return SESSION_SECRET.encode()
+    if BOT_TOKEN:
+        return hmac.new(b"TrafficPandaSession", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    # от пустого токена ключ был бы общеизвестной константой — токены подделывались бы
+    return None
+
+
+SESSION_KEY = _session_key()
+
+
+def check_session_key():
+    """Для старта API с обязательной авторизацией: без секрета сессии не выдать и не проверить."""
+    if SESSION_KEY is None:
+        raise RuntimeError(
+            "Set SESSION_SECRET or BOT_TOKEN to sign session tokens "
+            "(AUTH_REQUIRED=0 disables auth for local debugging only)"
+        )
+
+
+def _sign(payload: str, key: Optional[bytes]) -> str:
+    if key is None:
+        raise AuthError("Session secret is not configured")
+    mac = hmac.new(key, payload.encode(), hashlib.sha256).digest()
+    return urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+
+def issue_session(
+    user_id: int,
+    version: str,
+    ttl: int = SESSION_TTL,
+    now: Optional[int] = None,
+) -> Session:
+    now = int(time.time()) if now is None else now
+    return Session(user_id=user_id, profile_version=version, expires_at=now + ttl)
+
+
+def encode_session(session: Session, key: Optional[bytes] = SESSION_KEY) -> str:
+    payload = f"{session.user_id}.{session.profile_version}.{session.expires_at}"
+    return f"{payload}.{_sign(payload, key)}"
+
+
+def verify_session(
+    token: str, key: Optional[bytes] = SESSION_KEY, now: Optional[int] = None
+) -> Session:
+    payload, _, signature = token.rpartition(".")
+    if not payload or not hmac.compare_digest(signature.encode(), _sign(payload, key).encode()):
+        raise AuthError("Invalid session token")
+    try:
+        user_id, version, expires_at = payload.split(".")
+        session = Session(user_id=int(user_id), profile_version=version, expires_at=int(expires_at))
+    except ValueError:
+        raise AuthError("Malformed session token")
+    now = int(time.time()) if now is None else now
+    if session.expires_at <= now:
+        raise AuthError("Session expired")
+    return session
@@ -0,0 +1,113 @@
+import asyncio
+import heapq
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# (id строки, user_id, kind, multiplier, expires_at)
+BoosterRow = Tuple[int, int, str, int, int]
+LoadFn = Callable[[int, int], Awaitable[List[BoosterRow]]]
+
+# kind бустера -> на что он действует
+XP_BOOSTER = "xp"        # награда XP за уроки
+COINS_BOOSTER = "coins"  # монеты за уроки и пассивный доход
+BOOSTER_KINDS = (XP_BOOSTER, COINS_BOOSTER)
+
+
+class BoosterRegistry:
+    """
+    Активные бустеры всех юзеров в памяти процесса.
+
+    - active/multiplier — O(1): два dict-lookup и сравнение со временем;
+    - истечение — через min-heap по expires_at: фоновая задача раз в
+      sweep_interval снимает протухшие записи, запросы таблицу не сканируют;
+    - новые бустеры (в т.ч. купленные из процесса бота) подтягиваются
+      по возрастающему id строки user_boosters.
+    """
+
+    def __init__(self, sweep_interval: float, load: LoadFn):
+        self.sweep_interval = sweep_interval
+        self._load = load
+        self._active: Dict[int, Dict[str, Tuple[int, int]]] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._last_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self.enabled = False
+
+    def __len__(self) -> int:
+        return sum(len(kinds) for kinds in self._active.values())
+
+    def active(self, user_id: int, kind: str, now: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """(multiplier, expires_at) действующего бустера или None."""
+        kinds = self._active.get(user_id)
+        if not kinds:
+            return None
+        boost = kinds.get(kind)
+        if boost is None:
+            return None
+        if boost[1] <= (now if now is not None else time.time()):
+            return None
+        return boost
+
+    def multiplier(self, user_id: int, kind: str, now: Optional[int] = None) -> int:
+        boost = self.active(user_id, kind, now)
+        return boost[0] if boost else 1
+
+    def for_user(self, user_id: int, now: Optional[int] = None) -> Dict[str, Tuple[int, int]]:
+        """Все действующие бустеры юзера: kind -> (multiplier, expires_at)."""
+        now = now if now is not None else time.time()
+        kinds = self._active.get(user_id) or {}
+        return {kind: boost for kind, boost in kinds.items() if boost[1] > now}
+
+    def add(self, user_id: int, kind: str, multiplier: int, expires_at: int):
+        self._active.setdefault(user_id, {})[kind] = (multiplier, expires_at)
+        heapq.heappush(self._heap, (expires_at, user_id, kind))
+
+    def expire(self, now: Optional[int] = None) -> int:
+        """Снимает истёкшие бустеры. Возвращает, сколько снято."""
+        now = now if now is not None else time.time()
+        removed = 0
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, user_id, kind = heapq.heappop(heap)
+            kinds = self._active.get(user_id)
+            # запись в куче могла устареть: бустер продлили новой покупкой
+            if kinds and kind in kinds and kinds[kind][1] == expires_at:
+                del kinds[kind]
+                if not kinds:
+                    del self._active[user_id]
+                removed += 1
+        return removed
+
+    async def refresh(self):
+        """Подтягивает бустеры, записанные в БД после последней загрузки."""
+        rows = await self._load(self._last_id, int(time.time()))
+        for row_id, user_id, kind, multiplier, expires_at in rows:
+            self.add(user_id, kind, multiplier, expires_at)
+            self._last_id = max(self._last_id, row_id)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.refresh()
+                self.expire()
+            except Exception as e:
+                print(f"⚠️ booster sweep failed: {e!r}")
+
+    async def start(self):
+        if self.enabled:
+            return
+        await self.refresh()
+        self.enabled = True
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if not self.enabled:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.enabled = False
@@ -0,0 +1,155 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from .course import STEP_ORDER
+from .fastjson import dumps as encode
+from .shop import PANDAS
+from .skills import SKILLS, SKILLS_BY_LEVEL
+from .stars import PRODUCTS
+from .storyline import CHAPTERS_BY_DAY
+from .tasks import TASKS
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Раздел каталога, уже закодированный в JSON, и его ETag."""
+    data: Dict[str, Any]
+    body: bytes
+    etag: str
+
+
+def _entry(data: Dict[str, Any]) -> CatalogEntry:
+    body = encode(data)
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    return CatalogEntry(data=data, body=body, etag=f'"{digest}"')
+
+
+def _sections() -> Dict[str, Dict[str, Any]]:
+    return {
+        "pandas": {
+            "items": [
+                {
+                    "id": p.id,
+                    "name": p.name,
+                    "price": p.price,
+                    "income_bonus": p.income_bonus,
+                    "description": p.description,
+                    "image_url": p.image_url,
+                }
+                for p in PANDAS.values()
+            ]
+        },
+        # без correct_index: ответы остаются на сервере
+        "course": {
+            "items": [
+                {
+                    "id": s.id,
+                    "module_id": s.module_id,
+                    "title": s.title,
+                    "content": s.content,
+                    "question": s.question,
+                    "options": s.options,
+                }
+                for s in STEP_ORDER
+            ]
+        },
+        "skills": {
+            "items": [
+                {
+                    "id": s.id,
+                    "branch": s.branch,
+                    "name": s.name,
+                    "description": s.description,
+                    "level_required": s.level_required,
+                }
+                for s in SKILLS.values()
+            ]
+        },
+        "story": {
+            "items": [
+                {"id": c.id, "day": c.day, "title": c.title, "text": c.text}
+                for c in CHAPTERS_BY_DAY
+            ]
+        },
+        "stars_products": {
+            "items": [
+                {
+                    "id": p.id,
+                    "name_ru": p.name_ru,
+                    "name_en": p.name_en,
+                    "stars_price": p.stars_price,
+                    "type": p.type,
+                    "payload": p.payload,
+                }
+                for p in PRODUCTS.values()
+            ]
+        },
+        "tasks": {
+            "items": [
+                {
+                    "id": t.id,
+                    "title": t.title,
+                    "description": t.description,
+                    "reward_xp": t.reward_xp,
+                    "reward_coins": t.reward_coins,
+                    "type": t.type,
+                    "is_completed": False,
+                }
+                for t in TASKS.values()
+            ]
+        },
+    }
+
+
+def build_catalog() -> Tuple[str, CatalogEntry, Dict[str, CatalogEntry]]:
+    """
+    Компилирует весь статический контент один раз: каждый раздел и каталог
+    целиком кодируются в байты, версия — хэш содержимого. Контент меняется
+    только с деплоем, поэтому клиент кэширует его по версии сколько угодно.
+    """
+    sections = {name: _entry(data) for name, data in _sections().items()}
+    version = hashlib.sha256(
+        b"".join(name.encode() + entry.body for name, entry in sorted(sections.items()))
+    ).hexdigest()[:16]
+    full = _entry({"version": version, **{name: e.data for name, e in sections.items()}})
+    return version, full, sections
+
+
+CATALOG_VERSION, CATALOG, CATALOG_SECTIONS = build_catalog()
+
+
+class UnlockIndex:
+    """
+    Ответы вида {"catalog_version": ..., "unlocked_ids": [первые k id]}
+    для всех k сразу. id кодируются в JSON один раз; тело ответа для k —
+    срез готовых байтов, без сериализации на запрос и без O(n^2) памяти.
+    """
+
+    def __init__(self, ids: List[str], version: str):
+        self.ids = ids
+        self.version = version
+        # '{"catalog_version":"...","unlocked_ids":[' — без закрывающих ']}'
+        self._head = encode({"catalog_version": version, "unlocked_ids": []})[:-2]
+        parts = [encode(i) for i in ids]
+        self._joined = b",".join(parts)
+        # _ends[k] — длина префикса _joined с первыми k id
+        self._ends = [0]
+        for i, part in enumerate(parts):
+            self._ends.append(self._ends[-1] + len(part) + (1 if i else 0))
+        self._data: List[Any] = [None] * (len(ids) + 1)
+
+    def data(self, k: int) -> Dict[str, Any]:
+        """Ответ как dict (для /bootstrap); собирается один раз на k."""
+        cached = self._data[k]
+        if cached is None:
+            cached = {"catalog_version": self.version, "unlocked_ids": self.ids[:k]}
+            self._data[k] = cached
+        return cached
+
+    def body(self, k: int) -> bytes:
+        return self._head + self._joined[:self._ends[k]] + b"]}"
+
+
+SKILL_UNLOCKS = UnlockIndex([s.id for s in SKILLS_BY_LEVEL], CATALOG_VERSION)
+STORY_UNLOCKS = UnlockIndex([c.id for c in CHAPTERS_BY_DAY], CATALOG_VERSION)
@@ -7,11 +7,95 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 BOT_USERNAME = os.getenv("BOT_USERNAME", "")
 WEBAPP_URL = os.getenv("WEBAPP_URL", "https://trafficpanda.net")
 DB_PATH = os.getenv("DB_PATH", "trafficpanda.db")
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(64 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Шардирование по хешу user_id (app.shards): DB_SHARDS файлов рядом с DB_PATH, у каждого
+# свой писатель и свой пул (DB_READERS читателей на шард). Юзер со всеми своими
+# строками живёт в одном шарде; рейтинг и счётчики рефералов собираются по шардам.
+# Сменить число шардов на живых данных — python -m reshard.main
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+
+# Движок хранилища (app.storage): sqlite — файл DB_PATH; memory — всё в памяти процесса,
+# без I/O и без сохранения между запусками (бенчмарки, симуляции)
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "sqlite")
+
+# Кто пишет в БД (все записи app.db: update_user, покупки, шаги курса, рефералы,
+# ачивки, flush кэша; своим соединением — только миграция схемы в init_db при старте):
+#   actor  — очередь внутри процесса, одна транзакция на накопившуюся пачку (по умолчанию);
+#   unix   — общий сервис записи `python -m writer.main` на DB_WRITER_SOCKET: нужен, когда
+#            пишут несколько процессов (воркеры uvicorn и бот); читают они по-прежнему напрямую;
+#            при DB_SHARDS > 1 — сокет на шард (app.shards.shard_paths от DB_WRITER_SOCKET);
+#   direct — каждая запись своим commit, как раньше
+DB_WRITER = os.getenv("DB_WRITER", "actor")
+DB_WRITER_SOCKET = os.getenv("DB_WRITER_SOCKET", "trafficpanda-writer.sock")
+DB_WRITER_MAX_BATCH = int(os.getenv("DB_WRITER_MAX_BATCH", "256"))
 
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "8100"))
 
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
-WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "supersecret")
+# Секрет заголовка X-Telegram-Bot-Api-Secret-Token: без него (или с прежним "supersecret")
+# вебхук не стартует — иначе апдейты, в том числе оплаты, мог бы прислать кто угодно
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Вебхук бота: с WEBHOOK_URL bot.main слушает WEBHOOK_HOST:WEBHOOK_PORT вместо polling,
+# с WEBHOOK_IN_API=1 тот же эндпоинт монтируется в FastAPI (отдельный процесс бота не нужен)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8200"))
+WEBHOOK_IN_API = os.getenv("WEBHOOK_IN_API", "0") == "1"
+# Апдейты разбирают WEBHOOK_WORKERS воркеров (апдейты одного чата — строго по очереди);
+# при WEBHOOK_MAX_PENDING необработанных приём ждёт, и Telegram притормаживает доставку
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+# Свой Bot API сервер (telegram-bot-api --local или фейк для бенчмарка); пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# Каталог из файлов: skills.json / story.json в этой папке заменяют встроенный контент
+CONTENT_DIR = os.getenv("CONTENT_DIR", "")
+
+# Хранение прогресса курса: rows (строка на шаг) или bitmap (одно число на юзера)
+COURSE_PROGRESS_STORAGE = os.getenv("COURSE_PROGRESS_STORAGE", "rows")
+
+# Write-behind кэш юзеров в API: сколько держать в памяти (0 — выключен)
+# и как часто сбрасывать изменения в БД. Записи бота, скриптов и других воркеров
+# не теряются: строку, изменённую мимо кэша, выдаёт users.version, и flush
+# прибавляет к ней только изменения кэша
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_FLUSH_INTERVAL = float(os.getenv("USER_CACHE_FLUSH_INTERVAL", "1.0"))
+# Сколько секунд юзер без несохранённых изменений отдаётся из кэша, не перечитываясь
+# из БД: столько же запаздывают в API записи бота и других воркеров
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "1.0"))
+# Покупки всегда пишутся сразу одной транзакцией (db.apply_purchase);
+# с DURABLE_PURCHASES=1 их commit дополнительно fsync'ается (synchronous=FULL)
+DURABLE_PURCHASES = os.getenv("DURABLE_PURCHASES", "1") == "1"
+
+# Пассивный доход копится офлайн не дольше этого окна
+OFFLINE_INCOME_CAP_HOURS = int(os.getenv("OFFLINE_INCOME_CAP_HOURS", "3"))
+
+# Как часто реестр бустеров снимает истёкшие и подтягивает купленные в других процессах
+BOOSTER_SWEEP_INTERVAL = float(os.getenv("BOOSTER_SWEEP_INTERVAL", "1.0"))
+
+# Рефералы копятся в очереди и пишутся пачкой: раз в интервал или по заполнении
+REFERRAL_FLUSH_INTERVAL = float(os.getenv("REFERRAL_FLUSH_INTERVAL", "0.5"))
+REFERRAL_BATCH_SIZE = int(os.getenv("REFERRAL_BATCH_SIZE", "500"))
+
+# /metrics: гистограммы по маршрутам и счётчики вызовов app.db
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# /debug/profile: сэмплирующий профайлер (только для отладки, не держать включённым в проде)
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))
+
+# Авторизация Mini App: initData проверяется один раз (POST /auth/session),
+# дальше запросы идут с подписанным токеном сессии.
+# SESSION_SECRET пусто — ключ выводится из BOT_TOKEN (одинаков во всех воркерах);
+# без обоих API с обязательной авторизацией не запустится
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+# initData старше этого (секунд) не принимаем
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))
+# AUTH_REQUIRED=0 — только для локальной отладки: запросы без токена пропускаются
+# как раньше, от имени любого user_id из пути или тела запроса
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "1") == "1"
 
 STARS_PROVIDER_TOKEN = os.getenv("STARS_PROVIDER_TOKEN", "")
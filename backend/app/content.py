@@ -0,0 +1,38 @@
+import json
+import os
+from dataclasses import fields
+from typing import Dict, Optional, Type, TypeVar
+
+from .config import CONTENT_DIR
+
+T = TypeVar("T")
+
+
+def load_content(name: str, cls: Type[T]) -> Optional[Dict[str, T]]:
+    """
+    Читает {CONTENT_DIR}/{name}.json — список объектов с полями dataclass'а cls.
+    Возвращает dict id -> объект в порядке файла, или None, если файла нет
+    (тогда модуль остаётся со встроенным контентом).
+
+    Вызывается один раз при импорте: размер файла влияет только на старт.
+    """
+    if not CONTENT_DIR:
+        return None
+    path = os.path.join(CONTENT_DIR, f"{name}.json")
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+
+    names = {f.name for f in fields(cls)}
+    items: Dict[str, T] = {}
+    for i, obj in enumerate(raw):
+        unknown = set(obj) - names
+        if unknown:
+            raise ValueError(f"{path}[{i}]: unknown fields {sorted(unknown)}")
+        item = cls(**obj)
+        if item.id in items:
+            raise ValueError(f"{path}[{i}]: duplicate id {item.id}")
+        items[item.id] = item
+    return items
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 
-from .db import is_step_completed
+from .storage import storage
 
 
 @dataclass
@@ -19,6 +19,27 @@ class CourseStep:
 
 COURSE_STEPS: Dict[str, CourseStep] = {}
 
+# Порядок прохождения: шаг -> его номер в курсе, и обратно
+STEP_ORDER: List[CourseStep] = []
+STEP_INDEX: Dict[str, int] = {}
+
+# Номера битов для bitmap-хранения прогресса (COURSE_PROGRESS_STORAGE=bitmap).
+# Список только дописывается в конец: номер бита шага не должен меняться,
+# иначе сохранённый прогресс юзеров "переедет" на другие шаги.
+STEP_BIT_IDS = (
+    "d1_s1", "d1_s2", "d1_s3",
+    "d2_s1", "d2_s2", "d2_s3",
+    "d3_s1", "d3_s2", "d3_s3",
+    "d4_s1", "d4_s2", "d4_s3",
+    "d5_s1", "d5_s2", "d5_s3",
+    "d6_s1", "d6_s2", "d6_s3",
+    "d7_s1", "d7_s2", "d7_s3",
+    "ex_s1", "ex_s2", "ex_s3", "ex_s4", "ex_s5",
+)
+STEP_BITS: Dict[str, int] = {step_id: i for i, step_id in enumerate(STEP_BIT_IDS)}
+# биты хранятся в SQLite INTEGER (знаковый 64-бит)
+assert len(STEP_BIT_IDS) <= 63, "bitmap прогресса не влезает в INTEGER"
+
 
 def init_course_data():
     """
@@ -593,9 +614,36 @@ def init_course_data():
     for s in steps:
         COURSE_STEPS[s.id] = s
 
+    missing = [s.id for s in steps if s.id not in STEP_BITS]
+    if missing:
+        raise ValueError(f"Шагам не назначен бит в STEP_BIT_IDS: {missing}")
+
+    STEP_ORDER[:] = list(COURSE_STEPS.values())
+    STEP_INDEX.clear()
+    STEP_INDEX.update({s.id: i for i, s in enumerate(STEP_ORDER)})
+
+
+def completed_mask(completed_step_ids: Iterable[str]) -> int:
+    """Битсет пройденных шагов: бит i = шаг STEP_ORDER[i]."""
+    mask = 0
+    for step_id in completed_step_ids:
+        idx = STEP_INDEX.get(step_id)
+        if idx is not None:
+            mask |= 1 << idx
+    return mask
+
+
+def next_step_after(completed_step_ids: Iterable[str]) -> Optional[CourseStep]:
+    """Первый непройденный шаг по уже загруженному списку пройденных."""
+    mask = completed_mask(completed_step_ids)
+    # номер младшего нулевого бита = первый непройденный шаг
+    idx = (~mask & (mask + 1)).bit_length() - 1
+    return STEP_ORDER[idx] if idx < len(STEP_ORDER) else None
+
 
 async def get_next_step_for_user(user_id: int) -> Optional[CourseStep]:
-    for step in COURSE_STEPS.values():
-        if not await is_step_completed(user_id, step.id):
-            return step
-    return None
+    # один запрос вместо is_step_completed на каждый шаг
+    return next_step_after(await storage.get_completed_steps(user_id))
+
+
+init_course_data()
@@ -1,9 +1,33 @@
-import aiosqlite
-from typing import List, Optional
+import asyncio
+import heapq
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from .config import DB_PATH
-from .models import User
-from .rating import level_from_xp, rank_name_from_level
+from .config import (
+    COURSE_PROGRESS_STORAGE,
+    DB_PATH,
+    DB_SHARDS,
+    DB_WRITER,
+    DB_WRITER_MAX_BATCH,
+    DB_WRITER_SOCKET,
+    METRICS_ENABLED,
+    USER_CACHE_SIZE,
+    USER_CACHE_FLUSH_INTERVAL,
+    USER_CACHE_TTL,
+)
+from .boosters import COINS_BOOSTER
+from .income import accrue_income
+from .metrics import instrument_module
+from .models import User, UserSnapshot
+from .pool import read_conn, write_conn
+from .shards import shard_index, shard_paths
+from .storage import DuplicatePurchase, accrue, boosters
+from .user_cache import Pending, UserCache
+from .writer import Mutation, create_writer, mutation
+from .rating import level_from_xp, rank_name_from_level, rating_score
 
 CREATE_USERS_TABLE = """
 CREATE TABLE IF NOT EXISTS users (
@@ -14,10 +38,53 @@ CREATE TABLE IF NOT EXISTS users (
     hourly_income INTEGER DEFAULT 10,
     level INTEGER DEFAULT 1,
     rank_name TEXT DEFAULT 'Новичок',
-    referred_by INTEGER
+    referred_by INTEGER,
+    rating_score REAL DEFAULT 0,
+    last_accrued_at INTEGER DEFAULT 0,
+    income_units INTEGER DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
 );
 """
 
+# Версия строки для write-behind кэша API (app.user_cache): её меняет любая запись
+# полей, которые пишет flush кэша, — из бота, скрипта или другого процесса.
+# Кто ставит version сам (flush, покупки), тот триггер не запускает.
+CREATE_USERS_VERSION_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS users_version AFTER UPDATE OF "
+    "coins, xp, hourly_income, level, rank_name, rating_score, last_accrued_at, income_units "
+    "ON users WHEN NEW.version = OLD.version "
+    "BEGIN UPDATE users SET version = version + 1 WHERE user_id = NEW.user_id; END"
+)
+
+# Материализованный рейтинг: топ-K читается по индексу, без сортировки всей таблицы.
+# user_id во втором ключе даёт стабильный порядок при равных очках.
+CREATE_USERS_RATING_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_users_rating ON users (rating_score DESC, user_id);
+"""
+
+# Число юзеров для /rating/me без COUNT(*) по всей таблице: одна строка,
+# которую ведут триггеры — значит, верно при записи из любого процесса и скрипта
+CREATE_USERS_TOTAL_TABLE = """
+CREATE TABLE IF NOT EXISTS users_total (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    n INTEGER NOT NULL
+);
+"""
+CREATE_USERS_TOTAL_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS users_total_insert AFTER INSERT ON users "
+    "BEGIN UPDATE users_total SET n = n + 1 WHERE id = 0; END",
+    "CREATE TRIGGER IF NOT EXISTS users_total_delete AFTER DELETE ON users "
+    "BEGIN UPDATE users_total SET n = n - 1 WHERE id = 0; END",
+)
+
+# Та же формула, что и app.rating.rating_score — нужна для бэкфилла старых строк
+RATING_SCORE_SQL = "xp * 2 + coins * 0.001 + hourly_income * 10"
+
+USER_COLUMNS = (
+    "user_id, username, coins, xp, hourly_income, level, rank_name, referred_by, last_accrued_at, "
+    "income_units"
+)
+
 CREATE_COURSE_PROGRESS_TABLE = """
 CREATE TABLE IF NOT EXISTS course_progress (
     user_id INTEGER,
@@ -27,6 +94,29 @@ CREATE TABLE IF NOT EXISTS course_progress (
 );
 """
 
+# Компактный режим: весь прогресс юзера — одно INTEGER-число,
+# бит i = шаг app.course.STEP_BIT_IDS[i]
+CREATE_COURSE_PROGRESS_BITS_TABLE = """
+CREATE TABLE IF NOT EXISTS course_progress_bits (
+    user_id INTEGER PRIMARY KEY,
+    bits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+BITMAP_PROGRESS = COURSE_PROGRESS_STORAGE == "bitmap"
+
+# Файлы шардов (app.shards); без шардирования — один DB_PATH.
+# В шарде юзера лежат его users, course_progress*, panda_purchases, user_achievements,
+# star_purchases и user_boosters; строка referrals — в шарде приглашённого.
+SHARDS = shard_paths(DB_PATH, DB_SHARDS)
+SHARDED = len(SHARDS) > 1
+
+
+def user_db(user_id: int) -> str:
+    """Файл шарда, где живут юзер и все его строки."""
+    return SHARDS[shard_index(user_id, len(SHARDS))]
+
+
 CREATE_REFERRALS_TABLE = """
 CREATE TABLE IF NOT EXISTS referrals (
     inviter_id INTEGER,
@@ -35,6 +125,12 @@ CREATE TABLE IF NOT EXISTS referrals (
 );
 """
 
+# Приглашённого можно привести только один раз
+CREATE_REFERRALS_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_referrals_inviter ON referrals (inviter_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_invited ON referrals (invited_id);
+"""
+
 CREATE_PANDA_PURCHASES_TABLE = """
 CREATE TABLE IF NOT EXISTS panda_purchases (
     user_id INTEGER,
@@ -59,103 +155,935 @@ CREATE TABLE IF NOT EXISTS star_purchases (
     payload TEXT,
     amount INTEGER,
     product_id TEXT,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    charge_id TEXT
+);
+"""
+
+# Ключ идемпотентности: telegram_payment_charge_id или ключ клиента.
+# NULL не участвует в уникальности — старые строки без ключа не мешают.
+CREATE_STAR_PURCHASES_CHARGE_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_star_purchases_charge ON star_purchases (charge_id);
+"""
+
+# Один активный бустер каждого вида на юзера; повторная покупка продлевает его.
+# AUTOINCREMENT: id не переиспользуются, по нему реестр подтягивает новые строки.
+CREATE_USER_BOOSTERS_TABLE = """
+CREATE TABLE IF NOT EXISTS user_boosters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    multiplier INTEGER NOT NULL,
+    expires_at INTEGER NOT NULL,
+    UNIQUE (user_id, kind)
 );
 """
 
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(CREATE_USERS_TABLE)
-        await db.execute(CREATE_COURSE_PROGRESS_TABLE)
-        await db.execute(CREATE_REFERRALS_TABLE)
-        await db.execute(CREATE_PANDA_PURCHASES_TABLE)
-        await db.execute(CREATE_USER_ACHIEVEMENTS_TABLE)
-        await db.execute(CREATE_STAR_PURCHASES_TABLE)
-        await db.commit()
+async def _ensure_column(db, table: str, column: str, ddl: str) -> bool:
+    """Добавляет колонку в существующую таблицу. True, если колонки не было."""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if column in columns:
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+async def init_db(paths: Optional[List[str]] = None):
+    """Создаёт и мигрирует схему в каждом файле раскладки (по умолчанию — в текущей)."""
+    for path in paths or SHARDS:
+        async with write_conn(path) as db:
+            await db.execute(CREATE_USERS_TABLE)
+            if await _ensure_column(db, "users", "rating_score", "REAL DEFAULT 0"):
+                await db.execute(f"UPDATE users SET rating_score = {RATING_SCORE_SQL}")
+            if await _ensure_column(db, "users", "last_accrued_at", "INTEGER DEFAULT 0"):
+                # старым юзерам доход начинает капать с момента миграции
+                await db.execute("UPDATE users SET last_accrued_at = ?", (int(time.time()),))
+            await _ensure_column(db, "users", "income_units", "INTEGER DEFAULT 0")
+            await _ensure_column(db, "users", "version", "INTEGER NOT NULL DEFAULT 0")
+            await db.execute(CREATE_USERS_VERSION_TRIGGER)
+            await db.execute(CREATE_USERS_RATING_INDEX)
+            await db.execute(CREATE_USERS_TOTAL_TABLE)
+            # начальное значение и триггеры — в одной транзакции: вставки других
+            # процессов не проскочат между ними
+            await db.execute(
+                "INSERT OR IGNORE INTO users_total (id, n) SELECT 0, COUNT(*) FROM users"
+            )
+            for trigger in CREATE_USERS_TOTAL_TRIGGERS:
+                await db.execute(trigger)
+            await db.execute(CREATE_COURSE_PROGRESS_TABLE)
+            if BITMAP_PROGRESS:
+                await db.execute(CREATE_COURSE_PROGRESS_BITS_TABLE)
+                await _migrate_course_progress_to_bitmap(db)
+            await db.execute(CREATE_REFERRALS_TABLE)
+            # дубли приглашённых из старых версий мешают уникальному индексу — оставляем первый
+            await db.execute(
+                "DELETE FROM referrals WHERE rowid NOT IN "
+                "(SELECT MIN(rowid) FROM referrals GROUP BY invited_id)"
+            )
+            await db.executescript(CREATE_REFERRALS_INDEXES)
+            if await _ensure_column(db, "users", "referrals_count", "INTEGER DEFAULT 0"):
+                await db.execute(
+                    "UPDATE users SET referrals_count = "
+                    "(SELECT COUNT(*) FROM referrals r WHERE r.inviter_id = users.user_id)"
+                )
+            await db.execute(CREATE_PANDA_PURCHASES_TABLE)
+            await db.execute(CREATE_USER_ACHIEVEMENTS_TABLE)
+            await db.execute(CREATE_STAR_PURCHASES_TABLE)
+            await _ensure_column(db, "star_purchases", "charge_id", "TEXT")
+            await db.execute(CREATE_STAR_PURCHASES_CHARGE_INDEX)
+            await db.execute(CREATE_USER_BOOSTERS_TABLE)
+            await db.commit()
+
+
+UPDATE_USER_SQL = (
+    "UPDATE users SET coins=?, xp=?, hourly_income=?, level=?, rank_name=?, rating_score=?, "
+    "last_accrued_at=?, income_units=?, version = version + 1 WHERE user_id=?"
+)
+
+
+def _update_user_params(user: User) -> tuple:
+    return (
+        user.coins,
+        user.xp,
+        user.hourly_income,
+        user.level,
+        user.rank_name,
+        rating_score(user),
+        user.last_accrued_at,
+        user.income_units,
+        user.user_id,
+    )
+
+
+INSERT_USER_SQL = (
+    # OR IGNORE: между чтением и записью юзера мог создать параллельный запрос
+    "INSERT OR IGNORE INTO users "
+    "(user_id, username, coins, xp, hourly_income, level, rank_name, rating_score, "
+    "last_accrued_at, income_units) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+# ===== Записи через единственного писателя (app.writer) =====
+# Все записи — типизированные Mutation: в режиме actor/unix они копятся
+# и коммитятся пачкой, каждая в своём SAVEPOINT. Транзакции с чтением внутри
+# (apply_purchase, credit_referrals) — тоже Mutation с immediate = True.
+# Своё соединение на запись открывает только init_db (схема при старте).
+
+@mutation("create_user")
+@dataclass
+class CreateUser(Mutation):
+    user: User
+
+    async def apply(self, db):
+        u = self.user
+        await db.execute(
+            INSERT_USER_SQL,
+            (u.user_id, u.username, u.coins, u.xp, u.hourly_income, u.level, u.rank_name,
+             rating_score(u), u.last_accrued_at, u.income_units),
+        )
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(User(**args["user"]))
+
+
+@mutation("update_user")
+@dataclass
+class UpdateUser(Mutation):
+    user: User
+
+    async def apply(self, db) -> Optional[int]:
+        cursor = await db.execute(UPDATE_USER_SQL + " RETURNING version", _update_user_params(self.user))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(User(**args["user"]))
+
+
+async def _row_versions(db, user_ids: List[int]) -> Dict[int, int]:
+    versions: Dict[int, int] = {}
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        cursor = await db.execute(
+            f"SELECT user_id, version FROM users WHERE user_id IN ({marks})", chunk
+        )
+        versions.update(await cursor.fetchall())
+    return versions
+
+
+async def _add_to_user(db, user_id: int, coins: int, xp: int, hourly_income: int):
+    """Прибавляет изменения кэша к строке, которую успели поменять мимо него."""
+    cursor = await db.execute(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ?", (user_id,))
+    user = User(*await cursor.fetchone())
+    user.coins += coins
+    user.xp += xp
+    user.hourly_income += hourly_income
+    user.level = level_from_xp(user.xp)
+    user.rank_name = rank_name_from_level(user.level)
+    # last_accrued_at и income_units — из строки: доход с них досчитает следующее чтение
+    await db.execute(UPDATE_USER_SQL, _update_user_params(user))
+
+
+@mutation("update_users")
+@dataclass
+class UpdateUsers(Mutation):
+    """
+    Flush write-behind кэша: versions — версии строк, от которых посчитаны users,
+    deltas — (coins, xp, hourly_income), изменённые с тех пор. Строка той же версии
+    пишется целиком, изменённая мимо кэша — получает только delta.
+    Возвращает user_id вторых.
+    """
+    users: List[User]
+    versions: List[int]
+    deltas: List[Tuple[int, int, int]]
+
+    async def apply(self, db) -> List[int]:
+        current = await _row_versions(db, [u.user_id for u in self.users])
+        same: List[User] = []
+        merged: List[int] = []
+        for user, version, delta in zip(self.users, self.versions, self.deltas):
+            if user.user_id not in current:
+                continue
+            if current[user.user_id] == version:
+                same.append(user)
+            else:
+                await _add_to_user(db, user.user_id, *delta)
+                merged.append(user.user_id)
+        await db.executemany(UPDATE_USER_SQL, [_update_user_params(u) for u in same])
+        return merged
+
+    @classmethod
+    def from_args(cls, args):
+        return cls([User(**u) for u in args["users"]], args["versions"], args["deltas"])
+
+
+@mutation("set_username")
+@dataclass
+class SetUsername(Mutation):
+    user_id: int
+    username: Optional[str]
+
+    async def apply(self, db):
+        await db.execute("UPDATE users SET username=? WHERE user_id=?", (self.username, self.user_id))
+
+
+@mutation("add_panda_purchase")
+@dataclass
+class AddPandaPurchase(Mutation):
+    user_id: int
+    panda_id: str
+
+    async def apply(self, db) -> bool:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO panda_purchases (user_id, panda_id) VALUES (?, ?)",
+            (self.user_id, self.panda_id),
+        )
+        return cursor.rowcount > 0
+
+
+@mutation("mark_step_completed")
+@dataclass
+class MarkStepCompleted(Mutation):
+    user_id: int
+    step_id: str
+
+    async def apply(self, db):
+        if BITMAP_PROGRESS:
+            bit = _step_bits().get(self.step_id)
+            if bit is None:
+                raise ValueError(f"Unknown step: {self.step_id}")
+            # OR прямо в SQL: без чтения-изменения-записи
+            await db.execute(
+                "INSERT INTO course_progress_bits (user_id, bits) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET bits = bits | excluded.bits",
+                (self.user_id, 1 << bit),
+            )
+            return
+        await db.execute(
+            "INSERT OR REPLACE INTO course_progress (user_id, step_id, is_completed) "
+            "VALUES (?, ?, 1)",
+            (self.user_id, self.step_id),
+        )
+
+
+async def _existing_users(db, user_ids: List[int]) -> Set[int]:
+    marks = ",".join("?" * len(user_ids))
+    cursor = await db.execute(f"SELECT user_id FROM users WHERE user_id IN ({marks})", user_ids)
+    return {row[0] for row in await cursor.fetchall()}
+
+
+async def _link_referral(db, inviter_id: int, invited_id: int) -> bool:
+    """Строка referrals и referred_by приглашённого (его шард). False — уже приглашён."""
+    cursor = await db.execute(
+        "INSERT OR IGNORE INTO referrals (inviter_id, invited_id) VALUES (?, ?)",
+        (inviter_id, invited_id),
+    )
+    if cursor.rowcount == 0:
+        return False
+    await db.execute(
+        "UPDATE users SET referred_by = ? WHERE user_id = ? AND referred_by IS NULL",
+        (inviter_id, invited_id),
+    )
+    return True
+
+
+@mutation("add_referral")
+@dataclass
+class AddReferral(Mutation):
+    """Реферал без награды (награда — credit_referrals), оба юзера в одном шарде."""
+    inviter_id: int
+    invited_id: int
+
+    async def apply(self, db) -> bool:
+        if self.inviter_id == self.invited_id:
+            return False
+        # пригласившего нет в базе — как и в credit_referrals, не засчитываем
+        if not await _existing_users(db, [self.inviter_id]):
+            return False
+        if not await _link_referral(db, self.inviter_id, self.invited_id):
+            return False
+        await db.execute(
+            "UPDATE users SET referrals_count = referrals_count + 1 WHERE user_id = ?",
+            (self.inviter_id,),
+        )
+        return True
+
+
+@mutation("link_referral")
+@dataclass
+class LinkReferral(Mutation):
+    """Половина add_referral в шарде приглашённого."""
+    inviter_id: int
+    invited_id: int
+
+    async def apply(self, db) -> bool:
+        return await _link_referral(db, self.inviter_id, self.invited_id)
+
+
+@mutation("add_referrals_count")
+@dataclass
+class AddReferralsCount(Mutation):
+    """Половина add_referral в шарде пригласившего: маршрутизированный +N к счётчику."""
+    user_id: int
+    count: int
+
+    async def apply(self, db):
+        await db.execute(
+            "UPDATE users SET referrals_count = referrals_count + ? WHERE user_id = ?",
+            (self.count, self.user_id),
+        )
+
+
+# Писатель на каждый файл шарда; в режиме unix — свой сокет на шард (writer.main слушает все)
+db_writers = {
+    path: create_writer(DB_WRITER, socket_path, DB_WRITER_MAX_BATCH, path)
+    for path, socket_path in zip(SHARDS, shard_paths(DB_WRITER_SOCKET, len(SHARDS)))
+}
+
+
+def _writer(user_id: int):
+    return db_writers[user_db(user_id)]
+
+
+async def stop_writers():
+    for writer in db_writers.values():
+        await writer.stop()
+
+
+def _by_shard(user_ids: Iterable[int]) -> Dict[str, List[int]]:
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for user_id in user_ids:
+        groups[user_db(user_id)].append(user_id)
+    return groups
+
+
+async def _flush_users(path: str, batch: List[Pending]) -> List[int]:
+    return await db_writers[path].submit(
+        UpdateUsers([p.user for p in batch], [p.version for p in batch], [p.delta for p in batch])
+    )
+
+
+# Включается в lifespan API (user_cache.start()); без этого update_user пишет сразу
+user_cache = UserCache(
+    USER_CACHE_SIZE,
+    USER_CACHE_FLUSH_INTERVAL,
+    flush=_flush_users,
+    group=user_db,
+    ttl=USER_CACHE_TTL,
+)
+
+
+async def _load_shard_boosters(
+    path: str, after_id: int, now: int
+) -> List[Tuple[int, int, str, int, int]]:
+    async with read_conn(path) as db:
+        cursor = await db.execute(
+            "SELECT id, user_id, kind, multiplier, expires_at FROM user_boosters "
+            "WHERE id > ? AND expires_at > ? ORDER BY id",
+            (after_id, now),
+        )
+        return await cursor.fetchall()
+
+
+# id строк user_boosters в разных шардах несравнимы: отметка, докуда прочитан
+# каждый шард, хранится здесь, а реестру отдаются сквозные номера
+_booster_marks: Dict[str, int] = {}
+_booster_seq = 0
+
+
+async def load_boosters(after_id: int, now: int) -> List[Tuple[int, int, str, int, int]]:
+    if not SHARDED:
+        return await _load_shard_boosters(SHARDS[0], after_id, now)
+
+    global _booster_seq
+    if after_id == 0:
+        # реестр загружается с нуля
+        _booster_marks.clear()
+    rows = []
+    for path in SHARDS:
+        for row in await _load_shard_boosters(path, _booster_marks.get(path, 0), now):
+            _booster_marks[path] = row[0]
+            _booster_seq += 1
+            rows.append((_booster_seq, *row[1:]))
+    return rows
+
+
+async def _extend_booster(db, user_id: int, kind: str, multiplier: int, seconds: int) -> int:
+    """
+    Активирует бустер внутри транзакции покупки. Такой же действующий бустер
+    продлевается, другой множитель — перезапускается с текущего момента.
+    Возвращает expires_at.
+    """
+    now = int(time.time())
+    cursor = await db.execute(
+        "SELECT multiplier, expires_at FROM user_boosters WHERE user_id = ? AND kind = ?",
+        (user_id, kind),
+    )
+    row = await cursor.fetchone()
+    start = now
+    if row is not None and row[0] == multiplier and row[1] > now:
+        start = row[1]
+    expires_at = start + seconds
+    # REPLACE выдаёт строке новый id — реестры других процессов её увидят
+    await db.execute(
+        "INSERT OR REPLACE INTO user_boosters (user_id, kind, multiplier, expires_at) "
+        "VALUES (?, ?, ?, ?)",
+        (user_id, kind, multiplier, expires_at),
+    )
+    return expires_at
+
+
+async def _coins_boost(db, user_id: int) -> Optional[Tuple[int, int]]:
+    """
+    (multiplier, expires_at) бустера монет юзера внутри транзакции. Истёкший тоже:
+    доход за окно до expires_at ещё мог быть не начислен.
+    """
+    cursor = await db.execute(
+        "SELECT multiplier, expires_at FROM user_boosters WHERE user_id = ? AND kind = ?",
+        (user_id, COINS_BOOSTER),
+    )
+    return await cursor.fetchone()
 
 
 async def get_user(user_id: int, username: Optional[str] = None) -> User:
-    async with aiosqlite.connect(DB_PATH) as db:
+    if user_cache.enabled:
+        user = user_cache.get(user_id)
+        if user is not None:
+            accrue(user)
+            return user
+
+    async with read_conn(user_db(user_id)) as db:
         cursor = await db.execute(
-            "SELECT user_id, username, coins, xp, hourly_income, level, rank_name, referred_by "
-            "FROM users WHERE user_id = ?",
+            f"SELECT {USER_COLUMNS}, version FROM users WHERE user_id = ?",
             (user_id,),
         )
         row = await cursor.fetchone()
-        if row:
-            return User(*row)
+    if row:
+        user = User(*row[:-1])
+        if user_cache.enabled:
+            user_cache.put(user, row[-1])
+        # доход считается на лету; в БД попадёт со следующим update_user
+        accrue(user)
+        return user
 
-        level = 1
-        rank_name = rank_name_from_level(level)
-        hourly_income = 10
-        await db.execute(
-            "INSERT INTO users (user_id, username, coins, xp, hourly_income, level, rank_name) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (user_id, username, 0, 0, hourly_income, level, rank_name),
+    level = 1
+    user = User(
+        user_id=user_id,
+        username=username,
+        coins=0,
+        xp=0,
+        hourly_income=10,
+        level=level,
+        rank_name=rank_name_from_level(level),
+        referred_by=None,
+        last_accrued_at=int(time.time()),
+    )
+    await _writer(user_id).submit(CreateUser(user))
+    if user_cache.enabled:
+        user_cache.put(user, 0)
+    return user
+
+
+async def update_user(user: User, durable: bool = False):
+    """
+    При включённом кэше изменение копится в памяти и уходит в БД пачкой.
+    durable=True — записать и закоммитить сразу (покупки).
+    """
+    if user_cache.enabled:
+        cached = user_cache.peek(user.user_id)
+        if cached is not None:
+            # user — это cached после начисления дохода и изменений запроса;
+            # в delta — только изменения: доход досчитывается по строке БД
+            accrue(cached, now=user.last_accrued_at)
+            delta = (
+                user.coins - cached.coins,
+                user.xp - cached.xp,
+                user.hourly_income - cached.hourly_income,
+            )
+            if user_cache.update(user, delta):
+                if durable:
+                    await user_cache.flush([user.user_id])
+                return
+
+    version = await _writer(user.user_id).submit(UpdateUser(user))
+    if user_cache.enabled and version is not None:
+        user_cache.put(user, version)
+
+
+async def set_username(user_id: int, username: Optional[str]):
+    await _writer(user_id).submit(SetUsername(user_id, username))
+    if user_cache.enabled:
+        user_cache.patch(user_id, username=username)
+
+
+@mutation("apply_purchase")
+@dataclass
+class ApplyPurchase(Mutation):
+    """
+    Транзакция apply_purchase на писателе шарда. Доход до покупки досчитывается
+    по бустеру монет из user_boosters той же транзакции, а не по реестру
+    вызывающего: реестр может быть не запущен (бот) или ещё не видеть бустер.
+    Возвращает {"user", "version", "expires_at"} или None — charge_id уже записан.
+    """
+    immediate = True
+    durable = True
+
+    user_id: int
+    price: int = 0
+    panda_id: Optional[str] = None
+    coins: int = 0
+    xp: int = 0
+    income_bonus: int = 0
+    ignore_owned: bool = False
+    star_purchase: Optional[Tuple[str, int, str, Optional[str]]] = None
+    booster: Optional[Tuple[str, int, int]] = None
+
+    async def apply(self, db) -> Optional[Dict[str, Any]]:
+        if self.star_purchase is not None:
+            # ledger первым: повторная доставка платежа ничего не начислит
+            if not await _add_star_purchase(db, self.user_id, *self.star_purchase):
+                return None
+
+        cursor = await db.execute(
+            f"SELECT {USER_COLUMNS}, version FROM users WHERE user_id = ?",
+            (self.user_id,),
         )
-        await db.commit()
-        return User(
-            user_id=user_id,
-            username=username,
-            coins=0,
-            xp=0,
-            hourly_income=hourly_income,
-            level=level,
-            rank_name=rank_name,
-            referred_by=None,
+        row = await cursor.fetchone()
+        if row is None:
+            raise ValueError("User not found")
+        user, version = User(*row[:-1]), row[-1] + 1
+        boost = await _coins_boost(db, self.user_id)
+        if boost is None:
+            earned = accrue_income(user)
+        else:
+            earned = accrue_income(user, multiplier=boost[0], boost_until=boost[1])
+
+        income_bonus = self.income_bonus
+        if self.panda_id is not None:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO panda_purchases (user_id, panda_id) VALUES (?, ?)",
+                (self.user_id, self.panda_id),
+            )
+            if cursor.rowcount == 0:
+                if not self.ignore_owned:
+                    raise ValueError("Panda already purchased")
+                income_bonus = 0
+
+        if user.coins < self.price:
+            raise ValueError("Not enough coins")
+
+        user.coins += self.coins - self.price
+        user.xp += self.xp
+        user.hourly_income += income_bonus
+        user.level = level_from_xp(user.xp)
+        user.rank_name = rank_name_from_level(user.level)
+
+        cursor = await db.execute(
+            "UPDATE users SET coins = coins + ?, xp = xp + ?, hourly_income = hourly_income + ?, "
+            "level = ?, rank_name = ?, rating_score = ?, last_accrued_at = ?, income_units = ?, "
+            "version = version + 1 WHERE user_id = ? AND coins + ? >= ?",
+            (
+                earned + self.coins - self.price,
+                self.xp,
+                income_bonus,
+                user.level,
+                user.rank_name,
+                rating_score(user),
+                user.last_accrued_at,
+                user.income_units,
+                self.user_id,
+                earned,
+                self.price,
+            ),
         )
+        if cursor.rowcount == 0:
+            raise ValueError("Not enough coins")
 
+        expires_at = None
+        if self.booster is not None:
+            expires_at = await _extend_booster(db, self.user_id, *self.booster)
+        return {"user": asdict(user), "version": version, "expires_at": expires_at}
 
-async def update_user(user: User):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET coins=?, xp=?, hourly_income=?, level=?, rank_name=? WHERE user_id=?",
-            (user.coins, user.xp, user.hourly_income, user.level, user.rank_name, user.user_id),
+
+async def apply_purchase(
+    user_id: int,
+    price: int = 0,
+    panda_id: Optional[str] = None,
+    coins: int = 0,
+    xp: int = 0,
+    income_bonus: int = 0,
+    ignore_owned: bool = False,
+    star_purchase: Optional[Tuple[str, int, str, Optional[str]]] = None,
+    booster: Optional[Tuple[str, int, int]] = None,
+) -> User:
+    """
+    Атомарная покупка: списание, выдача и запись панды — одна транзакция
+    BEGIN IMMEDIATE и один commit.
+
+    - price списывается условным UPDATE ... WHERE coins >= price,
+      поэтому два параллельных тапа не уйдут в минус;
+    - panda_id пишется в panda_purchases; если панда уже есть —
+      ValueError, либо (ignore_owned=True) покупка проходит без неё;
+    - coins / xp / income_bonus — начисления;
+    - star_purchase = (payload, amount, product_id, charge_id) — запись
+      в star_purchases в той же транзакции; повтор charge_id — DuplicatePurchase
+      без каких-либо начислений;
+    - booster = (kind, multiplier, seconds) — активация таймерного бустера;
+      доход до этого момента начисляется по старой ставке.
+
+    Возвращает обновлённого юзера. Ошибки — ValueError, как в shop.buy_panda.
+    """
+    if user_cache.enabled:
+        # несброшенные изменения из write-behind кэша — своим commit'ом до покупки:
+        # откат неудачной покупки не должен их терять
+        await user_cache.flush([user_id])
+    result = await _writer(user_id).submit(
+        ApplyPurchase(
+            user_id,
+            price,
+            panda_id,
+            coins,
+            xp,
+            income_bonus,
+            ignore_owned,
+            star_purchase,
+            booster,
         )
-        await db.commit()
+    )
+    if result is None:
+        raise DuplicatePurchase(star_purchase[3])
+    user = User(**result["user"])
 
+    if booster is not None and boosters.enabled:
+        kind, multiplier, _ = booster
+        boosters.add(user_id, kind, multiplier, result["expires_at"])
+    if user_cache.enabled:
+        user_cache.put(user, result["version"])
+    return user
 
-async def set_user_referred_by(user_id: int, inviter_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+
+@mutation("set_referred_by")
+@dataclass
+class SetReferredBy(Mutation):
+    user_id: int
+    inviter_id: int
+
+    async def apply(self, db):
         await db.execute(
             "UPDATE users SET referred_by=? WHERE user_id=?",
-            (inviter_id, user_id),
+            (self.inviter_id, self.user_id),
         )
-        await db.commit()
 
 
-async def add_referral(inviter_id: int, invited_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+async def set_user_referred_by(user_id: int, inviter_id: int):
+    await _writer(user_id).submit(SetReferredBy(user_id, inviter_id))
+
+
+async def _reward_inviters(
+    db, added: List[Tuple[int, int]], coins: int, xp: int
+) -> List[Tuple[Dict[str, Any], int, int]]:
+    """
+    Награда coins / xp за каждого нового реферала и +N к referrals_count (шард пригласившего).
+    Возвращает (юзер, версия строки, referrals_count) награждённых — для кэша и ачивок.
+    Доход не начисляется: сервис записи не видит бустеров, его досчитает следующее чтение.
+    """
+    rewarded = []
+    for inviter_id, count in added:
+        cursor = await db.execute(
+            f"SELECT {USER_COLUMNS}, version, referrals_count FROM users WHERE user_id = ?",
+            (inviter_id,),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            continue
+
+        user = User(*row[:-2])
+        user.coins += coins * count
+        user.xp += xp * count
+        user.level = level_from_xp(user.xp)
+        user.rank_name = rank_name_from_level(user.level)
         await db.execute(
-            "INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?)",
-            (inviter_id, invited_id),
+            "UPDATE users SET coins = coins + ?, xp = xp + ?, level=?, rank_name=?, rating_score=?, "
+            "version = version + 1, referrals_count = referrals_count + ? WHERE user_id=?",
+            (
+                coins * count,
+                xp * count,
+                user.level,
+                user.rank_name,
+                rating_score(user),
+                count,
+                inviter_id,
+            ),
+        )
+        rewarded.append((asdict(user), row[-2] + 1, row[-1] + count))
+    return rewarded
+
+
+async def _link_referrals(db, pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """[(inviter_id, сколько из pairs засчитано)]."""
+    added: Dict[int, int] = defaultdict(int)
+    for inviter_id, invited_id in pairs:
+        if await _link_referral(db, inviter_id, invited_id):
+            added[inviter_id] += 1
+    return list(added.items())
+
+
+@mutation("credit_referrals")
+@dataclass
+class CreditReferrals(Mutation):
+    """credit_referrals без шардирования: связи, награды и счётчики одной транзакцией."""
+    immediate = True
+
+    pairs: List[Tuple[int, int]]
+    coins: int
+    xp: int
+
+    async def apply(self, db):
+        alive = await _existing_users(db, list({inviter_id for inviter_id, _ in self.pairs}))
+        added = await _link_referrals(db, [(i, v) for i, v in self.pairs if i in alive])
+        return await _reward_inviters(db, added, self.coins, self.xp)
+
+
+@mutation("link_referrals")
+@dataclass
+class LinkReferrals(Mutation):
+    """Шаг 2 шардированного credit_referrals: связи в шарде приглашённых."""
+    pairs: List[Tuple[int, int]]
+
+    async def apply(self, db):
+        return await _link_referrals(db, self.pairs)
+
+
+@mutation("reward_inviters")
+@dataclass
+class RewardInviters(Mutation):
+    """Шаг 3 шардированного credit_referrals: награды в шарде пригласивших."""
+    immediate = True
+
+    added: List[Tuple[int, int]]
+    coins: int
+    xp: int
+
+    async def apply(self, db):
+        return await _reward_inviters(db, self.added, self.coins, self.xp)
+
+
+async def _credit_routed(
+    pairs: List[Tuple[int, int]], coins: int, xp: int
+) -> List[Tuple[Dict[str, Any], int, int]]:
+    """
+    Шардированный режим, по транзакции на шаг и шард:
+    1) какие пригласившие существуют — чтение в их шардах;
+    2) строки referrals и referred_by — в шарде приглашённого (там же уникальность);
+    3) награда и +N к referrals_count — в шарде пригласившего.
+    Между 2 и 3 атомарности нет: если процесс упадёт, реферал останется записанным
+    без награды, а повтор его уже не засчитает.
+    """
+    alive: Set[int] = set()
+    for path, ids in _by_shard({inviter_id for inviter_id, _ in pairs}).items():
+        async with read_conn(path) as db:
+            alive |= await _existing_users(db, ids)
+
+    links: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    for inviter_id, invited_id in pairs:
+        if inviter_id in alive:
+            links[user_db(invited_id)].append((inviter_id, invited_id))
+    added: Dict[int, int] = defaultdict(int)
+    for shard_added in await asyncio.gather(
+        *(db_writers[path].submit(LinkReferrals(shard_pairs)) for path, shard_pairs in links.items())
+    ):
+        for inviter_id, count in shard_added:
+            added[inviter_id] += count
+
+    rewarded = []
+    for shard_rewarded in await asyncio.gather(
+        *(
+            db_writers[path].submit(RewardInviters([(i, added[i]) for i in ids], coins, xp))
+            for path, ids in _by_shard(added).items()
         )
-        await db.commit()
+    ):
+        rewarded.extend(shard_rewarded)
+    return rewarded
+
+
+async def credit_referrals(
+    pairs: Iterable[Tuple[int, int]],
+    coins: int = 0,
+    xp: int = 0,
+) -> Dict[int, int]:
+    """
+    Записывает пачку рефералов (inviter_id, invited_id): строка в referrals,
+    referred_by приглашённого, +1 к users.referrals_count и награда coins / xp
+    пригласившему за каждого нового реферала. Без шардирования — одной транзакцией.
+
+    Повтор приглашённого (уникальный индекс) и приглашения от несуществующих
+    юзеров пропускаются. Возвращает {inviter_id: referrals_count после записи}
+    только для тех, кому что-то засчитано.
+    """
+    pairs = [(i, v) for i, v in pairs if i != v]
+    if not pairs:
+        return {}
+
+    if user_cache.enabled:
+        # как в apply_purchase: награда читает строки пригласивших из БД
+        await user_cache.flush({inviter_id for inviter_id, _ in pairs})
+    if SHARDED:
+        rewarded = await _credit_routed(pairs, coins, xp)
+    else:
+        rewarded = await db_writers[SHARDS[0]].submit(CreditReferrals(pairs, coins, xp))
+
+    counts: Dict[int, int] = {}
+    for user_fields, version, count in rewarded:
+        user = User(**user_fields)
+        counts[user.user_id] = count
+        if user_cache.enabled:
+            user_cache.put(user, version)
+    return counts
+
+
+async def add_referral(inviter_id: int, invited_id: int) -> bool:
+    """Один реферал без награды. True, если он засчитан."""
+    inviter_db, invited_db = user_db(inviter_id), user_db(invited_id)
+    if inviter_db == invited_db:
+        return await db_writers[inviter_db].submit(AddReferral(inviter_id, invited_id))
+
+    # разные шарды: проверка пригласившего, связь — у приглашённого, +1 — у пригласившего
+    async with read_conn(inviter_db) as db:
+        if not await _existing_users(db, [inviter_id]):
+            return False
+    if not await db_writers[invited_db].submit(LinkReferral(inviter_id, invited_id)):
+        return False
+    await db_writers[inviter_db].submit(AddReferralsCount(inviter_id, 1))
+    return True
 
 
 async def get_referrals_count(inviter_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with read_conn(user_db(inviter_id)) as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM referrals WHERE inviter_id=?",
+            "SELECT referrals_count FROM users WHERE user_id=?",
             (inviter_id,),
         )
         row = await cursor.fetchone()
-        return row[0] if row else 0
+        return (row[0] or 0) if row else 0
 
 
-async def mark_step_completed(user_id: int, step_id: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR REPLACE INTO course_progress (user_id, step_id, is_completed) "
-            "VALUES (?, ?, 1)",
-            (user_id, step_id),
+def _step_bits() -> Dict[str, int]:
+    # импорт внутри, чтобы не зациклить: app.course сам импортирует db
+    from .course import STEP_BITS
+    return STEP_BITS
+
+
+def _bits_to_step_ids(bits: int) -> List[str]:
+    from .course import STEP_BIT_IDS
+    return [step_id for i, step_id in enumerate(STEP_BIT_IDS) if bits >> i & 1]
+
+
+async def _migrate_course_progress_to_bitmap(db):
+    """
+    Переносит строки course_progress в course_progress_bits, если bitmap ещё пуст.
+    Старая таблица не удаляется — её можно дропнуть руками после проверки.
+    """
+    cursor = await db.execute("SELECT 1 FROM course_progress_bits LIMIT 1")
+    if await cursor.fetchone():
+        return
+
+    step_bits = _step_bits()
+    per_user: Dict[int, int] = {}
+    cursor = await db.execute(
+        "SELECT user_id, step_id FROM course_progress WHERE is_completed=1"
+    )
+    async for user_id, step_id in cursor:
+        bit = step_bits.get(step_id)
+        if bit is not None:
+            per_user[user_id] = per_user.get(user_id, 0) | (1 << bit)
+
+    await db.executemany(
+        "INSERT INTO course_progress_bits (user_id, bits) VALUES (?, ?)",
+        list(per_user.items()),
+    )
+
+
+async def _fetch_completed_steps(db, user_id: int) -> List[str]:
+    if BITMAP_PROGRESS:
+        cursor = await db.execute(
+            "SELECT bits FROM course_progress_bits WHERE user_id=?",
+            (user_id,),
         )
-        await db.commit()
+        row = await cursor.fetchone()
+        return _bits_to_step_ids(row[0]) if row else []
+
+    cursor = await db.execute(
+        "SELECT step_id FROM course_progress WHERE user_id=? AND is_completed=1",
+        (user_id,),
+    )
+    return [r[0] for r in await cursor.fetchall()]
+
+
+async def mark_step_completed(user_id: int, step_id: str):
+    if BITMAP_PROGRESS and step_id not in _step_bits():
+        raise ValueError(f"Unknown step: {step_id}")
+    await _writer(user_id).submit(MarkStepCompleted(user_id, step_id))
 
 
 async def is_step_completed(user_id: int, step_id: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    if BITMAP_PROGRESS:
+        bit = _step_bits().get(step_id)
+        if bit is None:
+            return False
+        async with read_conn(user_db(user_id)) as db:
+            cursor = await db.execute(
+                "SELECT bits FROM course_progress_bits WHERE user_id=?",
+                (user_id,),
+            )
+            row = await cursor.fetchone()
+        return bool(row and row[0] >> bit & 1)
+
+    async with read_conn(user_db(user_id)) as db:
         cursor = await db.execute(
             "SELECT is_completed FROM course_progress WHERE user_id=? AND step_id=?",
             (user_id, step_id),
@@ -165,35 +1093,153 @@ async def is_step_completed(user_id: int, step_id: str) -> bool:
 
 
 async def get_completed_steps(user_id: int) -> List[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with read_conn(user_db(user_id)) as db:
+        return await _fetch_completed_steps(db, user_id)
+
+
+async def count_completed_steps(user_id: int) -> int:
+    async with read_conn(user_db(user_id)) as db:
+        if BITMAP_PROGRESS:
+            cursor = await db.execute(
+                "SELECT bits FROM course_progress_bits WHERE user_id=?",
+                (user_id,),
+            )
+            row = await cursor.fetchone()
+            # popcount вместо COUNT(*) по строкам
+            return row[0].bit_count() if row else 0
+
         cursor = await db.execute(
-            "SELECT step_id FROM course_progress WHERE user_id=? AND is_completed=1",
+            "SELECT COUNT(*) FROM course_progress WHERE user_id=? AND is_completed=1",
             (user_id,),
         )
-        rows = await cursor.fetchall()
-        return [r[0] for r in rows]
+        return (await cursor.fetchone())[0]
+
+
+async def _each_shard(query: str, params: tuple = ()) -> List[List[tuple]]:
+    """Один и тот же запрос во всех шардах параллельно: строки по шардам."""
+
+    async def fetch(path: str) -> List[tuple]:
+        async with read_conn(path) as db:
+            cursor = await db.execute(query, params)
+            return await cursor.fetchall()
+
+    return await asyncio.gather(*(fetch(path) for path in SHARDS))
 
 
 async def get_all_users() -> List[User]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    per_shard = await _each_shard(f"SELECT {USER_COLUMNS} FROM users")
+    return [User(*row) for rows in per_shard for row in rows]
+
+
+async def get_top_users(limit: int) -> List[User]:
+    """
+    Топ по рейтингу: в каждом шарде обход idx_users_rating, O(log N + limit),
+    затем слияние отсортированных топов шардов — O(limit · log шардов).
+    """
+    limit = max(limit, 0)
+    per_shard = await _each_shard(
+        f"SELECT {USER_COLUMNS}, rating_score FROM users ORDER BY rating_score DESC, user_id LIMIT ?",
+        (limit,),
+    )
+    merged = heapq.merge(*per_shard, key=lambda r: (-r[-1], r[0]))
+    return [User(*row[:-1]) for row in islice(merged, limit)]
+
+
+async def _rating_window(db, user_id: int, score: float, around: int) -> Tuple[int, int, list, list]:
+    """
+    Вклад одного шарда: сколько юзеров выше, сколько всего и до around ближайших
+    сверху и снизу (от ближнего к дальнему), с rating_score последней колонкой.
+
+    Порядок рейтинга — (rating_score DESC, user_id). "Выше меня" — это равные очки
+    с меньшим user_id, затем больше очков; каждая половина — отдельный запрос
+    с поиском по idx_users_rating (OR в одном WHERE индекс не ограничивает).
+    Окно читает O(log N + around); место — подсчёт по покрывающему индексу
+    только над юзером, всего — из users_total.
+    """
+    cursor = await db.execute(
+        "SELECT (SELECT COUNT(*) FROM users WHERE rating_score = ? AND user_id < ?)"
+        " + (SELECT COUNT(*) FROM users WHERE rating_score > ?), "
+        "(SELECT n FROM users_total)",
+        (score, user_id, score),
+    )
+    above_count, total = await cursor.fetchone()
+
+    above: list = []
+    for query, params in (
+        (
+            f"SELECT {USER_COLUMNS}, rating_score FROM users "
+            "WHERE rating_score = ? AND user_id < ? ORDER BY user_id DESC LIMIT ?",
+            (score, user_id),
+        ),
+        (
+            f"SELECT {USER_COLUMNS}, rating_score FROM users "
+            "WHERE rating_score > ? ORDER BY rating_score, user_id DESC LIMIT ?",
+            (score,),
+        ),
+    ):
+        if len(above) < around:
+            cursor = await db.execute(query, (*params, around - len(above)))
+            above += await cursor.fetchall()
+
+    below: list = []
+    for query, params in (
+        (
+            f"SELECT {USER_COLUMNS}, rating_score FROM users "
+            "WHERE rating_score = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+            (score, user_id),
+        ),
+        (
+            f"SELECT {USER_COLUMNS}, rating_score FROM users "
+            "WHERE rating_score < ? ORDER BY rating_score DESC, user_id LIMIT ?",
+            (score,),
+        ),
+    ):
+        if len(below) < around:
+            cursor = await db.execute(query, (*params, around - len(below)))
+            below += await cursor.fetchall()
+    return above_count, total, above, below
+
+
+async def get_rating_neighbourhood(user_id: int, around: int) -> Tuple[int, int, List[User]]:
+    """
+    Место юзера в рейтинге и ±around соседей.
+    Место и всего — суммы по шардам, соседи — слияние окон шардов.
+    Возвращает (rank, total, окно юзеров по порядку рейтинга).
+    """
+    own = user_db(user_id)
+    # свой шард — на одном соединении с поиском юзера
+    async with read_conn(own) as db:
         cursor = await db.execute(
-            "SELECT user_id, username, coins, xp, hourly_income, level, rank_name, referred_by FROM users"
+            f"SELECT {USER_COLUMNS}, rating_score FROM users WHERE user_id=?",
+            (user_id,),
         )
-        rows = await cursor.fetchall()
-    return [User(*row) for row in rows]
+        row = await cursor.fetchone()
+        if row is None:
+            return 0, 0, []
+        me, score = User(*row[:-1]), row[-1]
+        windows = [await _rating_window(db, user_id, score, around)]
 
+    async def other(path: str):
+        async with read_conn(path) as db:
+            return await _rating_window(db, user_id, score, around)
 
-async def add_panda_purchase(user_id: int, panda_id: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO panda_purchases (user_id, panda_id) VALUES (?, ?)",
-            (user_id, panda_id),
-        )
-        await db.commit()
+    windows += await asyncio.gather(*(other(path) for path in SHARDS if path != own))
+
+    rank = sum(w[0] for w in windows) + 1
+    total = sum(w[1] for w in windows)
+    above = heapq.merge(*(w[2] for w in windows), key=lambda r: (r[-1], -r[0]))
+    below = heapq.merge(*(w[3] for w in windows), key=lambda r: (-r[-1], r[0]))
+    above_users = [User(*r[:-1]) for r in islice(above, around)]
+    below_users = [User(*r[:-1]) for r in islice(below, around)]
+    return rank, total, above_users[::-1] + [me] + below_users
+
+
+async def add_panda_purchase(user_id: int, panda_id: str) -> bool:
+    return await _writer(user_id).submit(AddPandaPurchase(user_id, panda_id))
 
 
 async def user_has_panda(user_id: int, panda_id: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with read_conn(user_db(user_id)) as db:
         cursor = await db.execute(
             "SELECT 1 FROM panda_purchases WHERE user_id=? AND panda_id=?",
             (user_id, panda_id),
@@ -203,7 +1249,7 @@ async def user_has_panda(user_id: int, panda_id: str) -> bool:
 
 
 async def get_user_pandas(user_id: int) -> List[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with read_conn(user_db(user_id)) as db:
         cursor = await db.execute(
             "SELECT panda_id FROM panda_purchases WHERE user_id=?",
             (user_id,),
@@ -212,17 +1258,30 @@ async def get_user_pandas(user_id: int) -> List[str]:
         return [r[0] for r in rows]
 
 
-async def add_user_achievement(user_id: int, achievement_id: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+@mutation("add_user_achievements")
+@dataclass
+class AddUserAchievements(Mutation):
+    user_id: int
+    achievement_ids: List[str]
+
+    async def apply(self, db):
+        await db.executemany(
             "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
-            (user_id, achievement_id),
+            [(self.user_id, ach_id) for ach_id in self.achievement_ids],
         )
-        await db.commit()
+
+
+async def add_user_achievement(user_id: int, achievement_id: str):
+    await _writer(user_id).submit(AddUserAchievements(user_id, [achievement_id]))
+
+
+async def add_user_achievements(user_id: int, achievement_ids: List[str]):
+    """Пачка ачивок одной записью."""
+    await _writer(user_id).submit(AddUserAchievements(user_id, achievement_ids))
 
 
 async def get_user_achievements(user_id: int) -> List[str]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with read_conn(user_db(user_id)) as db:
         cursor = await db.execute(
             "SELECT achievement_id FROM user_achievements WHERE user_id=?",
             (user_id,),
@@ -231,10 +1290,91 @@ async def get_user_achievements(user_id: int) -> List[str]:
         return [r[0] for r in rows]
 
 
-async def add_star_purchase(user_id: int, payload: str, amount: int, product_id: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO star_purchases (user_id, payload, amount, product_id) VALUES (?, ?, ?, ?)",
-            (user_id, payload, amount, product_id),
+async def _add_star_purchase(
+    db,
+    user_id: int,
+    payload: str,
+    amount: int,
+    product_id: str,
+    charge_id: Optional[str] = None,
+) -> bool:
+    """False, если покупка с таким charge_id уже есть."""
+    cursor = await db.execute(
+        "INSERT OR IGNORE INTO star_purchases (user_id, payload, amount, product_id, charge_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (user_id, payload, amount, product_id, charge_id),
+    )
+    return cursor.rowcount > 0
+
+
+@mutation("add_star_purchase")
+@dataclass
+class AddStarPurchase(Mutation):
+    durable = True
+
+    user_id: int
+    payload: str
+    amount: int
+    product_id: str
+    charge_id: Optional[str] = None
+
+    async def apply(self, db) -> bool:
+        return await _add_star_purchase(
+            db, self.user_id, self.payload, self.amount, self.product_id, self.charge_id
+        )
+
+
+async def add_star_purchase(
+    user_id: int,
+    payload: str,
+    amount: int,
+    product_id: str,
+    charge_id: Optional[str] = None,
+) -> bool:
+    """Возвращает False, если покупка с таким charge_id уже есть."""
+    return await _writer(user_id).submit(
+        AddStarPurchase(user_id, payload, amount, product_id, charge_id)
+    )
+
+
+async def star_purchase_exists(charge_id: str) -> bool:
+    """charge_id платит один юзер, но по нему самому шард не узнать — спрашиваем все."""
+    per_shard = await _each_shard("SELECT 1 FROM star_purchases WHERE charge_id=?", (charge_id,))
+    return any(per_shard)
+
+
+async def get_user_snapshot(user_id: int, username: Optional[str] = None) -> UserSnapshot:
+    user = await get_user(user_id, username)
+    # все остальные чтения — на одном соединении из пула шарда
+    async with read_conn(user_db(user_id)) as db:
+        completed_steps = await _fetch_completed_steps(db, user_id)
+        cursor = await db.execute(
+            "SELECT panda_id FROM panda_purchases WHERE user_id=?",
+            (user_id,),
+        )
+        pandas = [r[0] for r in await cursor.fetchall()]
+        cursor = await db.execute(
+            "SELECT achievement_id FROM user_achievements WHERE user_id=?",
+            (user_id,),
+        )
+        achievements = [r[0] for r in await cursor.fetchall()]
+        cursor = await db.execute(
+            "SELECT referrals_count FROM users WHERE user_id=?",
+            (user_id,),
         )
-        await db.commit()
+        row = await cursor.fetchone()
+        referrals_count = (row[0] or 0) if row else 0
+
+    return UserSnapshot(
+        user=user,
+        completed_steps=completed_steps,
+        pandas=pandas,
+        achievements=achievements,
+        referrals_count=referrals_count,
+    )
+
+
+if METRICS_ENABLED:
+    # счётчики для /metrics; срабатывает до того, как другие модули
+    # импортируют функции db по имени, поэтому обёрнуты все вызовы
+    instrument_module(globals(), __name__)
@@ -0,0 +1,137 @@
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .boosters import COINS_BOOSTER, XP_BOOSTER
+from .models import User
+from .stars import PRODUCTS, Product
+from .storage import DuplicatePurchase, storage
+
+
+@dataclass
+class Fulfilment:
+    """Скомпилированный payload продукта: что выдать и что сказать юзеру."""
+    product: Product
+    message: str
+    grant: Dict[str, Any] = field(default_factory=dict)  # kwargs для storage.apply_purchase
+
+
+def _format_amount(n: int) -> str:
+    return f"{n:,}".replace(",", " ")
+
+
+def _coins(product: Product, arg: str) -> Fulfilment:
+    amount = int(arg)
+    return Fulfilment(product, f"Начислено {_format_amount(amount)} монет 🪙", {"coins": amount})
+
+
+# "xp2h1" -> бустер xp, множитель 2, на 1 час
+BOOSTER_ARG = re.compile(r"(xp|coins)(\d+)h(\d+)")
+
+BOOSTER_TITLES = {XP_BOOSTER: "XP бустер", COINS_BOOSTER: "Coin бустер"}
+
+
+def _booster(product: Product, arg: str) -> Fulfilment:
+    m = BOOSTER_ARG.fullmatch(arg)
+    if m is None:
+        raise ValueError(arg)
+    kind, multiplier, hours = m.group(1), int(m.group(2)), int(m.group(3))
+    if multiplier < 2 or hours < 1:
+        raise ValueError(arg)
+    return Fulfilment(
+        product,
+        f"{BOOSTER_TITLES[kind]} x{multiplier} активирован на {hours} ч ⚡",
+        {"booster": (kind, multiplier, hours * 3600)},
+    )
+
+
+def _panda(product: Product, arg: str) -> Fulfilment:
+    # повторная покупка за Stars не должна падать: звёзды уже списаны
+    return Fulfilment(
+        product,
+        f"Открыта {product.name_ru} ⭐",
+        {"panda_id": arg, "ignore_owned": True},
+    )
+
+
+def _season(product: Product, arg: str) -> Fulfilment:
+    return Fulfilment(product, f"{product.name_en} активирован! 🎫")
+
+
+# Тип payload (часть до двоеточия) -> разбор аргумента
+PAYLOAD_HANDLERS: Dict[str, Callable[[Product, str], Fulfilment]] = {
+    "coins": _coins,
+    "booster": _booster,
+    "panda": _panda,
+    "season": _season,
+}
+
+
+def compile_product(product: Product) -> Fulfilment:
+    kind, _, arg = product.payload.partition(":")
+    handler = PAYLOAD_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Unknown payload type for {product.id}: {product.payload}")
+    try:
+        return handler(product, arg)
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Bad payload for {product.id}: {product.payload}") from e
+
+
+def compile_products(products: Dict[str, Product]) -> Dict[str, Fulfilment]:
+    return {product_id: compile_product(p) for product_id, p in products.items()}
+
+
+# Payload'ы разбираются один раз при импорте; кривой продукт роняет старт, а не покупку
+FULFILMENTS: Dict[str, Fulfilment] = compile_products(PRODUCTS)
+
+
+# Недавно выданные charge_id: повтор от Telegram или клиента отсекается без БД.
+# Это только фильтр перед индексом star_purchases, источник истины — БД.
+RECENT_CHARGES_MAX = 10_000
+_recent_charges: "OrderedDict[str, None]" = OrderedDict()
+
+REPLAY_MESSAGE = "Эта покупка уже обработана ✅"
+
+
+def _remember_charge(charge_id: str):
+    _recent_charges[charge_id] = None
+    _recent_charges.move_to_end(charge_id)
+    if len(_recent_charges) > RECENT_CHARGES_MAX:
+        _recent_charges.popitem(last=False)
+
+
+async def fulfil(
+    user_id: int,
+    product_id: str,
+    charge_id: Optional[str] = None,
+) -> Tuple[User, str, bool]:
+    """
+    Выдаёт продукт и пишет его в star_purchases одной транзакцией.
+    С charge_id выдача идемпотентна: повтор возвращает (юзер, сообщение, True)
+    и ничего не начисляет.
+    """
+    f = FULFILMENTS.get(product_id)
+    if f is None:
+        raise ValueError("Неизвестный продукт")
+
+    if charge_id is not None:
+        if charge_id in _recent_charges or await storage.star_purchase_exists(charge_id):
+            _remember_charge(charge_id)
+            return await storage.get_user(user_id), REPLAY_MESSAGE, True
+
+    try:
+        user = await storage.apply_purchase(
+            user_id,
+            star_purchase=(f.product.payload, f.product.stars_price, f.product.id, charge_id),
+            **f.grant,
+        )
+    except DuplicatePurchase:
+        # параллельный повтор успел записаться между проверкой и транзакцией
+        _remember_charge(charge_id)
+        return await storage.get_user(user_id), REPLAY_MESSAGE, True
+
+    if charge_id is not None:
+        _remember_charge(charge_id)
+    return user, f.message, False
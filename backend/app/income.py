@@ -0,0 +1,47 @@
+import time
+from typing import Optional
+
+from .config import OFFLINE_INCOME_CAP_HOURS
+from .models import User
+
+OFFLINE_CAP_SECONDS = OFFLINE_INCOME_CAP_HOURS * 3600
+
+
+def accrue_income(
+    user: User,
+    now: Optional[int] = None,
+    multiplier: int = 1,
+    boost_until: Optional[int] = None,
+) -> int:
+    """
+    Ленивое начисление пассивного дохода: без крона, за O(1) при чтении юзера.
+
+    Начисляет hourly_income за время с last_accrued_at, но не больше
+    OFFLINE_INCOME_CAP_HOURS. multiplier действует до boost_until
+    (None — на всё окно). Доли монеты (монето-секунды меньше 3600) копятся
+    в income_units, поэтому частые чтения ничего не теряют.
+    Меняет user на месте, возвращает начисленные монеты.
+    Сохраняется это вместе с остальными полями юзера в update_user.
+    """
+    if now is None:
+        now = int(time.time())
+
+    if not user.last_accrued_at or user.last_accrued_at > now:
+        user.last_accrued_at = now
+        return 0
+
+    # время сверх лимита офлайна сгорает
+    start = max(user.last_accrued_at, now - OFFLINE_CAP_SECONDS)
+    seconds = now - start
+
+    boosted = 0
+    if multiplier != 1:
+        boost_end = now if boost_until is None else min(now, boost_until)
+        boosted = max(0, boost_end - start)
+
+    # монето-секунды в целых числах, чтобы не копить ошибку float
+    units = user.income_units + user.hourly_income * (seconds - boosted + boosted * multiplier)
+    earned, user.income_units = divmod(units, 3600)
+    user.coins += earned
+    user.last_accrued_at = now
+    return earned
@@ -0,0 +1,398 @@
+import sqlite3
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .boosters import COINS_BOOSTER, BoosterRow
+from .config import COURSE_PROGRESS_STORAGE
+from .income import accrue_income
+from .models import User, UserSnapshot
+from .rating import level_from_xp, rank_name_from_level, rating_score
+from .storage import DuplicatePurchase, Storage, accrue, boosters
+
+BITMAP_PROGRESS = COURSE_PROGRESS_STORAGE == "bitmap"
+
+# ключ рейтинга: по возрастанию ключа = по убыванию очков, при равенстве — по user_id
+RatingKey = Tuple[float, int]
+
+
+def _step_bits() -> Dict[str, int]:
+    # импорт внутри, чтобы не зациклить: app.course импортирует storage
+    from .course import STEP_BITS
+    return STEP_BITS
+
+
+class MemoryStorage(Storage):
+    """
+    Всё в dict'ах и set'ах процесса, с той же семантикой, что у SQLite:
+    те же ошибки, тот же порядок списков, те же правила рефералов и покупок.
+    Каждая операция выполняется без await внутри, поэтому атомарна сама по себе.
+
+    Рейтинг — отсортированный список ключей (-очки, user_id), как индекс
+    idx_users_rating: топ-K — срез, место — bisect.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._users: Dict[int, User] = {}
+        self._rating: List[RatingKey] = []
+        self._steps: Dict[int, Set[str]] = defaultdict(set)
+        self._pandas: Dict[int, Set[str]] = defaultdict(set)
+        self._achievements: Dict[int, Set[str]] = defaultdict(set)
+        # приглашённый -> пригласивший (приглашённого можно привести один раз)
+        self._inviter_of: Dict[int, int] = {}
+        self._referrals_count: Dict[int, int] = defaultdict(int)
+        self._star_purchases: List[Tuple[int, str, int, str, Optional[str]]] = []
+        self._charge_ids: Set[str] = set()
+        # (user_id, kind) -> (id строки, multiplier, expires_at)
+        self._boosters: Dict[Tuple[int, str], Tuple[int, int, int]] = {}
+        self._booster_seq = 0
+
+    # ===== Юзеры =====
+
+    @staticmethod
+    def _rating_key(user: User) -> RatingKey:
+        return -rating_score(user), user.user_id
+
+    def _insert_user(self, user: User):
+        self._users[user.user_id] = replace(user)
+        insort(self._rating, self._rating_key(user))
+
+    def _write_user(self, user: User):
+        """Как UPDATE_USER_SQL: только счётчики, username и referred_by не трогаются."""
+        stored = self._users.get(user.user_id)
+        if stored is None:
+            return
+        old_key = self._rating_key(stored)
+        stored.coins = user.coins
+        stored.xp = user.xp
+        stored.hourly_income = user.hourly_income
+        stored.level = user.level
+        stored.rank_name = user.rank_name
+        stored.last_accrued_at = user.last_accrued_at
+        stored.income_units = user.income_units
+        new_key = self._rating_key(stored)
+        if new_key != old_key:
+            del self._rating[bisect_left(self._rating, old_key)]
+            insort(self._rating, new_key)
+
+    async def get_user(self, user_id: int, username: Optional[str] = None) -> User:
+        stored = self._users.get(user_id)
+        if stored is not None:
+            user = replace(stored)
+            accrue(user)
+            return user
+
+        level = 1
+        user = User(
+            user_id=user_id,
+            username=username,
+            coins=0,
+            xp=0,
+            hourly_income=10,
+            level=level,
+            rank_name=rank_name_from_level(level),
+            referred_by=None,
+            last_accrued_at=int(time.time()),
+        )
+        self._insert_user(user)
+        return user
+
+    async def update_user(self, user: User, durable: bool = False):
+        self._write_user(user)
+
+    async def set_username(self, user_id: int, username: Optional[str]):
+        stored = self._users.get(user_id)
+        if stored is not None:
+            stored.username = username
+
+    async def get_all_users(self) -> List[User]:
+        return [replace(u) for u in self._users.values()]
+
+    async def get_top_users(self, limit: int) -> List[User]:
+        return [replace(self._users[user_id]) for _, user_id in self._rating[:max(limit, 0)]]
+
+    async def get_rating_neighbourhood(self, user_id: int, around: int) -> Tuple[int, int, List[User]]:
+        stored = self._users.get(user_id)
+        if stored is None:
+            return 0, 0, []
+        idx = bisect_left(self._rating, self._rating_key(stored))
+        window = self._rating[max(idx - around, 0):idx + 1 + around]
+        return idx + 1, len(self._rating), [replace(self._users[uid]) for _, uid in window]
+
+    async def get_user_snapshot(self, user_id: int, username: Optional[str] = None) -> UserSnapshot:
+        user = await self.get_user(user_id, username)
+        return UserSnapshot(
+            user=user,
+            completed_steps=self._completed_steps(user_id),
+            pandas=sorted(self._pandas.get(user_id, ())),
+            achievements=sorted(self._achievements.get(user_id, ())),
+            referrals_count=self._referrals_count.get(user_id, 0),
+        )
+
+    # ===== Прогресс курса =====
+
+    def _completed_steps(self, user_id: int) -> List[str]:
+        done = self._steps.get(user_id)
+        if not done:
+            return []
+        if BITMAP_PROGRESS:
+            # порядок битов, как _bits_to_step_ids
+            from .course import STEP_BIT_IDS
+            return [step_id for step_id in STEP_BIT_IDS if step_id in done]
+        return sorted(done)
+
+    async def mark_step_completed(self, user_id: int, step_id: str):
+        if BITMAP_PROGRESS and step_id not in _step_bits():
+            raise ValueError(f"Unknown step: {step_id}")
+        self._steps[user_id].add(step_id)
+
+    async def is_step_completed(self, user_id: int, step_id: str) -> bool:
+        return step_id in self._steps.get(user_id, ())
+
+    async def get_completed_steps(self, user_id: int) -> List[str]:
+        return self._completed_steps(user_id)
+
+    async def count_completed_steps(self, user_id: int) -> int:
+        return len(self._steps.get(user_id, ()))
+
+    # ===== Панды =====
+
+    async def add_panda_purchase(self, user_id: int, panda_id: str) -> bool:
+        owned = self._pandas[user_id]
+        if panda_id in owned:
+            return False
+        owned.add(panda_id)
+        return True
+
+    async def user_has_panda(self, user_id: int, panda_id: str) -> bool:
+        return panda_id in self._pandas.get(user_id, ())
+
+    async def get_user_pandas(self, user_id: int) -> List[str]:
+        return sorted(self._pandas.get(user_id, ()))
+
+    # ===== Ачивки =====
+
+    async def add_user_achievement(self, user_id: int, achievement_id: str):
+        self._achievements[user_id].add(achievement_id)
+
+    async def add_user_achievements(self, user_id: int, achievement_ids: List[str]):
+        self._achievements[user_id].update(achievement_ids)
+
+    async def get_user_achievements(self, user_id: int) -> List[str]:
+        return sorted(self._achievements.get(user_id, ()))
+
+    # ===== Рефералы =====
+
+    async def set_user_referred_by(self, user_id: int, inviter_id: int):
+        stored = self._users.get(user_id)
+        if stored is not None:
+            stored.referred_by = inviter_id
+
+    def _link_referral(self, inviter_id: int, invited_id: int) -> bool:
+        if invited_id in self._inviter_of:
+            return False
+        self._inviter_of[invited_id] = inviter_id
+        invited = self._users.get(invited_id)
+        if invited is not None and invited.referred_by is None:
+            invited.referred_by = inviter_id
+        return True
+
+    async def add_referral(self, inviter_id: int, invited_id: int) -> bool:
+        if inviter_id == invited_id or inviter_id not in self._users:
+            return False
+        if not self._link_referral(inviter_id, invited_id):
+            return False
+        self._referrals_count[inviter_id] += 1
+        return True
+
+    async def credit_referrals(
+        self,
+        pairs: Iterable[Tuple[int, int]],
+        coins: int = 0,
+        xp: int = 0,
+    ) -> Dict[int, int]:
+        by_inviter: Dict[int, List[int]] = defaultdict(list)
+        for inviter_id, invited_id in pairs:
+            if inviter_id != invited_id:
+                by_inviter[inviter_id].append(invited_id)
+
+        counts: Dict[int, int] = {}
+        for inviter_id, invited_ids in by_inviter.items():
+            stored = self._users.get(inviter_id)
+            if stored is None:
+                continue
+            added = sum(self._link_referral(inviter_id, invited_id) for invited_id in invited_ids)
+            if not added:
+                continue
+
+            # как db._reward_inviters: только награда, доход досчитает следующее чтение
+            user = replace(stored)
+            user.coins += coins * added
+            user.xp += xp * added
+            user.level = level_from_xp(user.xp)
+            user.rank_name = rank_name_from_level(user.level)
+            self._write_user(user)
+            self._referrals_count[inviter_id] += added
+            counts[inviter_id] = self._referrals_count[inviter_id]
+        return counts
+
+    async def get_referrals_count(self, inviter_id: int) -> int:
+        return self._referrals_count.get(inviter_id, 0)
+
+    # ===== Покупки =====
+
+    def _extend_booster(self, user_id: int, kind: str, multiplier: int, seconds: int) -> int:
+        """Как db._extend_booster: тот же бустер продлевается, другой — перезапускается."""
+        now = int(time.time())
+        row = self._boosters.get((user_id, kind))
+        start = now
+        if row is not None and row[1] == multiplier and row[2] > now:
+            start = row[2]
+        self._booster_seq += 1
+        self._boosters[(user_id, kind)] = (self._booster_seq, multiplier, start + seconds)
+        return start + seconds
+
+    async def apply_purchase(
+        self,
+        user_id: int,
+        price: int = 0,
+        panda_id: Optional[str] = None,
+        coins: int = 0,
+        xp: int = 0,
+        income_bonus: int = 0,
+        ignore_owned: bool = False,
+        star_purchase: Optional[Tuple[str, int, str, Optional[str]]] = None,
+        booster: Optional[Tuple[str, int, int]] = None,
+    ) -> User:
+        # сначала все проверки в порядке SQLite-версии, потом запись: откатывать нечего
+        if star_purchase is not None and star_purchase[3] in self._charge_ids:
+            raise DuplicatePurchase(star_purchase[3])
+        stored = self._users.get(user_id)
+        if stored is None:
+            raise ValueError("User not found")
+        user = replace(stored)
+        # как db.ApplyPurchase: бустер монет — из своих строк, а не из реестра
+        boost = self._boosters.get((user_id, COINS_BOOSTER))
+        if boost is None:
+            accrue_income(user)
+        else:
+            accrue_income(user, multiplier=boost[1], boost_until=boost[2])
+
+        new_panda = panda_id is not None and panda_id not in self._pandas.get(user_id, ())
+        if panda_id is not None and not new_panda:
+            if not ignore_owned:
+                raise ValueError("Panda already purchased")
+            income_bonus = 0
+
+        if user.coins < price:
+            raise ValueError("Not enough coins")
+
+        if star_purchase is not None:
+            await self.add_star_purchase(user_id, *star_purchase)
+        if new_panda:
+            self._pandas[user_id].add(panda_id)
+
+        user.coins += coins - price
+        user.xp += xp
+        user.hourly_income += income_bonus
+        user.level = level_from_xp(user.xp)
+        user.rank_name = rank_name_from_level(user.level)
+        self._write_user(user)
+
+        if booster is not None:
+            kind, multiplier, seconds = booster
+            expires_at = self._extend_booster(user_id, kind, multiplier, seconds)
+            if boosters.enabled:
+                boosters.add(user_id, kind, multiplier, expires_at)
+        return replace(user)
+
+    async def add_star_purchase(
+        self,
+        user_id: int,
+        payload: str,
+        amount: int,
+        product_id: str,
+        charge_id: Optional[str] = None,
+    ) -> bool:
+        if charge_id is not None:
+            if charge_id in self._charge_ids:
+                return False
+            self._charge_ids.add(charge_id)
+        self._star_purchases.append((user_id, payload, amount, product_id, charge_id))
+        return True
+
+    async def star_purchase_exists(self, charge_id: str) -> bool:
+        return charge_id in self._charge_ids
+
+    async def load_boosters(self, after_id: int, now: int) -> List[BoosterRow]:
+        rows = [
+            (row_id, user_id, kind, multiplier, expires_at)
+            for (user_id, kind), (row_id, multiplier, expires_at) in self._boosters.items()
+            if row_id > after_id and expires_at > now
+        ]
+        rows.sort()
+        return rows
+
+    # ===== Снимок SQLite =====
+
+    def load_sqlite(self, path: str):
+        """
+        Загружает в память содержимое файла SQLite (схема app.db): одни и те же
+        данные для прогона на обоих движках. Текущее содержимое заменяется.
+        """
+        self.clear()
+        conn = sqlite3.connect(path)
+        try:
+            for row in conn.execute(
+                "SELECT user_id, username, coins, xp, hourly_income, level, rank_name, "
+                "referred_by, last_accrued_at, income_units, referrals_count FROM users"
+            ):
+                user = User(*row[:-1])
+                self._users[user.user_id] = user
+                self._rating.append(self._rating_key(user))
+                if row[-1]:
+                    self._referrals_count[user.user_id] = row[-1]
+            self._rating.sort()
+
+            if BITMAP_PROGRESS:
+                from .course import STEP_BIT_IDS
+                for user_id, bits in conn.execute("SELECT user_id, bits FROM course_progress_bits"):
+                    self._steps[user_id].update(
+                        step_id for i, step_id in enumerate(STEP_BIT_IDS) if bits >> i & 1
+                    )
+            else:
+                for user_id, step_id in conn.execute(
+                    "SELECT user_id, step_id FROM course_progress WHERE is_completed=1"
+                ):
+                    self._steps[user_id].add(step_id)
+
+            for user_id, panda_id in conn.execute("SELECT user_id, panda_id FROM panda_purchases"):
+                self._pandas[user_id].add(panda_id)
+            for user_id, ach_id in conn.execute(
+                "SELECT user_id, achievement_id FROM user_achievements"
+            ):
+                self._achievements[user_id].add(ach_id)
+            self._inviter_of.update(
+                (invited_id, inviter_id)
+                for inviter_id, invited_id in conn.execute(
+                    "SELECT inviter_id, invited_id FROM referrals"
+                )
+            )
+            for row in conn.execute(
+                "SELECT user_id, payload, amount, product_id, charge_id FROM star_purchases ORDER BY id"
+            ):
+                self._star_purchases.append(row)
+                if row[-1] is not None:
+                    self._charge_ids.add(row[-1])
+            for row_id, user_id, kind, multiplier, expires_at in conn.execute(
+                "SELECT id, user_id, kind, multiplier, expires_at FROM user_boosters"
+            ):
+                self._boosters[(user_id, kind)] = (row_id, multiplier, expires_at)
+                self._booster_seq = max(self._booster_seq, row_id)
+        finally:
+            conn.close()
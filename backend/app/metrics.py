@@ -0,0 +1,183 @@
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Границы бакетов, как в prometheus_client по умолчанию, плюс мелкие —
+# большинство наших запросов укладывается в миллисекунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+@dataclass
+class RequestStats:
+    """Что сделал с БД один HTTP-запрос."""
+    db_calls: int = 0
+    db_seconds: float = 0.0
+    connections: int = 0
+
+
+_request: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+# внутри функции app.db: вложенные вызовы (apply_purchase -> add_star_purchase) не считаем
+_in_db: ContextVar[bool] = ContextVar("in_db", default=False)
+
+# (method, route) -> гистограмма
+route_latency: Dict[Tuple[str, str], Histogram] = {}
+route_db_calls: Dict[Tuple[str, str], Histogram] = {}
+route_db_seconds: Dict[Tuple[str, str], Histogram] = {}
+route_connections: Dict[Tuple[str, str], Histogram] = {}
+# имя функции app.db -> (вызовов, секунд)
+db_calls: Dict[str, List[float]] = {}
+
+
+def _histogram(table: Dict, key, buckets) -> Histogram:
+    h = table.get(key)
+    if h is None:
+        h = table[key] = Histogram(buckets)
+    return h
+
+
+def count_connection():
+    """Вызывается пулом при каждой выдаче соединения."""
+    stats = _request.get()
+    if stats is not None:
+        stats.connections += 1
+
+
+def instrument(name: str, fn: Callable) -> Callable:
+    """Оборачивает async-функцию app.db: число вызовов и время, в целом и на запрос."""
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if _in_db.get():
+            return await fn(*args, **kwargs)
+        token = _in_db.set(True)
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_db.reset(token)
+            total = db_calls.get(name)
+            if total is None:
+                total = db_calls[name] = [0, 0.0]
+            total[0] += 1
+            total[1] += elapsed
+            stats = _request.get()
+            if stats is not None:
+                stats.db_calls += 1
+                stats.db_seconds += elapsed
+
+    wrapper.__wrapped_db__ = fn
+    return wrapper
+
+
+def instrument_module(namespace: Dict[str, Any], module: str):
+    """
+    Заменяет в namespace модуля все публичные async-функции, объявленные
+    в нём самом, на instrument-обёртки. Вызывается в конце app.db — до того,
+    как остальные модули сделают `from .db import ...`.
+    """
+    for name, obj in list(namespace.items()):
+        if (
+            not name.startswith("_")
+            and inspect.iscoroutinefunction(obj)
+            and obj.__module__ == module
+            and not hasattr(obj, "__wrapped_db__")
+        ):
+            namespace[name] = instrument(name, obj)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: латентность и работа с БД по каждому маршруту.
+    Маршрут — шаблон пути (/profile/{user_id}), а не сам путь, чтобы
+    число серий не росло с числом юзеров.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request.reset(token)
+            route = scope.get("route")
+            key = (scope["method"], getattr(route, "path", "unmatched"))
+            _histogram(route_latency, key, LATENCY_BUCKETS).observe(elapsed)
+            _histogram(route_db_calls, key, COUNT_BUCKETS).observe(stats.db_calls)
+            _histogram(route_db_seconds, key, LATENCY_BUCKETS).observe(stats.db_seconds)
+            _histogram(route_connections, key, COUNT_BUCKETS).observe(stats.connections)
+
+
+def _labels(pairs: Iterable[Tuple[str, Any]]) -> str:
+    parts = []
+    for k, v in pairs:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _render_histograms(out: List[str], name: str, help_text: str, table: Dict):
+    out.append(f"# HELP {name} {help_text}")
+    out.append(f"# TYPE {name} histogram")
+    for (method, route), h in sorted(table.items()):
+        base = (("method", method), ("route", route))
+        cumulative = 0
+        for bound, n in zip(h.buckets + (float("inf"),), h.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            out.append(f"{name}_bucket{_labels(base + (('le', le),))} {cumulative}")
+        out.append(f"{name}_sum{_labels(base)} {h.sum!r}")
+        out.append(f"{name}_count{_labels(base)} {h.count}")
+
+
+def render(gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    """Все метрики в текстовом формате Prometheus (text/plain; version=0.0.4)."""
+    out: List[str] = []
+    for name, help_text, table in (
+        ("http_request_duration_seconds", "Время обработки запроса.", route_latency),
+        ("http_request_db_calls", "Вызовов функций app.db на запрос.", route_db_calls),
+        ("http_request_db_seconds", "Время в функциях app.db на запрос.", route_db_seconds),
+        ("http_request_db_connections", "Соединений из пула на запрос.", route_connections),
+    ):
+        _render_histograms(out, name, help_text, table)
+
+    out.append("# HELP db_calls_total Вызовы функций app.db.")
+    out.append("# TYPE db_calls_total counter")
+    for name, (calls, _) in sorted(db_calls.items()):
+        out.append(f"db_calls_total{_labels([('fn', name)])} {calls}")
+    out.append("# HELP db_call_seconds_total Время в функциях app.db.")
+    out.append("# TYPE db_call_seconds_total counter")
+    for name, (_, seconds) in sorted(db_calls.items()):
+        out.append(f"db_call_seconds_total{_labels([('fn', name)])} {seconds!r}")
+
+    for name, (help_text, value) in sorted((gauges or {}).items()):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} gauge")
+        out.append(f"{name} {value}")
+    return "\n".join(out) + "\n"
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
 @dataclass
 class User:
@@ -11,3 +11,15 @@ class User:
     level: int
     rank_name: str
     referred_by: Optional[int]
+    last_accrued_at: int = 0  # unix-время последнего начисления пассивного дохода
+    income_units: int = 0  # недоначисленные монето-секунды (< 3600) с last_accrued_at
+
+
+@dataclass
+class UserSnapshot:
+    """Всё, что нужно для сборки экранов Mini App, загруженное за один проход."""
+    user: User
+    completed_steps: List[str]
+    pandas: List[str]
+    achievements: List[str]
+    referrals_count: int
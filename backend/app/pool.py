@@ -0,0 +1,123 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiosqlite
+
+from .config import (
+    DB_PATH,
+    DB_READERS,
+    DB_MMAP_SIZE,
+    DB_CACHE_SIZE_KB,
+    DB_BUSY_TIMEOUT_MS,
+)
+from .metrics import count_connection
+
+
+class ConnectionPool:
+    """
+    Пул соединений к одному файлу SQLite:
+    - N соединений только на чтение (WAL позволяет читать параллельно с записью),
+    - одно соединение на запись, доступ к нему сериализуется asyncio.Lock.
+
+    PRAGMA применяются один раз при открытии соединения, а не на каждый запрос.
+    """
+
+    def __init__(self, path: str, readers: int = DB_READERS):
+        self.path = path
+        self.size = max(1, readers)
+        self._readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._opened = False
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        await conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        # отрицательное значение = размер кэша в KiB, а не в страницах
+        await conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        if read_only:
+            await conn.execute("PRAGMA query_only=1")
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self._opened:
+                return
+            # writer открываем первым: он переводит файл в WAL до появления читателей
+            self._writer = await self._connect(read_only=False)
+            for _ in range(self.size):
+                conn = await self._connect(read_only=True)
+                self._all_readers.append(conn)
+                self._readers.put_nowait(conn)
+            self._opened = True
+
+    async def close(self):
+        async with self._open_lock:
+            if not self._opened:
+                return
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for conn in self._all_readers:
+                await conn.close()
+            self._all_readers.clear()
+            self._readers = asyncio.Queue()
+            self._opened = False
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._opened:
+            await self.open()
+        conn = await self._readers.get()
+        count_connection()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        if not self._opened:
+            await self.open()
+        async with self._write_lock:
+            count_connection()
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+
+_pools: Dict[str, ConnectionPool] = {}
+
+
+def get_pool(path: str = DB_PATH) -> ConnectionPool:
+    pool = _pools.get(path)
+    if pool is None:
+        pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+async def open_pool(path: str = DB_PATH):
+    await get_pool(path).open()
+
+
+async def close_pool():
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
+
+
+def read_conn(path: str = DB_PATH):
+    return get_pool(path).reader()
+
+
+def write_conn(path: str = DB_PATH):
+    return get_pool(path).writer()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер: фоновый поток раз в interval снимает стек
+    потока с event loop и копит одинаковые стеки. folded() отдаёт их в
+    формате "a;b;c N" — его понимают flamegraph.pl и speedscope.
+
+    Накладные расходы — один проход по кадрам на сэмпл, код приложения
+    не трогается, поэтому включать можно на живом процессе.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        """Вызывать из потока, который нужно профилировать (event loop)."""
+        if self.running:
+            return
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        self.samples.clear()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+async def profile_for(profiler: SamplingProfiler, seconds: float) -> str:
+    """Снимает профиль за seconds секунд, пока event loop обслуживает запросы."""
+    if profiler.running:
+        raise RuntimeError("Profiler is already running")
+    profiler.reset()
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.folded()
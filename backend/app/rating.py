@@ -1,27 +1,41 @@
+from bisect import bisect_right
+from math import isqrt
 from typing import List
 from .models import User
 
+# Уровень L достигается при xp >= 100 * L^2 (переход L-1 -> L).
+LEVEL_XP_STEP = 100
+
 def level_from_xp(xp: int) -> int:
-    level = 1
-    while True:
-        required = 100 * (level + 1) ** 2
-        if xp < required:
-            return level
-        level += 1
+    """Максимальный L >= 1 с 100 * L^2 <= xp, через целочисленный корень — O(1)."""
+    if xp < LEVEL_XP_STEP * 4:
+        return 1
+    # 100 * L^2 <= xp  <=>  L^2 <= xp // 100, т.к. L^2 целое
+    return isqrt(xp // LEVEL_XP_STEP)
+
+# (минимальный уровень, звание) по возрастанию уровня
+RANKS = [
+    (1, "Новичок"),
+    (3, "Джун-арбитражник"),
+    (5, "Мидл-арбитражник"),
+    (7, "Сеньор-арбитражник"),
+    (9, "Трафик-Самурай"),
+    (11, "Трафик-Гуру"),
+]
+# звание для каждого уровня от 0 до последнего порога; выше — последнее звание
+_RANK_LEVELS = [lvl for lvl, _ in RANKS]
+_RANK_BY_LEVEL = tuple(
+    RANKS[max(bisect_right(_RANK_LEVELS, level) - 1, 0)][1]
+    for level in range(_RANK_LEVELS[-1] + 1)
+)
+_RANK_TOP = len(_RANK_BY_LEVEL)
+_FIRST_RANK, _LAST_RANK = RANKS[0][1], RANKS[-1][1]
 
 def rank_name_from_level(level: int) -> str:
-    if level < 3:
-        return "Новичок"
-    elif level < 5:
-        return "Джун-арбитражник"
-    elif level < 7:
-        return "Мидл-арбитражник"
-    elif level < 9:
-        return "Сеньор-арбитражник"
-    elif level < 11:
-        return "Трафик-Самурай"
-    else:
-        return "Трафик-Гуру"
+    # только сравнения и индекс: вызов max/len/bisect в CPython дороже всей лесенки if
+    if level < _RANK_TOP:
+        return _RANK_BY_LEVEL[level] if level >= 0 else _FIRST_RANK
+    return _LAST_RANK
 
 def rating_score(user: User) -> float:
     return user.xp * 2 + user.coins * 0.001 + user.hourly_income * 10
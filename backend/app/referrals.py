@@ -0,0 +1,140 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .achievements import record_progress
+from .config import REFERRAL_BATCH_SIZE, REFERRAL_FLUSH_INTERVAL
+from .storage import storage
+from .tasks import TASKS
+
+# Награда пригласившему — та же, что обещает задание "Пригласить друга"
+REFERRAL_REWARD_COINS = TASKS["invite_friend"].reward_coins
+REFERRAL_REWARD_XP = TASKS["invite_friend"].reward_xp
+
+Pair = Tuple[int, int]
+CreditFn = Callable[[List[Pair]], Awaitable[Dict[int, int]]]
+
+
+async def _credit(pairs: List[Pair]) -> Dict[int, int]:
+    counts = await storage.credit_referrals(
+        pairs, coins=REFERRAL_REWARD_COINS, xp=REFERRAL_REWARD_XP
+    )
+    for inviter_id, count in counts.items():
+        if REFERRAL_REWARD_XP:
+            # награда в XP могла поднять уровень — ачивки за уровень тоже проверяем
+            inviter = await storage.get_user(inviter_id)
+            await record_progress(inviter_id, referrals=count, level=inviter.level)
+        else:
+            await record_progress(inviter_id, referrals=count)
+    return counts
+
+
+class ReferralWriter:
+    """
+    Очередь рефералов с пакетной записью.
+
+    /start по реферальной ссылке только кладёт пару в очередь; фоновая
+    задача забирает до batch_size пар (или всё, что пришло за flush_interval)
+    и пишет их одной транзакцией storage.credit_referrals. Вирусный пост с тысячами
+    /start в минуту превращается в пару коммитов в секунду, а не тысячи.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, credit: CreditFn):
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self._credit = credit
+        self._queue: "asyncio.Queue[Tuple[Pair, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # пачка, которую сейчас собирают или пишут, — её дописывает stop()
+        self._batch: List[Tuple[Pair, asyncio.Future]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        # будит _take_batch раньше flush_interval, когда пачка набралась
+        self._full: Optional[asyncio.Future] = None
+        self.enabled = False
+
+    def submit(self, inviter_id: int, invited_id: int) -> "asyncio.Future[Optional[int]]":
+        """
+        Ставит реферала в очередь. Future вернёт referrals_count пригласившего
+        после записи пачки или None, если в ней ему ничего не засчитано
+        (повторы, ошибка записи).
+        Ждать его не обязательно.
+        """
+        if not self.enabled:
+            raise RuntimeError("ReferralWriter is not started")
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(((inviter_id, invited_id), fut))
+        if self._full is not None and not self._full.done() and (
+            self._queue.qsize() + 1 >= self.batch_size
+        ):
+            self._full.set_result(None)
+        return fut
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _take_batch(self) -> List[Tuple[Pair, asyncio.Future]]:
+        self._batch = batch = [await self._queue.get()]
+        if self._queue.qsize() + 1 < self.batch_size:
+            # asyncio.wait, а не wait_for(queue.get()): в 3.11 wait_for может
+            # проглотить отмену, и stop() ждал бы задачу вечно
+            self._full = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait([self._full], timeout=self.flush_interval)
+            finally:
+                self._full = None
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        self._batch = []
+        return batch
+
+    async def _write(self, batch: List[Tuple[Pair, asyncio.Future]]):
+        try:
+            counts = await self._credit([pair for pair, _ in batch])
+        except Exception as e:
+            # транзакция откатилась целиком; обработчики future обычно не ждут,
+            # поэтому ошибку не пробрасываем в них, а только логируем
+            print(f"⚠️ referral batch failed: {e!r}")
+            counts = {}
+        for (inviter_id, _), fut in batch:
+            if not fut.done():
+                fut.set_result(counts.get(inviter_id))
+
+    def _drain(self) -> List[Tuple[Pair, asyncio.Future]]:
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _loop(self):
+        while True:
+            batch = await self._take_batch()
+            # отмена при остановке не должна рвать транзакцию посередине
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+
+    async def start(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и дописывает всё, что осталось в очереди."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        batch = self._drain()
+        for i in range(0, len(batch), self.batch_size):
+            await self._write(batch[i:i + self.batch_size])
+
+
+referral_writer = ReferralWriter(REFERRAL_FLUSH_INTERVAL, REFERRAL_BATCH_SIZE, credit=_credit)
@@ -0,0 +1,25 @@
+import os
+from typing import List
+
+_MASK64 = (1 << 64) - 1
+# 2^64 / золотое сечение: соседние user_id разлетаются по шардам равномерно
+_FIB64 = 0x9E3779B97F4A7C15
+
+
+def shard_index(user_id: int, shards: int) -> int:
+    """Номер шарда юзера: фибоначчиево хеширование и multiply-shift в [0, shards)."""
+    if shards <= 1:
+        return 0
+    return ((user_id * _FIB64) & _MASK64) * shards >> 64
+
+
+def shard_paths(path: str, shards: int) -> List[str]:
+    """
+    Файлы раскладки из shards шардов. Один шард — сам path (как без шардирования);
+    иначе trafficpanda.shard0-of-4.db и т.д.: у каждой раскладки свои файлы,
+    поэтому решардинг пишет рядом и не трогает текущие.
+    """
+    if shards <= 1:
+        return [path]
+    base, ext = os.path.splitext(path)
+    return [f"{base}.shard{i}-of-{shards}{ext}" for i in range(shards)]
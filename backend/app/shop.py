@@ -2,8 +2,7 @@ from dataclasses import dataclass
 from typing import Dict, List
 
 from .models import User
-from .db import user_has_panda, add_panda_purchase, update_user
-from .rating import level_from_xp, rank_name_from_level
+from .storage import storage
 
 
 @dataclass
@@ -56,22 +55,16 @@ def list_pandas() -> List[PandaItem]:
     return list(PANDAS.values())
 
 
-async def buy_panda(user: User, panda_id: str):
+async def buy_panda(user: User, panda_id: str) -> User:
     if panda_id not in PANDAS:
         raise ValueError("Panda not found")
 
     panda = PANDAS[panda_id]
 
-    if await user_has_panda(user.user_id, panda_id):
-        raise ValueError("Panda already purchased")
-
-    if user.coins < panda.price:
-        raise ValueError("Not enough coins")
-
-    user.coins -= panda.price
-    user.hourly_income += panda.income_bonus
-    user.level = level_from_xp(user.xp)
-    user.rank_name = rank_name_from_level(user.level)
-
-    await update_user(user)
-    await add_panda_purchase(user.user_id, panda_id)
+    # проверка владения, списание и запись панды — одной транзакцией
+    return await storage.apply_purchase(
+        user.user_id,
+        price=panda.price,
+        panda_id=panda_id,
+        income_bonus=panda.income_bonus,
+    )
@@ -1,6 +1,9 @@
+from bisect import bisect_right
 from dataclasses import dataclass
 from typing import List, Dict
 
+from .content import load_content
+
 
 @dataclass
 class Skill:
@@ -95,6 +98,19 @@ SKILLS: Dict[str, Skill] = {
 }
 
 
+SKILLS = load_content("skills", Skill) or SKILLS
+
+# Индекс разблокировки: навыки по возрастанию level_required (при равенстве —
+# в порядке каталога). Навыки уровня L — префикс этого списка.
+SKILLS_BY_LEVEL: List[Skill] = sorted(SKILLS.values(), key=lambda s: s.level_required)
+SKILL_LEVELS: List[int] = [s.level_required for s in SKILLS_BY_LEVEL]
+
+
+def unlocked_skills_count(level: int) -> int:
+    """Сколько первых навыков SKILLS_BY_LEVEL открыто на этом уровне."""
+    return bisect_right(SKILL_LEVELS, level)
+
+
 def get_skills_for_level(level: int) -> List[Skill]:
     """Возвращает список навыков, доступных пользователю с этим уровнем."""
-    return [s for s in SKILLS.values() if level >= s.level_required]
+    return SKILLS_BY_LEVEL[:unlocked_skills_count(level)]
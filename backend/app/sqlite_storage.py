@@ -0,0 +1,109 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import db
+from .boosters import BoosterRow
+from .models import User, UserSnapshot
+from .pool import close_pool
+from .storage import Storage
+
+
+class SQLiteStorage(Storage):
+    """
+    Движок поверх app.db: SQL, пул, писатель и write-behind кэш живут там,
+    здесь только привязка к интерфейсу. Функции db берутся в момент вызова —
+    уже обёрнутые метриками.
+    """
+
+    async def init(self):
+        await db.init_db()
+
+    async def close(self):
+        await db.stop_writers()
+        await close_pool()
+
+    async def get_user(self, user_id: int, username: Optional[str] = None) -> User:
+        return await db.get_user(user_id, username)
+
+    async def update_user(self, user: User, durable: bool = False):
+        await db.update_user(user, durable)
+
+    async def set_username(self, user_id: int, username: Optional[str]):
+        await db.set_username(user_id, username)
+
+    async def get_all_users(self) -> List[User]:
+        return await db.get_all_users()
+
+    async def get_top_users(self, limit: int) -> List[User]:
+        return await db.get_top_users(limit)
+
+    async def get_rating_neighbourhood(self, user_id: int, around: int) -> Tuple[int, int, List[User]]:
+        return await db.get_rating_neighbourhood(user_id, around)
+
+    async def get_user_snapshot(self, user_id: int, username: Optional[str] = None) -> UserSnapshot:
+        return await db.get_user_snapshot(user_id, username)
+
+    async def mark_step_completed(self, user_id: int, step_id: str):
+        await db.mark_step_completed(user_id, step_id)
+
+    async def is_step_completed(self, user_id: int, step_id: str) -> bool:
+        return await db.is_step_completed(user_id, step_id)
+
+    async def get_completed_steps(self, user_id: int) -> List[str]:
+        return await db.get_completed_steps(user_id)
+
+    async def count_completed_steps(self, user_id: int) -> int:
+        return await db.count_completed_steps(user_id)
+
+    async def add_panda_purchase(self, user_id: int, panda_id: str) -> bool:
+        return await db.add_panda_purchase(user_id, panda_id)
+
+    async def user_has_panda(self, user_id: int, panda_id: str) -> bool:
+        return await db.user_has_panda(user_id, panda_id)
+
+    async def get_user_pandas(self, user_id: int) -> List[str]:
+        return await db.get_user_pandas(user_id)
+
+    async def add_user_achievement(self, user_id: int, achievement_id: str):
+        await db.add_user_achievement(user_id, achievement_id)
+
+    async def add_user_achievements(self, user_id: int, achievement_ids: List[str]):
+        await db.add_user_achievements(user_id, achievement_ids)
+
+    async def get_user_achievements(self, user_id: int) -> List[str]:
+        return await db.get_user_achievements(user_id)
+
+    async def set_user_referred_by(self, user_id: int, inviter_id: int):
+        await db.set_user_referred_by(user_id, inviter_id)
+
+    async def add_referral(self, inviter_id: int, invited_id: int) -> bool:
+        return await db.add_referral(inviter_id, invited_id)
+
+    async def credit_referrals(
+        self,
+        pairs: Iterable[Tuple[int, int]],
+        coins: int = 0,
+        xp: int = 0,
+    ) -> Dict[int, int]:
+        return await db.credit_referrals(pairs, coins, xp)
+
+    async def get_referrals_count(self, inviter_id: int) -> int:
+        return await db.get_referrals_count(inviter_id)
+
+    async def apply_purchase(self, user_id: int, **kwargs) -> User:
+        return await db.apply_purchase(user_id, **kwargs)
+
+    async def add_star_purchase(
+        self,
+        user_id: int,
+        payload: str,
+        amount: int,
+        product_id: str,
+        charge_id: Optional[str] = None,
+    ) -> bool:
+        return await db.add_star_purchase(user_id, payload, amount, product_id, charge_id)
+
+    async def star_purchase_exists(self, charge_id: str) -> bool:
+        return await db.star_purchase_exists(charge_id)
+
+    async def load_boosters(self, after_id: int, now: int) -> List[BoosterRow]:
+        return await db.load_boosters(after_id, now)
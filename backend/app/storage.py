@@ -0,0 +1,187 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .boosters import COINS_BOOSTER, BoosterRegistry, BoosterRow
+from .config import BOOSTER_SWEEP_INTERVAL, STORAGE_ENGINE
+from .income import accrue_income
+from .models import User, UserSnapshot
+
+
+class DuplicatePurchase(Exception):
+    """Платёж с этим charge_id уже записан и выдан."""
+
+
+class Storage:
+    """
+    Хранилище данных игры: юзеры, прогресс курса, панды, ачивки, рефералы
+    и покупки. Остальной код ходит в данные только через этот интерфейс
+    (модульный `storage`), движок выбирается STORAGE_ENGINE:
+
+    - sqlite — файл SQLite (app.db): пул, писатель, write-behind кэш;
+    - memory — dict'ы и set'ы в памяти процесса (app.memory_storage) с той же
+      семантикой: нулевой I/O для бенчмарков и симуляций.
+
+    Юзер отдаётся копией с начисленным на лету пассивным доходом; изменения
+    видны другим запросам только после update_user / apply_purchase.
+    Порядок id в списках (шаги, панды, ачивки) у движков совпадает.
+    """
+
+    async def init(self):
+        """Схема / миграции; вызывается на старте процесса."""
+
+    async def close(self):
+        """Дописывает отложенные записи и освобождает ресурсы."""
+
+    # ===== Юзеры =====
+
+    async def get_user(self, user_id: int, username: Optional[str] = None) -> User:
+        """Юзер по id; нет — создаётся новичком с этим username."""
+        raise NotImplementedError
+
+    async def update_user(self, user: User, durable: bool = False):
+        """Записывает coins / xp / доход / уровень; username и referred_by не трогает."""
+        raise NotImplementedError
+
+    async def set_username(self, user_id: int, username: Optional[str]):
+        raise NotImplementedError
+
+    async def get_all_users(self) -> List[User]:
+        raise NotImplementedError
+
+    async def get_top_users(self, limit: int) -> List[User]:
+        """Топ по rating_score, при равенстве — по user_id."""
+        raise NotImplementedError
+
+    async def get_rating_neighbourhood(self, user_id: int, around: int) -> Tuple[int, int, List[User]]:
+        """(место, всего юзеров, ±around соседей по порядку рейтинга); нет юзера — (0, 0, [])."""
+        raise NotImplementedError
+
+    async def get_user_snapshot(self, user_id: int, username: Optional[str] = None) -> UserSnapshot:
+        raise NotImplementedError
+
+    # ===== Прогресс курса =====
+
+    async def mark_step_completed(self, user_id: int, step_id: str):
+        """В bitmap-режиме неизвестный шаг — ValueError."""
+        raise NotImplementedError
+
+    async def is_step_completed(self, user_id: int, step_id: str) -> bool:
+        raise NotImplementedError
+
+    async def get_completed_steps(self, user_id: int) -> List[str]:
+        raise NotImplementedError
+
+    async def count_completed_steps(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    # ===== Панды =====
+
+    async def add_panda_purchase(self, user_id: int, panda_id: str) -> bool:
+        """True, если панды у юзера ещё не было."""
+        raise NotImplementedError
+
+    async def user_has_panda(self, user_id: int, panda_id: str) -> bool:
+        raise NotImplementedError
+
+    async def get_user_pandas(self, user_id: int) -> List[str]:
+        raise NotImplementedError
+
+    # ===== Ачивки =====
+
+    async def add_user_achievement(self, user_id: int, achievement_id: str):
+        raise NotImplementedError
+
+    async def add_user_achievements(self, user_id: int, achievement_ids: List[str]):
+        raise NotImplementedError
+
+    async def get_user_achievements(self, user_id: int) -> List[str]:
+        raise NotImplementedError
+
+    # ===== Рефералы =====
+
+    async def set_user_referred_by(self, user_id: int, inviter_id: int):
+        raise NotImplementedError
+
+    async def add_referral(self, inviter_id: int, invited_id: int) -> bool:
+        """Один реферал без награды. True, если засчитан."""
+        raise NotImplementedError
+
+    async def credit_referrals(
+        self,
+        pairs: Iterable[Tuple[int, int]],
+        coins: int = 0,
+        xp: int = 0,
+    ) -> Dict[int, int]:
+        """
+        Пачка (inviter_id, invited_id) с наградой пригласившему за каждого
+        нового реферала. Повторы приглашённых, самоприглашения и несуществующие
+        пригласившие пропускаются. {inviter_id: referrals_count} засчитанных.
+        """
+        raise NotImplementedError
+
+    async def get_referrals_count(self, inviter_id: int) -> int:
+        raise NotImplementedError
+
+    # ===== Покупки =====
+
+    async def apply_purchase(
+        self,
+        user_id: int,
+        price: int = 0,
+        panda_id: Optional[str] = None,
+        coins: int = 0,
+        xp: int = 0,
+        income_bonus: int = 0,
+        ignore_owned: bool = False,
+        star_purchase: Optional[Tuple[str, int, str, Optional[str]]] = None,
+        booster: Optional[Tuple[str, int, int]] = None,
+    ) -> User:
+        """Атомарная покупка, полная семантика — app.db.apply_purchase."""
+        raise NotImplementedError
+
+    async def add_star_purchase(
+        self,
+        user_id: int,
+        payload: str,
+        amount: int,
+        product_id: str,
+        charge_id: Optional[str] = None,
+    ) -> bool:
+        """False, если покупка с таким charge_id уже есть."""
+        raise NotImplementedError
+
+    async def star_purchase_exists(self, charge_id: str) -> bool:
+        raise NotImplementedError
+
+    async def load_boosters(self, after_id: int, now: int) -> List[BoosterRow]:
+        """Действующие бустеры с id строки больше after_id, по возрастанию id."""
+        raise NotImplementedError
+
+
+async def _load_boosters(after_id: int, now: int) -> List[BoosterRow]:
+    return await storage.load_boosters(after_id, now)
+
+
+# Запускается в lifespan API и на старте бота; выключенный реестр просто не знает бустеров
+boosters = BoosterRegistry(BOOSTER_SWEEP_INTERVAL, load=_load_boosters)
+
+
+def accrue(user: User, now: Optional[int] = None) -> int:
+    """Пассивный доход юзера с учётом действующего бустера монет."""
+    boost = boosters.active(user.user_id, COINS_BOOSTER)
+    if boost is None:
+        return accrue_income(user, now)
+    return accrue_income(user, now, multiplier=boost[0], boost_until=boost[1])
+
+
+def create_storage(kind: str) -> Storage:
+    # импорт внутри: движки сами импортируют этот модуль
+    if kind == "sqlite":
+        from .sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    if kind == "memory":
+        from .memory_storage import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_ENGINE: {kind}")
+
+
+storage = create_storage(STORAGE_ENGINE)
@@ -1,6 +1,9 @@
+from bisect import bisect_right
 from dataclasses import dataclass
 from typing import List, Dict
 
+from .content import load_content
+
 
 @dataclass
 class StoryChapter:
@@ -81,11 +84,26 @@ CHAPTERS: Dict[str, StoryChapter] = {
 }
 
 
+CHAPTERS = load_content("story", StoryChapter) or CHAPTERS
+
+# каждый день ~ 3 шага курса
+STEPS_PER_DAY = 3
+
+# Индекс разблокировки: главы по дню, открытые главы — префикс списка
+CHAPTERS_BY_DAY: List[StoryChapter] = sorted(CHAPTERS.values(), key=lambda c: c.day)
+CHAPTER_DAYS: List[int] = [c.day for c in CHAPTERS_BY_DAY]
+
+
+def unlocked_chapters_count(completed_steps_count: int) -> int:
+    """Сколько первых глав CHAPTERS_BY_DAY открыто."""
+    approx_day = max(1, completed_steps_count // STEPS_PER_DAY + 1)
+    return bisect_right(CHAPTER_DAYS, approx_day)
+
+
 def get_unlocked_chapters(completed_steps_count: int) -> List[StoryChapter]:
     """
     Примитивная логика:
     - каждый день ~ 3 шага,
     - значит каждые 3 завершённых шага открываем новую главу.
     """
-    approx_day = max(1, min(7, completed_steps_count // 3 + 1))
-    return [c for c in CHAPTERS.values() if c.day <= approx_day]
+    return CHAPTERS_BY_DAY[:unlocked_chapters_count(completed_steps_count)]
@@ -0,0 +1,41 @@
+from dataclasses import dataclass
+from typing import Dict
+
+
+@dataclass
+class Task:
+    id: str
+    title: str
+    description: str
+    reward_xp: int
+    reward_coins: int
+    type: str  # learn / social / exam
+
+
+# Пока задания статические: выполнение не отслеживается
+TASKS: Dict[str, Task] = {
+    "day1_learn": Task(
+        id="day1_learn",
+        title="Завершить День 1 обучения",
+        description="Пройди первые уроки и ответь на вопросы.",
+        reward_xp=100,
+        reward_coins=15_000,
+        type="learn",
+    ),
+    "invite_friend": Task(
+        id="invite_friend",
+        title="Пригласить друга",
+        description="Поделись реферальной ссылкой и приведи друга.",
+        reward_xp=100,
+        reward_coins=25_000,
+        type="social",
+    ),
+    "exam_pass": Task(
+        id="exam_pass",
+        title="Пройти экзамен",
+        description="Ответь на все экзаменационные вопросы.",
+        reward_xp=300,
+        reward_coins=50_000,
+        type="exam",
+    ),
+}
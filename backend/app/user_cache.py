@@ -0,0 +1,252 @@
+import asyncio
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import replace
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .models import User
+
+# (coins, xp, hourly_income): явные изменения юзера, без пассивного дохода
+Delta = Tuple[int, int, int]
+NO_DELTA: Delta = (0, 0, 0)
+
+
+class Pending(NamedTuple):
+    """Грязная запись к flush."""
+    user: User
+    version: int  # users.version строки, от которой посчитан user
+    delta: Delta  # что изменилось с этой версии
+
+
+# (ключ группы, пачка) -> user_id, чьи строки успели поменять мимо кэша
+# (для них в БД записана только delta, а не вся строка)
+FlushFn = Callable[[str, List[Pending]], Awaitable[List[int]]]
+
+
+def _add(a: Delta, b: Delta) -> Delta:
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+
+class UserCache:
+    """
+    Write-behind кэш юзеров в памяти процесса.
+
+    - get/put — LRU по user_id, отдаются и хранятся копии, чтобы запросы
+      не видели чужие недописанные изменения; put — состояние из БД вместе
+      с версией строки (users.version). Чистая запись живёт ttl секунд с момента,
+      когда совпадала с БД, дальше get её не отдаёт — юзер перечитывается;
+    - update — изменение попадёт в БД при следующем flush, а не сразу;
+      кроме нового состояния копится delta — что изменилось явно;
+    - flush раз в flush_interval пишет все грязные записи пачкой на группу
+      (шард) и вызывается при остановке.
+
+    В БД пишут и мимо кэша — бот (оплата Stars, рефералы), скрипты, другие
+    воркеры; любая такая запись меняет users.version. Строка пишется целиком,
+    только если версия та же, иначе к ней прибавляется delta, а запись кэша
+    сбрасывается — следующий get перечитает её из БД.
+
+    Пока кэш не запущен (start), он выключен и db работает как раньше —
+    так ведут себя бот и скрипты, которым фоновый flush не нужен.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        flush_interval: float,
+        flush: FlushFn,
+        group: Callable[[int], str] = lambda user_id: "",
+        ttl: float = 1.0,
+    ):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._flush_fn = flush
+        self._group = group
+        self._users: "OrderedDict[int, User]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        # когда запись последний раз совпадала с БД (time.monotonic)
+        self._synced_at: Dict[int, float] = {}
+        self._deltas: Dict[int, Delta] = {}
+        self._dirty: Set[int] = set()
+        # грязные записи, вытесненные по LRU: живут здесь до ближайшего flush
+        self._evicted: Dict[int, User] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.enabled = False
+
+    def get(self, user_id: int) -> Optional[User]:
+        user = self._users.get(user_id)
+        if user is not None:
+            if user_id not in self._dirty and self._stale(user_id):
+                # строку могли изменить мимо кэша (бот, другие воркеры, скрипты)
+                return None
+            self._users.move_to_end(user_id)
+        else:
+            user = self._evicted.get(user_id)
+        return replace(user) if user is not None else None
+
+    def peek(self, user_id: int) -> Optional[User]:
+        """Запись, как она есть (и устаревшая): база, от которой update считает delta."""
+        user = self._users.get(user_id) or self._evicted.get(user_id)
+        return replace(user) if user is not None else None
+
+    def _stale(self, user_id: int) -> bool:
+        return time.monotonic() - self._synced_at.get(user_id, 0.0) > self.ttl
+
+    def _is_dirty(self, user_id: int) -> bool:
+        return user_id in self._dirty or user_id in self._evicted
+
+    def _store(self, user: User):
+        self._users[user.user_id] = replace(user)
+        self._users.move_to_end(user.user_id)
+        self._evicted.pop(user.user_id, None)
+
+        while len(self._users) > self.capacity:
+            old_id, old = self._users.popitem(last=False)
+            if old_id in self._dirty:
+                self._dirty.discard(old_id)
+                self._evicted[old_id] = old
+            else:
+                self._versions.pop(old_id, None)
+                self._synced_at.pop(old_id, None)
+
+    def put(self, user: User, version: int):
+        """
+        Состояние, только что прочитанное или записанное в БД. Грязную запись
+        не заменяет: её delta ещё не в БД, а старая версия при flush приведёт
+        к сложению, а не к перезаписи строки.
+        """
+        if self._is_dirty(user.user_id):
+            return
+        self._store(user)
+        self._versions[user.user_id] = version
+        self._synced_at[user.user_id] = time.monotonic()
+
+    def update(self, user: User, delta: Delta) -> bool:
+        """Изменение юзера к следующему flush. False — записи нет, писать мимо кэша."""
+        if user.user_id not in self._versions:
+            return False
+        self._deltas[user.user_id] = _add(self._deltas.get(user.user_id, NO_DELTA), delta)
+        self._store(user)
+        self._dirty.add(user.user_id)
+        return True
+
+    def patch(self, user_id: int, **fields):
+        """Меняет поля записи, не трогая грязность (для колонок, которых нет в flush)."""
+        for store in (self._users, self._evicted):
+            user = store.get(user_id)
+            if user is not None:
+                store[user_id] = replace(user, **fields)
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+        self._versions.pop(user_id, None)
+        self._synced_at.pop(user_id, None)
+        self._deltas.pop(user_id, None)
+        self._dirty.discard(user_id)
+        self._evicted.pop(user_id, None)
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty) + len(self._evicted)
+
+    def _take(self, user_ids: Set[int]) -> List[Pending]:
+        batch = []
+        for uid in user_ids:
+            user = self._evicted.pop(uid, None) or self._users[uid]
+            batch.append(Pending(user, self._versions[uid], self._deltas.pop(uid, NO_DELTA)))
+            self._dirty.discard(uid)
+        return batch
+
+    def _written(self, batch: List[Pending], merged: Set[int]):
+        for user, version, _ in batch:
+            uid = user.user_id
+            if uid in merged:
+                # в БД строка новее кэша — перечитаем при следующем get; если юзер
+                # снова изменён во время flush, остаётся старая версия, и его delta
+                # тоже сложится со строкой
+                if not self._is_dirty(uid):
+                    self.invalidate(uid)
+            elif uid not in self._users and uid not in self._evicted:
+                # вытеснен и записан
+                self._versions.pop(uid, None)
+                self._synced_at.pop(uid, None)
+            elif self._versions.get(uid) == version:
+                # версия совпала — строка в БД теперь ровно запись кэша
+                self._versions[uid] = version + 1
+                self._synced_at[uid] = time.monotonic()
+
+    def _restore(self, batch: List[Pending]):
+        for user, version, delta in batch:
+            uid = user.user_id
+            self._deltas[uid] = _add(delta, self._deltas.get(uid, NO_DELTA))
+            if uid in self._users:
+                self._dirty.add(uid)
+            else:
+                self._evicted.setdefault(uid, user)
+                self._versions.setdefault(uid, version)
+
+    async def flush(self, user_ids: Optional[Iterable[int]] = None):
+        """
+        Пишет грязные записи; с user_ids — только этих юзеров (перед транзакцией,
+        которая читает их строки из БД: несохранённое пишется отдельным commit'ом).
+        """
+        async with self._flush_lock:
+            dirty = self._dirty | set(self._evicted)
+            if user_ids is not None:
+                dirty &= set(user_ids)
+            if not dirty:
+                return
+            groups: Dict[str, List[Pending]] = defaultdict(list)
+            for pending in self._take(dirty):
+                groups[self._group(pending.user.user_id)].append(pending)
+
+            # при отмене здесь записи не возвращаются в грязные: писатель мог
+            # их уже закоммитить, и повтор прибавил бы delta второй раз
+            keys = list(groups)
+            results = await asyncio.gather(
+                *(self._flush_fn(key, groups[key]) for key in keys), return_exceptions=True
+            )
+            error = None
+            for key, result in zip(keys, results):
+                if isinstance(result, BaseException):
+                    # не потеряли: вернём в грязные, запишем в следующий раз
+                    self._restore(groups[key])
+                    error = error or result
+                else:
+                    self._written(groups[key], set(result))
+            if error is not None:
+                raise error
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ user cache flush failed: {e!r}")
+
+    async def start(self):
+        if self.capacity <= 0 or self.enabled:
+            return
+        self.enabled = True
+        # замок привязывается к циклу событий: после stop кэш можно запустить в другом
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if not self.enabled:
+            return
+        # под замком фоновый flush не оборвётся посередине записи
+        async with self._flush_lock:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        self.enabled = False
+        self._users.clear()
+        self._versions.clear()
+        self._synced_at.clear()
@@ -0,0 +1,333 @@
+import asyncio
+import contextvars
+import json
+import os
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Any, ClassVar, Dict, List, Optional, Tuple, Type
+
+from .config import DB_PATH, DURABLE_PURCHASES
+from .pool import write_conn
+
+# один запрос/ответ — одна строка JSON; пачка юзеров из flush кэша бывает большой
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+class WriterError(RuntimeError):
+    pass
+
+
+class Mutation:
+    """
+    Типизированная запись в БД. apply выполняется на соединении writer'а
+    внутри общей транзакции и не коммитит; результат должен сериализоваться
+    в JSON (его возвращает и Unix-сокет). ValueError — ошибка самой записи,
+    она откатывается одна, остальная пачка коммитится.
+    """
+
+    op: ClassVar[str] = ""
+    # apply читает, прежде чем писать: direct начинает с BEGIN IMMEDIATE, иначе
+    # повышение блокировки упрётся в SQLITE_BUSY (пачки actor так начинаются всегда)
+    immediate: ClassVar[bool] = False
+    # commit подтверждается fsync'ом (synchronous=FULL), если включён DURABLE_PURCHASES
+    durable: ClassVar[bool] = False
+
+    async def apply(self, db) -> Any:
+        raise NotImplementedError
+
+    def to_args(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_args(cls, args: Dict[str, Any]) -> "Mutation":
+        return cls(**args)
+
+
+MUTATIONS: Dict[str, Type[Mutation]] = {}
+
+
+def mutation(op: str):
+    """Регистрирует класс записи под именем op (по нему её находит сервис)."""
+
+    def register(cls: Type[Mutation]) -> Type[Mutation]:
+        cls.op = op
+        MUTATIONS[op] = cls
+        return cls
+
+    return register
+
+
+@asynccontextmanager
+async def _synchronous(db, durable: bool):
+    """
+    synchronous=FULL на время транзакции с durable-записью: в WAL + NORMAL последний
+    commit может потеряться при отключении питания, покупки подтверждаем fsync'ом.
+    """
+    if not (durable and DURABLE_PURCHASES):
+        yield
+        return
+    await db.execute("PRAGMA synchronous=FULL")
+    try:
+        yield
+    finally:
+        if db.in_transaction:
+            await db.rollback()
+        await db.execute("PRAGMA synchronous=NORMAL")
+
+
+class DirectWriter:
+    """Как раньше: каждая запись — своя транзакция и свой commit."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+
+    async def submit(self, m: Mutation) -> Any:
+        async with write_conn(self.path) as db, _synchronous(db, m.durable):
+            if m.immediate:
+                await db.execute("BEGIN IMMEDIATE")
+            result = await m.apply(db)
+            await db.commit()
+            return result
+
+    async def stop(self):
+        pass
+
+
+class WriteActor:
+    """
+    Единственный писатель процесса: записи становятся в очередь, актор
+    забирает всё накопившееся (до max_batch) и пишет одной транзакцией —
+    один commit на пачку вместо commit на запись (group commit). Каждая
+    запись в своём SAVEPOINT: ошибка одной не валит соседей.
+
+    Запускается сам при первой записи, поэтому бот, скрипты и бенчмарки
+    ничего не знают о его жизненном цикле; stop() дописывает очередь.
+    Один актор — один файл (path); у каждого шарда свой.
+    """
+
+    def __init__(self, max_batch: int, path: str = DB_PATH):
+        self.max_batch = max(1, max_batch)
+        self.path = path
+        self._queue: "asyncio.Queue[Tuple[Mutation, asyncio.Future]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._loop_ref: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self.batches = 0
+        self.mutations = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop_ref is loop:
+            return
+        # новый event loop (повторный asyncio.run) — старая очередь ему не годится
+        if self._loop_ref is not loop:
+            self._queue = asyncio.Queue()
+        self._loop_ref = loop
+        # пустой контекст: иначе задача унаследует метрики запроса, который её запустил
+        self._task = contextvars.Context().run(asyncio.ensure_future, self._run())
+
+    async def submit(self, m: Mutation) -> Any:
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((m, fut))
+        return await fut
+
+    def _take_batch(self, first) -> List[Tuple[Mutation, asyncio.Future]]:
+        batch = [first]
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _commit(self, batch: List[Tuple[Mutation, asyncio.Future]]):
+        outcomes: List[Tuple[Any, Optional[BaseException]]] = []
+        try:
+            durable = any(m.durable for m, _ in batch)
+            async with write_conn(self.path) as db, _synchronous(db, durable):
+                await db.execute("BEGIN IMMEDIATE")
+                for m, _ in batch:
+                    await db.execute("SAVEPOINT mutation")
+                    try:
+                        outcomes.append((await m.apply(db), None))
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO mutation")
+                        outcomes.append((None, e))
+                    await db.execute("RELEASE mutation")
+                await db.commit()
+        except Exception as e:
+            # не закоммитилось ничего — ошибка у всей пачки
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.batches += 1
+        self.mutations += len(batch)
+        for (_, fut), (result, error) in zip(batch, outcomes):
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+
+    async def _run(self):
+        while True:
+            batch = self._take_batch(await self._queue.get())
+            # отмена при остановке не должна рвать транзакцию посередине
+            self._inflight = asyncio.ensure_future(self._commit(batch))
+            await asyncio.shield(self._inflight)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight is not None:
+            await self._inflight
+            self._inflight = None
+        while not self._queue.empty():
+            await self._commit(self._take_batch(self._queue.get_nowait()))
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+class WriterServer:
+    """
+    Сервис записи на Unix-сокете (python -m writer.main): принимает записи
+    от воркеров API и бота и отдаёт их одному WriteActor. Протокол — строки JSON:
+    {"id", "op", "args"} -> {"id", "result"} или {"id", "error", "kind"}.
+    Ответы приходят не по порядку: клиент сопоставляет их по id.
+    """
+
+    def __init__(self, path: str, actor: WriteActor):
+        self.path = path
+        self.actor = actor
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _serve(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        response: Dict[str, Any] = {"id": request.get("id")}
+        try:
+            m = MUTATIONS[request["op"]].from_args(request["args"])
+            response["result"] = await self.actor.submit(m)
+        except ValueError as e:
+            response.update(error=str(e), kind="value")
+        except Exception as e:
+            response.update(error=repr(e), kind="internal")
+        if not writer.is_closing():
+            writer.write(_encode(response))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._serve(json.loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ValueError, ConnectionError) as e:
+            print(f"⚠️ writer client dropped: {e!r}")
+        finally:
+            # принятые записи дописываем, даже если клиент ушёл
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=LINE_LIMIT)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.actor.stop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class WriterClient:
+    """Клиент сервиса записи: одно соединение на процесс, запросы мультиплексируются по id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._seq = 0
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._loop_ref: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        loop = asyncio.get_running_loop()
+        if self._loop_ref is not loop:
+            self._loop_ref = loop
+            self._connect_lock = asyncio.Lock()
+            self._writer = None
+        async with self._connect_lock:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+                self._reader_task = contextvars.Context().run(
+                    asyncio.ensure_future, self._read_responses(reader)
+                )
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                fut = self._pending.pop(response["id"], None)
+                if fut is None or fut.done():
+                    continue
+                if "error" not in response:
+                    fut.set_result(response.get("result"))
+                elif response.get("kind") == "value":
+                    fut.set_exception(ValueError(response["error"]))
+                else:
+                    fut.set_exception(WriterError(response["error"]))
+        finally:
+            # ответов на эти запросы уже не будет: записаны они или нет, неизвестно
+            pending, self._pending = self._pending, {}
+            for fut in pending.values():
+                if not fut.done():
+                    fut.set_exception(WriterError("writer connection lost"))
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    async def submit(self, m: Mutation) -> Any:
+        writer = await self._connect()
+        self._seq += 1
+        request_id = self._seq
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = fut
+        writer.write(_encode({"id": request_id, "op": m.op, "args": m.to_args()}))
+        await writer.drain()
+        return await fut
+
+    async def stop(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+
+def create_writer(kind: str, socket_path: str, max_batch: int, path: str = DB_PATH):
+    if kind == "direct":
+        return DirectWriter(path)
+    if kind == "actor":
+        return WriteActor(max_batch, path)
+    if kind == "unix":
+        return WriterClient(socket_path)
+    raise ValueError(f"Unknown DB_WRITER: {kind}")
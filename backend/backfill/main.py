@@ -0,0 +1,47 @@
+"""
+Разовый пересчёт ачивок всех юзеров: условия, выполненные до перехода на события
+(record_progress), засчитываются задним числом. Повторный запуск безопасен —
+выданные ачивки не дублируются, сервисы можно не останавливать.
+
+    cd backend
+    python -m backfill.main
+    python -m backfill.main --concurrency 32
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from app.achievements import ensure_user_achievements_up_to_date
+from app.storage import storage
+
+
+async def backfill(concurrency: int):
+    await storage.init()
+    try:
+        user_ids = [u.user_id for u in await storage.get_all_users()]
+        granted: Counter = Counter()
+        for i in range(0, len(user_ids), concurrency):
+            batch = user_ids[i:i + concurrency]
+            for new_ids in await asyncio.gather(
+                *(ensure_user_achievements_up_to_date(user_id) for user_id in batch)
+            ):
+                granted.update(new_ids)
+            print(f"\r{min(i + concurrency, len(user_ids))}/{len(user_ids)}", end="", flush=True)
+        print()
+    finally:
+        await storage.close()
+
+    for ach_id, count in granted.most_common():
+        print(f"{ach_id:24} +{count}")
+    print(f"✅ юзеров: {len(user_ids)}, выдано ачивок: {sum(granted.values())}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=16, help="юзеров одновременно")
+    args = parser.parse_args()
+    asyncio.run(backfill(max(1, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Стоимость авторизации запроса: проверка initData (разбор query-строки, JSON
+юзера, HMAC с ключом от BOT_TOKEN) против проверки токена сессии.
+
+    cd backend
+    python -m bench.auth
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import timeit
+from urllib.parse import urlencode
+
+from app.auth import (
+    encode_session,
+    issue_session,
+    profile_version,
+    verify_init_data,
+    verify_session,
+    webapp_secret_key,
+)
+
+BOT_TOKEN = "123456:bench-token"
+
+
+def sign_init_data(user_id: int, username: str) -> str:
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps({
+            "id": user_id,
+            "first_name": "Panda",
+            "last_name": "",
+            "username": username,
+            "language_code": "ru",
+            "allows_write_to_pm": True,
+        }),
+    }
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields["hash"] = hmac.new(
+        webapp_secret_key(BOT_TOKEN), check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    return urlencode(fields)
+
+
+def verify_init_data_uncached(init_data: str):
+    """Как verify_init_data, но с выводом ключа на каждый запрос."""
+    webapp_secret_key.cache_clear()
+    return verify_init_data(init_data, bot_token=BOT_TOKEN)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=50_000)
+    args = parser.parse_args()
+
+    init_data = sign_init_data(42, "panda")
+    user = verify_init_data(init_data, bot_token=BOT_TOKEN)
+    token = encode_session(issue_session(user.user_id, profile_version(user.username)))
+    assert verify_session(token).user_id == 42
+
+    cases = {
+        "initData, key per call": lambda: verify_init_data_uncached(init_data),
+        "initData, cached key": lambda: verify_init_data(init_data, bot_token=BOT_TOKEN),
+        "session token": lambda: verify_session(token),
+    }
+    print(f"{'check':24} {'us/op':>8}")
+    for name, fn in cases.items():
+        per_op = timeit.timeit(fn, number=args.number) / args.number
+        print(f"{name:24} {per_op * 1e6:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Бенчмарк реестра бустеров на 100k активных записей:
+lookup множителя на горячем пути, добавление и снятие истёкших
+через кучу против полного прохода по словарю.
+
+    cd backend
+    python -m bench.boosters --boosters 100000
+"""
+import argparse
+import random
+import time
+import timeit
+
+from app.boosters import BOOSTER_KINDS, BoosterRegistry
+
+
+async def _no_rows(after_id: int, now: int):
+    return []
+
+
+def fill(registry: BoosterRegistry, n: int, now: int, rnd: random.Random):
+    for i in range(n):
+        registry.add(i, BOOSTER_KINDS[i % 2], 2, now + rnd.randrange(1, 3600))
+
+
+def scan_expire(active, now: int) -> int:
+    """Как было бы без кучи: пройти всех юзеров на каждом тике."""
+    removed = 0
+    for user_id in list(active):
+        kinds = active[user_id]
+        for kind in [k for k, (_, exp) in kinds.items() if exp <= now]:
+            del kinds[kind]
+            removed += 1
+        if not kinds:
+            del active[user_id]
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boosters", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=200_000)
+    parser.add_argument("--tick", type=int, default=1, help="секунд между тиками sweep")
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    now = int(time.time())
+    registry = BoosterRegistry(1.0, load=_no_rows)
+
+    t0 = time.perf_counter()
+    fill(registry, args.boosters, now, rnd)
+    add_ns = (time.perf_counter() - t0) / args.boosters * 1e9
+    print(f"active boosters: {len(registry)}")
+    print(f"add: {add_ns:.0f} ns")
+
+    ids = [rnd.randrange(args.boosters * 2) for _ in range(1024)]
+    it = iter(range(1 << 62))
+
+    def lookup():
+        registry.multiplier(ids[next(it) & 1023], "xp", now)
+
+    t = timeit.timeit(lookup, number=args.number) / args.number
+    print(f"multiplier lookup (hit/miss mix): {t * 1e9:.0f} ns")
+
+    # один тик sweep: истекает ~boosters/3600 записей
+    active_copy = {uid: dict(kinds) for uid, kinds in registry._active.items()}
+    t0 = time.perf_counter()
+    heap_removed = registry.expire(now + args.tick)
+    heap_ms = (time.perf_counter() - t0) * 1e3
+    t0 = time.perf_counter()
+    scan_removed = scan_expire(active_copy, now + args.tick)
+    scan_ms = (time.perf_counter() - t0) * 1e3
+    assert heap_removed == scan_removed, (heap_removed, scan_removed)
+    print(f"sweep tick ({heap_removed} expired): heap {heap_ms:.3f} ms, full scan {scan_ms:.3f} ms")
+
+    # весь час: все бустеры истекают, по тику в секунду
+    t0 = time.perf_counter()
+    total = heap_removed
+    for tick in range(args.tick * 2, 3601, args.tick):
+        total += registry.expire(now + tick)
+    print(f"expire all ({total}) over 1h of ticks: {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    assert len(registry) == 0
+
+
+if __name__ == "__main__":
+    main()
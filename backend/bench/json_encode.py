@@ -0,0 +1,113 @@
+"""
+Кодирование JSON-ответов API: старый путь FastAPI (jsonable_encoder +
+stdlib json) против app.fastjson. Что байты совпадают, проверяет
+tests/test_fastjson.py на тех же payloads().
+
+    cd backend
+    python -m bench.json_encode
+"""
+import argparse
+import random
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from api.main import (
+    build_course_progress,
+    build_friends,
+    build_profile,
+    build_shop,
+    build_skills,
+    build_story,
+)
+from app.achievements import achievements_payload, ACHIEVEMENTS
+from app.catalog import CATALOG, CATALOG_VERSION
+from app.course import STEP_ORDER
+from app.fastjson import dumps, orjson
+from app.models import User
+from app.shop import PANDAS
+
+def sample_user(rnd: random.Random, user_id: int) -> User:
+    return User(
+        user_id=user_id,
+        username=f"user{user_id}",
+        coins=rnd.randrange(0, 2_000_000),
+        xp=rnd.randrange(0, 50_000),
+        hourly_income=rnd.choice((10, 60, 130)),
+        level=rnd.randrange(1, 20),
+        rank_name="Мидл-арбитражник",
+        referred_by=None,
+        last_accrued_at=1_700_000_000,
+    )
+
+
+def payloads():
+    rnd = random.Random(42)
+    user = sample_user(rnd, 1)
+    owned = list(PANDAS)[:2]
+    completed = [s.id for s in STEP_ORDER[:10]]
+    rating = {
+        "items": [
+            {
+                "user_id": u.user_id,
+                "username": u.username,
+                "level": u.level,
+                "rank_name": u.rank_name,
+                "rating_score": u.xp * 2,
+            }
+            for u in (sample_user(rnd, i) for i in range(10))
+        ]
+    }
+    profile = build_profile(user, owned, 3)
+    course = build_course_progress(completed)
+    return {
+        "/profile": profile,
+        "/rating": rating,
+        "/rating/me": {"rank": 5, "total": 1000, "percentile": 99.5, "items": rating["items"]},
+        "/course/answer": {
+            "correct": True,
+            "message": "Верно! 🪙",
+            "profile": profile,
+            "course_progress": course,
+        },
+        "/shop/pandas": build_shop(user, owned),
+        "/achievements": {"items": achievements_payload(list(ACHIEVEMENTS)[:3])},
+        "/bootstrap": {
+            "catalog_version": CATALOG_VERSION,
+            "profile": profile,
+            "shop": build_shop(user, owned),
+            "course_progress": course,
+            "rating": rating,
+            "story": build_story(len(completed)),
+            "skills": build_skills(user.level),
+            "friends": build_friends(user.user_id, 4),
+        },
+        # весь контент с текстами курса — самый тяжёлый ответ
+        "/catalog": CATALOG.data,
+    }
+
+
+def legacy(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=2_000)
+    args = parser.parse_args()
+
+    cases = payloads()
+    print(f"orjson: {'on' if orjson is not None else 'not installed'}")
+
+    print(f"{'endpoint':16} {'bytes':>7} {'before, us':>11} {'after, us':>10} {'x':>6}")
+    for name, payload in cases.items():
+        number = args.number if name != "/catalog" else max(args.number // 20, 10)
+        before = timeit.timeit(lambda: legacy(payload), number=number) / number
+        after = timeit.timeit(lambda: dumps(payload), number=number) / number
+        size = len(dumps(payload))
+        print(f"{name:16} {size:7} {before * 1e6:11.1f} {after * 1e6:10.1f} {before / after:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Бенчмарк рейтинга: индексированный топ-K против старой сортировки всей таблицы.
+
+    cd backend
+    python -m bench.leaderboard --sizes 10000,100000,1000000,5000000
+
+База растёт от размера к размеру, поэтому 5M юзеров сидятся один раз.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.environ.get(
+    "BENCH_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="tp-bench-"), "bench.db")
+)
+
+from app.config import DB_PATH  # noqa: E402
+from app.db import init_db, get_top_users, get_all_users  # noqa: E402
+from app.pool import close_pool  # noqa: E402
+from app.rating import sort_users_by_rating  # noqa: E402
+
+
+def seed_users(start: int, stop: int):
+    rnd = random.Random(start)
+    conn = sqlite3.connect(DB_PATH)
+    batch = []
+    for user_id in range(start, stop):
+        coins = rnd.randrange(0, 2_000_000)
+        xp = rnd.randrange(0, 50_000)
+        income = rnd.choice((10, 60, 130, 220, 340))
+        score = xp * 2 + coins * 0.001 + income * 10
+        batch.append((user_id, f"user{user_id}", coins, xp, income, 1, "Новичок", score))
+        if len(batch) >= 50_000:
+            conn.executemany("INSERT INTO users (user_id, username, coins, xp, hourly_income, level, "
+                             "rank_name, rating_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO users (user_id, username, coins, xp, hourly_income, level, "
+                         "rank_name, rating_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+async def legacy_top(limit: int):
+    return sort_users_by_rating(await get_all_users())[:limit]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="до какого размера мерить старую сортировку (она O(N log N))")
+    args = parser.parse_args()
+
+    await init_db()
+    seeded = 0
+    print(f"{'users':>10} {'indexed top-K, ms':>18} {'legacy sort, ms':>16}")
+    for size in (int(x) for x in args.sizes.split(",")):
+        seed_users(seeded, size)
+        seeded = size
+
+        indexed = await timed(lambda: get_top_users(args.limit), args.repeat)
+        if size <= args.legacy_max:
+            legacy = f"{await timed(lambda: legacy_top(args.limit), 3):16.2f}"
+        else:
+            legacy = f"{'-':>16}"
+        print(f"{size:>10} {indexed:18.3f} {legacy}")
+
+    await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
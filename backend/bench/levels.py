@@ -0,0 +1,92 @@
+"""
+Микро-бенчмарк level_from_xp / rank_name_from_level и проверка паритета
+со старой реализацией (цикл по уровням и лесенка if/elif).
+
+    cd backend
+    python -m bench.levels
+"""
+import argparse
+import random
+import timeit
+
+from app.rating import level_from_xp, rank_name_from_level
+
+
+def legacy_level_from_xp(xp: int) -> int:
+    level = 1
+    while True:
+        required = 100 * (level + 1) ** 2
+        if xp < required:
+            return level
+        level += 1
+
+
+def legacy_rank_name_from_level(level: int) -> str:
+    if level < 3:
+        return "Новичок"
+    elif level < 5:
+        return "Джун-арбитражник"
+    elif level < 7:
+        return "Мидл-арбитражник"
+    elif level < 9:
+        return "Сеньор-арбитражник"
+    elif level < 11:
+        return "Трафик-Самурай"
+    else:
+        return "Трафик-Гуру"
+
+
+def check_parity(exhaustive_to: int, max_level: int, samples: int):
+    # все xp подряд на старте шкалы
+    for xp in range(-1000, exhaustive_to):
+        assert level_from_xp(xp) == legacy_level_from_xp(xp), xp
+
+    # границы каждого уровня: 100 * L^2 - 1, 100 * L^2, 100 * L^2 + 1
+    for level in range(2, max_level):
+        edge = 100 * level * level
+        for xp in (edge - 1, edge, edge + 1):
+            assert level_from_xp(xp) == legacy_level_from_xp(xp), xp
+
+    # случайные большие значения
+    rnd = random.Random(42)
+    top = 100 * max_level * max_level
+    for _ in range(samples):
+        xp = rnd.randrange(0, top)
+        assert level_from_xp(xp) == legacy_level_from_xp(xp), xp
+
+    for level in range(-10, 1000):
+        assert rank_name_from_level(level) == legacy_rank_name_from_level(level), level
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exhaustive-to", type=int, default=200_000)
+    parser.add_argument("--max-level", type=int, default=5_000)
+    parser.add_argument("--samples", type=int, default=2_000)
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    check_parity(args.exhaustive_to, args.max_level, args.samples)
+    print("parity: ok")
+
+    print(f"{'xp':>12} {'level':>7} {'legacy, ns':>12} {'new, ns':>10}")
+    for xp in (0, 5_000, 100_000, 1_000_000, 25_000_000, 400_000_000):
+        number = args.number if xp < 1_000_000 else max(args.number // 50, 100)
+        legacy = timeit.timeit(lambda: legacy_level_from_xp(xp), number=number) / number
+        new = timeit.timeit(lambda: level_from_xp(xp), number=args.number) / args.number
+        print(f"{xp:>12} {level_from_xp(xp):>7} {legacy * 1e9:12.0f} {new * 1e9:10.0f}")
+
+    # вызов через строку, а не lambda, и минимум повторов: иначе шум больше разницы
+    print(f"{'level':>7} {'legacy, ns':>12} {'new, ns':>10}")
+    for level in (1, 4, 8, 12, 100):
+        row = []
+        for fn in (legacy_rank_name_from_level, rank_name_from_level):
+            t = min(timeit.repeat(
+                "fn(level)", globals={"fn": fn, "level": level}, number=args.number, repeat=7
+            )) / args.number
+            row.append(t * 1e9)
+        print(f"{level:>7} {row[0]:12.0f} {row[1]:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Нагрузочный прогон API без сети: синтетическая база + настоящее FastAPI-приложение
+через httpx.ASGITransport, смесь сценариев Mini App. Результат — JSON, который
+удобно сравнивать между коммитами.
+
+    cd backend
+    python -m bench.loadtest --users 100000 --requests 20000 --concurrency 32 --out before.json
+    python -m bench.loadtest --users 100000 --requests 20000 --concurrency 32 --out after.json
+    python -m bench.loadtest --storage memory   # те же данные в памяти: чистая стоимость Python
+
+База сидится один раз на путь (--db); повторные прогоны по тому же пути её переиспользуют.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--db", default="", help="путь к базе; по умолчанию — временный файл")
+parser.add_argument("--users", type=int, default=20_000)
+parser.add_argument("--referral-rate", type=float, default=0.3, help="доля приглашённых юзеров")
+parser.add_argument("--purchase-rate", type=float, default=0.2, help="доля юзеров с пандами")
+parser.add_argument("--requests", type=int, default=5_000, help="сколько сценариев прогнать")
+parser.add_argument("--concurrency", type=int, default=16)
+parser.add_argument("--mix", default="open=0.6,answer=0.3,buy=0.1", help="веса сценариев")
+parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite",
+                    help="движок хранилища; memory загружает снимок засиженной базы")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--out", default="", help="куда записать JSON (по умолчанию stdout)")
+args = parser.parse_args()
+
+os.environ["DB_PATH"] = args.db or os.path.join(tempfile.mkdtemp(prefix="tp-load-"), "load.db")
+os.environ["STORAGE_ENGINE"] = args.storage
+# сценарии ходят от имени user_id без токенов сессии — режим локальной отладки
+os.environ.setdefault("AUTH_REQUIRED", "0")
+
+import httpx  # noqa: E402
+
+from api.main import app  # noqa: E402
+from app import metrics  # noqa: E402
+from app.config import DB_PATH  # noqa: E402
+from app.course import STEP_BITS, STEP_ORDER  # noqa: E402
+from app.db import BITMAP_PROGRESS, RATING_SCORE_SQL, init_db  # noqa: E402
+from app.pool import close_pool  # noqa: E402
+from app.rating import level_from_xp, rank_name_from_level  # noqa: E402
+from app.shop import PANDAS  # noqa: E402
+from app.storage import storage  # noqa: E402
+
+BATCH = 50_000
+
+
+def seed(users: int, referral_rate: float, purchase_rate: float, rnd: random.Random):
+    """Юзеры, граф рефералов, прогресс курса и покупки — напрямую через sqlite3."""
+    conn = sqlite3.connect(DB_PATH)
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] >= users:
+        conn.close()
+        return False
+
+    now = int(time.time())
+    panda_ids = list(PANDAS)
+    user_rows, ref_rows, step_rows, bits_rows, panda_rows = [], [], [], [], []
+
+    def flush():
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, coins, xp, hourly_income, level, "
+            "rank_name, referred_by, last_accrued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            user_rows,
+        )
+        conn.executemany("INSERT INTO referrals (inviter_id, invited_id) VALUES (?, ?)", ref_rows)
+        if BITMAP_PROGRESS:
+            conn.executemany(
+                "INSERT OR REPLACE INTO course_progress_bits (user_id, bits) VALUES (?, ?)", bits_rows
+            )
+        else:
+            conn.executemany(
+                "INSERT OR IGNORE INTO course_progress (user_id, step_id, is_completed) "
+                "VALUES (?, ?, 1)",
+                step_rows,
+            )
+        conn.executemany(
+            "INSERT OR IGNORE INTO panda_purchases (user_id, panda_id) VALUES (?, ?)", panda_rows
+        )
+        for rows in (user_rows, ref_rows, step_rows, bits_rows, panda_rows):
+            rows.clear()
+
+    for user_id in range(1, users + 1):
+        # прогресс: у большинства пара дней, у немногих — весь курс
+        done = min(len(STEP_ORDER), int(rnd.expovariate(1 / 6)))
+        xp = sum(s.reward_xp for s in STEP_ORDER[:done])
+        coins = sum(s.reward_coins for s in STEP_ORDER[:done]) + rnd.randrange(0, 300_000)
+        income = 10
+        if rnd.random() < purchase_rate:
+            for panda_id in rnd.sample(panda_ids, rnd.randint(1, len(panda_ids))):
+                panda_rows.append((user_id, panda_id))
+                income += PANDAS[panda_id].income_bonus
+        inviter = None
+        if user_id > 1 and rnd.random() < referral_rate:
+            # предпочтительное присоединение: у ранних юзеров больше рефералов
+            inviter = int(user_id * rnd.random() ** 2) or 1
+            ref_rows.append((inviter, user_id))
+        level = level_from_xp(xp)
+        user_rows.append(
+            (user_id, f"user{user_id}", coins, xp, income, level, rank_name_from_level(level),
+             inviter, now - rnd.randrange(0, 86_400))
+        )
+        steps = [s.id for s in STEP_ORDER[:done]]
+        if BITMAP_PROGRESS:
+            bits = 0
+            for step_id in steps:
+                bits |= 1 << STEP_BITS[step_id]
+            bits_rows.append((user_id, bits))
+        else:
+            step_rows.extend((user_id, step_id) for step_id in steps)
+        if len(user_rows) >= BATCH:
+            flush()
+    flush()
+    conn.execute(f"UPDATE users SET rating_score = {RATING_SCORE_SQL}")
+    conn.execute(
+        "UPDATE users SET referrals_count = "
+        "(SELECT COUNT(*) FROM referrals r WHERE r.inviter_id = users.user_id)"
+    )
+    conn.commit()
+    conn.close()
+    return True
+
+
+class Recorder:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kw):
+        t0 = time.perf_counter()
+        r = await client.request(method, url, **kw)
+        self.latency[f"{method} {route}"].append(time.perf_counter() - t0)
+        self.status[f"{method} {route}"][r.status_code] += 1
+        return r
+
+
+async def scenario_open(client, rec: Recorder, rnd: random.Random, user_id: int, catalog: dict):
+    """Открытие Mini App: bootstrap и перепроверка каталога по ETag."""
+    r = await rec.call(client, "/bootstrap/{user_id}", "GET", f"/bootstrap/{user_id}")
+    headers = {"If-None-Match": catalog["etag"]} if catalog.get("etag") else {}
+    await rec.call(client, "/catalog", "GET", "/catalog", params={"v": catalog["version"]},
+                   headers=headers)
+    return r.json()
+
+
+async def scenario_answer(client, rec: Recorder, rnd: random.Random, user_id: int, catalog: dict):
+    """Открытие и ответ на следующий шаг курса (70% ответов верные)."""
+    boot = await scenario_open(client, rec, rnd, user_id, catalog)
+    step_id = boot["course_progress"]["next_step_id"]
+    if step_id is None:
+        return
+    correct = catalog["answers"][step_id]
+    answer = correct if rnd.random() < 0.7 else (correct + 1) % 3
+    await rec.call(client, "/course/answer", "POST", "/course/answer",
+                   json={"user_id": user_id, "step_id": step_id, "answer_index": answer})
+
+
+async def scenario_buy(client, rec: Recorder, rnd: random.Random, user_id: int, catalog: dict):
+    """Открытие и покупка случайной панды (часть покупок законно падает с 400)."""
+    await scenario_open(client, rec, rnd, user_id, catalog)
+    await rec.call(client, "/shop/buy", "POST", "/shop/buy",
+                   json={"user_id": user_id, "panda_id": rnd.choice(list(PANDAS))})
+
+
+SCENARIOS = {"open": scenario_open, "answer": scenario_answer, "buy": scenario_buy}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    idx = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+
+def _mean(h) -> float:
+    return round(h.sum / h.count, 2) if h is not None and h.count else None
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def run() -> dict:
+    rnd = random.Random(args.seed)
+    await init_db()
+    t0 = time.perf_counter()
+    seeded = seed(args.users, args.referral_rate, args.purchase_rate, rnd)
+    seed_seconds = time.perf_counter() - t0
+    if args.storage == "memory":
+        storage.load_sqlite(DB_PATH)
+
+    mix = {}
+    for part in args.mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario: {name}")
+        mix[name] = float(weight)
+    names, weights = list(mix), list(mix.values())
+    plan = [
+        (rnd.choices(names, weights)[0], rnd.randint(1, args.users), random.Random(rnd.random()))
+        for _ in range(args.requests)
+    ]
+
+    rec = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            r = await client.get("/catalog")
+            catalog = {
+                "version": r.json()["version"],
+                "etag": r.headers.get("etag"),
+                "answers": {s.id: s.correct_index for s in STEP_ORDER},
+            }
+            # счётчики метрик — только по самому прогону
+            for table in (metrics.route_latency, metrics.route_db_calls,
+                          metrics.route_db_seconds, metrics.route_connections):
+                table.clear()
+
+            queue: "asyncio.Queue" = asyncio.Queue()
+            for item in plan:
+                queue.put_nowait(item)
+
+            async def worker():
+                while not queue.empty():
+                    name, user_id, wrnd = queue.get_nowait()
+                    await SCENARIOS[name](client, rec, wrnd, user_id, catalog)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+
+    await close_pool()
+
+    endpoints = {}
+    for key, samples in sorted(rec.latency.items()):
+        samples.sort()
+        method, route = key.split(" ", 1)
+        db = metrics.route_db_calls.get((method, route))
+        conns = metrics.route_connections.get((method, route))
+        endpoints[key] = {
+            "requests": len(samples),
+            "status": dict(rec.status[key]),
+            "throughput_rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 50) * 1e3, 3),
+            "p95_ms": round(percentile(samples, 95) * 1e3, 3),
+            "p99_ms": round(percentile(samples, 99) * 1e3, 3),
+            "mean_ms": round(sum(samples) / len(samples) * 1e3, 3),
+            "db_calls_per_request": _mean(db),
+            "connections_per_request": _mean(conns),
+        }
+
+    total = sum(len(s) for s in rec.latency.values())
+    return {
+        "config": {
+            "users": args.users,
+            "referral_rate": args.referral_rate,
+            "purchase_rate": args.purchase_rate,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "seed": args.seed,
+            "storage": args.storage,
+            "course_progress_storage": "bitmap" if BITMAP_PROGRESS else "rows",
+            "user_cache_size": int(os.environ.get("USER_CACHE_SIZE", "50000")),
+        },
+        "env": {
+            "git": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "seed_seconds": round(seed_seconds, 2) if seeded else None,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    # stdout — только под JSON: служебные print приложения уходят в stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        result = asyncio.run(run())
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
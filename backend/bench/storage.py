@@ -0,0 +1,125 @@
+"""
+Сколько в операциях хранилища стоит сама БД, а сколько — Python вокруг неё:
+одни и те же вызовы app.storage на SQLite и на движке в памяти, на одних данных
+(memory загружается снимком того же файла).
+
+    cd backend
+    python -m bench.storage --users 100000 --number 5000
+    python -m bench.storage --concurrency 32   # с group commit писателя
+
+memory — нижняя граница: модели, начисление дохода, рейтинг, копии юзеров.
+Разница со sqlite — SQL, aiosqlite-поток, пул и commit'ы.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=50_000)
+parser.add_argument("--number", type=int, default=3_000, help="вызовов на операцию")
+parser.add_argument("--concurrency", type=int, default=1)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="tp-storage-"), "bench.db")
+# кэш юзеров — отдельная оптимизация sqlite; здесь сравниваем сами движки
+os.environ.setdefault("USER_CACHE_SIZE", "0")
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+from app.config import DB_PATH  # noqa: E402
+from app.course import STEP_ORDER  # noqa: E402
+from app.db import RATING_SCORE_SQL  # noqa: E402
+from app.memory_storage import MemoryStorage  # noqa: E402
+from app.rating import level_from_xp, rank_name_from_level  # noqa: E402
+from app.shop import PANDAS  # noqa: E402
+from app.sqlite_storage import SQLiteStorage  # noqa: E402
+from app.storage import Storage  # noqa: E402
+
+Op = Callable[[Storage, random.Random], Awaitable[object]]
+
+
+def seed(users: int, rnd: random.Random):
+    conn = sqlite3.connect(DB_PATH)
+    now = int(time.time())
+    rows = []
+    for user_id in range(1, users + 1):
+        xp = rnd.randrange(0, 5_000)
+        level = level_from_xp(xp)
+        rows.append((user_id, f"user{user_id}", rnd.randrange(0, 300_000), xp, 10, level,
+                     rank_name_from_level(level), now))
+    conn.executemany(
+        "INSERT INTO users (user_id, username, coins, xp, hourly_income, level, rank_name, "
+        "last_accrued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute(f"UPDATE users SET rating_score = {RATING_SCORE_SQL}")
+    conn.commit()
+    conn.close()
+
+
+def make_ops(users: int) -> Dict[str, Op]:
+    step_ids = [s.id for s in STEP_ORDER]
+    panda_ids = list(PANDAS)
+
+    def uid(rnd: random.Random) -> int:
+        return rnd.randint(1, users)
+
+    async def update_user(s: Storage, rnd: random.Random):
+        user = await s.get_user(uid(rnd))
+        user.coins += 1
+        await s.update_user(user)
+
+    async def buy(s: Storage, rnd: random.Random):
+        try:
+            await s.apply_purchase(uid(rnd), price=1, panda_id=rnd.choice(panda_ids), ignore_owned=True)
+        except ValueError:
+            pass
+
+    return {
+        "get_user": lambda s, rnd: s.get_user(uid(rnd)),
+        "get_user_snapshot": lambda s, rnd: s.get_user_snapshot(uid(rnd)),
+        "get_top_users(100)": lambda s, rnd: s.get_top_users(100),
+        "get_rating_neighbourhood": lambda s, rnd: s.get_rating_neighbourhood(uid(rnd), 5),
+        "update_user": update_user,
+        "mark_step_completed": lambda s, rnd: s.mark_step_completed(uid(rnd), rnd.choice(step_ids)),
+        "apply_purchase": buy,
+    }
+
+
+async def measure(s: Storage, op: Op, number: int, concurrency: int, seed: int) -> float:
+    """Среднее время на вызов (мкс) по стенке: при concurrency > 1 — с учётом параллельности."""
+    per_worker = max(1, number // concurrency)
+
+    async def worker(rnd: random.Random):
+        for _ in range(per_worker):
+            await op(s, rnd)
+
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(rnd.random())) for _ in range(concurrency)))
+    return (time.perf_counter() - started) / (per_worker * concurrency) * 1e6
+
+
+async def run():
+    sqlite_engine = SQLiteStorage()
+    await sqlite_engine.init()
+    seed(args.users, random.Random(args.seed))
+    memory_engine = MemoryStorage()
+    memory_engine.load_sqlite(DB_PATH)
+
+    print(f"users={args.users} number={args.number} concurrency={args.concurrency}")
+    print(f"{'op':26} {'sqlite us':>10} {'memory us':>10} {'db share':>9}")
+    for name, op in make_ops(args.users).items():
+        sql = await measure(sqlite_engine, op, args.number, args.concurrency, args.seed)
+        mem = await measure(memory_engine, op, args.number, args.concurrency, args.seed)
+        print(f"{name:26} {sql:10.1f} {mem:10.1f} {1 - mem / sql:9.0%}")
+    await sqlite_engine.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,91 @@
+"""
+Бенчмарк индексов разблокировки навыков и глав на большом каталоге
+из файлов (CONTENT_DIR) и проверка паритета со старой фильтрацией.
+
+    cd backend
+    python -m bench.unlocks --skills 20000 --chapters 5000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import timeit
+
+
+def write_content(path: str, skills: int, chapters: int, seed: int = 42):
+    rnd = random.Random(seed)
+    with open(os.path.join(path, "skills.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {
+                    "id": f"skill_{i}",
+                    "branch": rnd.choice(["analytics", "creative", "traffic", "panda"]),
+                    "name": f"Skill {i}",
+                    "description": "Навык из большого дерева.",
+                    "level_required": rnd.randrange(1, 200),
+                    "order": i,
+                }
+                for i in range(skills)
+            ],
+            f,
+            ensure_ascii=False,
+        )
+    with open(os.path.join(path, "story.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {"id": f"ch{i}", "day": i + 1, "title": f"Глава {i + 1}", "text": "Текст главы."}
+                for i in range(chapters)
+            ],
+            f,
+            ensure_ascii=False,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--skills", type=int, default=20_000)
+    parser.add_argument("--chapters", type=int, default=5_000)
+    parser.add_argument("--number", type=int, default=2_000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    write_content(tmp, args.skills, args.chapters)
+    # контент читается при импорте, поэтому CONTENT_DIR задаём до него
+    os.environ["CONTENT_DIR"] = tmp
+
+    from app.catalog import SKILL_UNLOCKS, STORY_UNLOCKS, encode
+    from app.skills import SKILLS, unlocked_skills_count
+    from app.storyline import CHAPTERS, unlocked_chapters_count
+
+    def legacy_skills(level):
+        return [s for s in SKILLS.values() if level >= s.level_required]
+
+    def legacy_story(count):
+        day = max(1, count // 3 + 1)
+        return sorted((c for c in CHAPTERS.values() if c.day <= day), key=lambda c: c.day)
+
+    assert len(SKILLS) == args.skills and len(CHAPTERS) == args.chapters
+    for level in range(0, 210):
+        k = unlocked_skills_count(level)
+        assert sorted(SKILL_UNLOCKS.ids[:k]) == sorted(s.id for s in legacy_skills(level)), level
+        assert SKILL_UNLOCKS.body(k) == encode(SKILL_UNLOCKS.data(k)), level
+    for count in range(0, args.chapters * 3 + 10, 7):
+        k = unlocked_chapters_count(count)
+        assert STORY_UNLOCKS.ids[:k] == [c.id for c in legacy_story(count)], count
+    print("parity: ok")
+
+    level, count = 100, args.chapters * 3 // 2
+    cases = [
+        ("skills legacy (filter + encode)", lambda: encode({"items": [s.id for s in legacy_skills(level)]})),
+        ("skills index (bisect + slice)", lambda: SKILL_UNLOCKS.body(unlocked_skills_count(level))),
+        ("story legacy (filter + sort + encode)", lambda: encode({"items": [c.id for c in legacy_story(count)]})),
+        ("story index (bisect + slice)", lambda: STORY_UNLOCKS.body(unlocked_chapters_count(count))),
+    ]
+    for name, fn in cases:
+        t = timeit.timeit(fn, number=args.number) / args.number
+        print(f"{name:40} {t * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
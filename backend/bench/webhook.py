@@ -0,0 +1,275 @@
+"""
+Вебхук бота против локального фейкового Bot API: пачка /start и /menu от
+множества чатов, проверка секрета, порядка ответов внутри чата и пропускной
+способности при заданной задержке Telegram.
+
+    cd backend
+    python -m bench.webhook --chats 500 --messages 6 --workers 1 --api-latency-ms 30
+    python -m bench.webhook --chats 500 --messages 6 --workers 32 --api-latency-ms 30
+    python -m bench.webhook --mode api   # тот же эндпоинт внутри FastAPI
+
+Фейковый Bot API — aiohttp-сервер на 127.0.0.1: отвечает ok на любой метод,
+запоминает sendMessage по чатам и спит --api-latency-ms на каждом вызове.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--mode", choices=("standalone", "api"), default="standalone")
+parser.add_argument("--chats", type=int, default=300)
+parser.add_argument("--messages", type=int, default=5, help="апдейтов на чат")
+parser.add_argument("--referral-rate", type=float, default=0.5)
+parser.add_argument("--workers", type=int, default=16)
+parser.add_argument("--max-pending", type=int, default=1000)
+parser.add_argument("--senders", type=int, default=40, help="параллельных доставок (max_connections)")
+parser.add_argument("--api-latency-ms", type=float, default=20.0)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+TOKEN = "123456:BENCH-token"
+SECRET = "bench-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+API_PORT = free_port()
+WEBHOOK_PORT = free_port()
+os.environ.update(
+    DB_PATH=os.path.join(tempfile.mkdtemp(prefix="tp-webhook-"), "bench.db"),
+    BOT_TOKEN=TOKEN,
+    TELEGRAM_API_URL=f"http://127.0.0.1:{API_PORT}",
+    WEBHOOK_URL="https://bench.local/telegram/webhook",
+    WEBHOOK_SECRET=SECRET,
+    WEBHOOK_WORKERS=str(args.workers),
+    WEBHOOK_MAX_PENDING=str(args.max_pending),
+    WEBHOOK_IN_API="1" if args.mode == "api" else "0",
+)
+
+import aiohttp  # noqa: E402
+import httpx  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from bot.main import create_webhook_server  # noqa: E402
+from bot.webhook import SECRET_HEADER, run_standalone  # noqa: E402
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float, expected: int):
+        self.latency = latency
+        self.expected = expected
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.sent: Dict[int, List[str]] = defaultdict(list)
+        self.done = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+        self._message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = True
+        if method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            self.sent[chat_id].append(data["text"])
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data["text"],
+            }
+            if sum(len(v) for v in self.sent.values()) >= self.expected:
+                self.done.set()
+        elif method == "setWebhook":
+            assert data["secret_token"] == SECRET
+            self.webhook_set.set()
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+        return runner
+
+
+def make_updates(rnd: random.Random) -> Dict[int, List[dict]]:
+    """По чату — список апдейтов; первый всегда /start (иногда с рефералом)."""
+    chats: Dict[int, List[dict]] = {}
+    update_id = 0
+    for n in range(args.chats):
+        chat_id = 1_000_000 + n
+        updates = []
+        for i in range(args.messages):
+            if i == 0:
+                text = "/start"
+                if n and rnd.random() < args.referral_rate:
+                    text += f" {1_000_000 + rnd.randrange(n)}"
+            else:
+                text = rnd.choice(("/start", "/menu"))
+            update_id += 1
+            updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": i + 1,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": f"U{n}",
+                             "username": f"user{n}"},
+                    "text": text,
+                    "entities": [{"type": "bot_command", "offset": 0,
+                                  "length": len(text.split()[0])}],
+                },
+            })
+        chats[chat_id] = updates
+    return chats
+
+
+def expected_replies(updates: List[dict]) -> List[str]:
+    return ["start" if u["message"]["text"].startswith("/start") else "menu" for u in updates]
+
+
+def reply_kind(text: str) -> str:
+    return "start" if text.startswith("🐼 Привет") else "menu"
+
+
+# (body, secret) -> HTTP-статус
+Post = Callable[[bytes, str], Awaitable[int]]
+
+
+async def deliver(post: Post, chats: Dict[int, List[dict]]) -> List[float]:
+    """Как Telegram: апдейты одного чата — по очереди, чаты — параллельно (--senders)."""
+    queue: "asyncio.Queue" = asyncio.Queue()
+    for updates in chats.values():
+        queue.put_nowait(updates)
+    acks: List[float] = []
+
+    async def sender():
+        while not queue.empty():
+            for update in queue.get_nowait():
+                t0 = time.perf_counter()
+                status = await post(json.dumps(update).encode(), SECRET)
+                acks.append(time.perf_counter() - t0)
+                assert status == 200, status
+
+    await asyncio.gather(*(sender() for _ in range(args.senders)))
+    return acks
+
+
+async def check_rejects(post: Post):
+    assert await post(b'{"update_id": 1}', "wrong") == 401
+    assert await post(b'{"update_id": 1}', "") == 401
+    assert await post(b"{not json", SECRET) == 400
+
+
+async def run():
+    rnd = random.Random(args.seed)
+    chats = make_updates(rnd)
+    total = sum(len(u) for u in chats.values())
+    fake = FakeBotAPI(args.api_latency_ms / 1000, total)
+    fake_runner = await fake.start()
+
+    if args.mode == "api":
+        from api.main import app, webhook
+
+        # ASGI напрямую, без сети
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        close_client = client.aclose
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        server_task = None
+
+        async def post(body: bytes, secret: str) -> int:
+            headers = {SECRET_HEADER: secret} if secret else {}
+            r = await client.post(webhook.path, content=body, headers=headers)
+            return r.status_code
+    else:
+        server = create_webhook_server()
+        server_task = asyncio.create_task(run_standalone(server, "127.0.0.1", WEBHOOK_PORT))
+        await fake.webhook_set.wait()
+        # httpx с десятками параллельных запросов сам становится узким местом — берём aiohttp
+        client = aiohttp.ClientSession(
+            f"http://127.0.0.1:{WEBHOOK_PORT}",
+            connector=aiohttp.TCPConnector(limit=args.senders),
+        )
+        close_client = client.close
+
+        async def post(body: bytes, secret: str) -> int:
+            headers = {SECRET_HEADER: secret} if secret else {}
+            for _ in range(100):
+                try:
+                    async with client.post(server.path, data=body, headers=headers) as r:
+                        return r.status
+                except aiohttp.ClientConnectorError:
+                    # сайт поднимается после setWebhook
+                    await asyncio.sleep(0.05)
+            raise RuntimeError("webhook server did not start")
+
+    await check_rejects(post)
+    started = time.perf_counter()
+    acks = await deliver(post, chats)
+    delivered = time.perf_counter() - started
+    await asyncio.wait_for(fake.done.wait(), timeout=max(60.0, total * args.api_latency_ms / 1000))
+    elapsed = time.perf_counter() - started
+
+    await close_client()
+    if server_task is not None:
+        server_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await server_task
+    else:
+        await lifespan.__aexit__(None, None, None)
+    await fake_runner.cleanup()
+
+    disordered = [
+        chat_id for chat_id, updates in chats.items()
+        if [reply_kind(t) for t in fake.sent[chat_id]] != expected_replies(updates)
+    ]
+    acks.sort()
+    return {
+        "updates": total,
+        "replies": sum(len(v) for v in fake.sent.values()),
+        "disordered_chats": len(disordered),
+        "delivered_s": delivered,
+        "elapsed_s": elapsed,
+        "ack_p50_ms": acks[len(acks) // 2] * 1e3,
+        "ack_p99_ms": acks[int(len(acks) * 0.99) - 1] * 1e3,
+        "calls": dict(fake.calls),
+    }
+
+
+def main():
+    # служебные print бота и API — в stderr, итог — в stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        r = asyncio.run(run())
+    print(f"mode={args.mode} workers={args.workers} senders={args.senders} "
+          f"api_latency={args.api_latency_ms}ms")
+    print(f"updates: {r['updates']}, replies: {r['replies']}, "
+          f"chats with replies out of order: {r['disordered_chats']}")
+    print(f"all acked in {r['delivered_s']:.2f}s (ack p50 {r['ack_p50_ms']:.2f}ms, "
+          f"p99 {r['ack_p99_ms']:.2f}ms)")
+    print(f"all answered in {r['elapsed_s']:.2f}s -> {r['updates'] / r['elapsed_s']:.0f} updates/s")
+    print(f"bot api calls: {r['calls']}")
+    if r["disordered_chats"] or r["replies"] != r["updates"]:
+        raise SystemExit("FAILED: per-chat ordering or reply count mismatch")
+
+
+if __name__ == "__main__":
+    main()
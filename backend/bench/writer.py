@@ -0,0 +1,202 @@
+"""
+Смешанная нагрузка чтение/запись из нескольких процессов на один файл SQLite:
+каждый процесс пишет сам (direct — commit на запись; actor — group commit
+внутри процесса) против общего сервиса записи (unix, python -m writer.main).
+С --shards — то же на DB_SHARDS файлах: у каждого шарда свой писатель и своя
+блокировка записи, так что пропускная способность записи растёт с числом шардов
+(пока хватает ядер и диска).
+
+    cd backend
+    python -m bench.writer --procs 1,2,4,8 --seconds 5
+    python -m bench.writer --modes unix --procs 8 --write-ratio 0.8
+    python -m bench.writer --modes direct,unix --procs 4 --shards 1,2,4,8 --write-ratio 1 --durable
+
+Процессы — как воркеры uvicorn: у каждого свой пул читателей, кэш юзеров выключен.
+"""
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def worker_main(env: dict, args: argparse.Namespace, seed: int, start, out):
+    # переменные окружения — до импорта app.config
+    os.environ.update(env)
+    out.put(asyncio.run(worker(args, seed, start)))
+
+
+async def worker(args: argparse.Namespace, seed: int, start) -> dict:
+    from app.course import STEP_ORDER
+    from app.db import (
+        SHARDS,
+        add_panda_purchase,
+        apply_purchase,
+        get_user,
+        mark_step_completed,
+        stop_writers,
+        update_user,
+    )
+    from app.pool import close_pool, open_pool
+    from app.shop import PANDAS
+
+    for path in SHARDS:
+        await open_pool(path)
+    step_ids = [s.id for s in STEP_ORDER]
+    panda_ids = list(PANDAS)
+    stats = {"reads": 0, "writes": 0, "errors": 0, "write_seconds": 0.0}
+
+    async def client(rnd: random.Random, deadline: float):
+        while time.perf_counter() < deadline:
+            user_id = rnd.randint(1, args.users)
+            try:
+                if rnd.random() >= args.write_ratio:
+                    await get_user(user_id)
+                    stats["reads"] += 1
+                    continue
+                t0 = time.perf_counter()
+                op = rnd.random()
+                if args.durable:
+                    await apply_purchase(user_id, coins=1, panda_id=rnd.choice(panda_ids), ignore_owned=True)
+                elif op < 0.6:
+                    user = await get_user(user_id)
+                    user.coins += 1
+                    await update_user(user)
+                elif op < 0.9:
+                    await mark_step_completed(user_id, rnd.choice(step_ids))
+                else:
+                    await add_panda_purchase(user_id, rnd.choice(panda_ids))
+                stats["write_seconds"] += time.perf_counter() - t0
+                stats["writes"] += 1
+            except sqlite3.OperationalError:
+                # database is locked после busy_timeout
+                stats["errors"] += 1
+
+    rnd = random.Random(seed)
+    start.wait()
+    deadline = time.perf_counter() + args.seconds
+    await asyncio.gather(*(client(random.Random(rnd.random()), deadline) for _ in range(args.concurrency)))
+    await stop_writers()
+    await close_pool()
+    return stats
+
+
+def seed_db(path: str, shards: int, users: int):
+    from app.db import init_db
+    from app.pool import close_pool
+    from app.shards import shard_index, shard_paths
+
+    paths = shard_paths(path, shards)
+
+    async def create():
+        await init_db(paths)
+        await close_pool()
+
+    asyncio.run(create())
+    now = int(time.time())
+    for index, shard_path in enumerate(paths):
+        conn = sqlite3.connect(shard_path)
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, username, coins, xp, hourly_income, level, "
+            "rank_name, last_accrued_at) VALUES (?, ?, 0, 0, 10, 1, 'Новичок', ?)",
+            (
+                (i, f"user{i}", now)
+                for i in range(1, users + 1)
+                if shard_index(i, len(paths)) == index
+            ),
+        )
+        conn.commit()
+        conn.close()
+
+
+def run(
+    mode: str, procs: int, shards: int, args: argparse.Namespace, db_path: str, socket_path: str
+) -> dict:
+    from app.shards import shard_paths
+
+    env = {
+        "DB_PATH": db_path,
+        "DB_SHARDS": str(shards),
+        "DB_WRITER": mode,
+        "DB_WRITER_SOCKET": socket_path,
+        "USER_CACHE_SIZE": "0",
+        "METRICS_ENABLED": "0",
+    }
+    service = None
+    if mode == "unix":
+        service = subprocess.Popen(
+            [sys.executable, "-m", "writer.main"],
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+        )
+        while not all(os.path.exists(p) for p in shard_paths(socket_path, shards)):
+            time.sleep(0.05)
+
+    ctx = mp.get_context("spawn")
+    start, out = ctx.Event(), ctx.Queue()
+    workers = [
+        ctx.Process(target=worker_main, args=(env, args, args.seed + i, start, out))
+        for i in range(procs)
+    ]
+    for w in workers:
+        w.start()
+    time.sleep(1.0)  # импорт и открытие пулов — вне замера
+    start.set()
+    results = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+    if service is not None:
+        service.send_signal(signal.SIGINT)
+        service.wait()
+
+    total = {k: sum(r[k] for r in results) for k in results[0]}
+    return {
+        "ops_per_s": (total["reads"] + total["writes"]) / args.seconds,
+        "writes_per_s": total["writes"] / args.seconds,
+        "write_ms": 1e3 * total["write_seconds"] / max(total["writes"], 1),
+        "errors": total["errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="direct,actor,unix")
+    parser.add_argument("--procs", default="1,2,4,8", help="числа процессов через запятую")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=16, help="корутин на процесс")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--shards", default="1", help="числа шардов через запятую")
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    parser.add_argument(
+        "--durable", action="store_true",
+        help="все записи — apply_purchase: транзакция с fsync (synchronous=FULL) под блокировкой записи",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="tp-writer-")
+    socket_path = os.path.join(tmp, "writer.sock")
+    shard_counts = [int(n) for n in args.shards.split(",")]
+    # свой набор файлов на каждое число шардов, юзеры разложены по app.shards
+    db_paths = {n: os.path.join(tmp, f"bench-{n}.db") for n in shard_counts}
+    for n, db_path in db_paths.items():
+        seed_db(db_path, n, args.users)
+
+    print(f"{'mode':7} {'procs':>5} {'shards':>6} {'ops/s':>9} {'writes/s':>9} "
+          f"{'write ms':>9} {'locked':>7}")
+    for mode in args.modes.split(","):
+        for procs in (int(p) for p in args.procs.split(",")):
+            for shards in shard_counts:
+                r = run(mode, procs, shards, args, db_paths[shards], socket_path)
+                print(f"{mode:7} {procs:5} {shards:6} {r['ops_per_s']:9.0f} "
+                      f"{r['writes_per_s']:9.0f} {r['write_ms']:9.2f} {r['errors']:7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,48 @@
 import asyncio
+import logging
 from typing import Optional
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.types import (
     Message,
+    PreCheckoutQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     WebAppInfo,
 )
 from aiogram.filters import CommandStart, Command
 
-from app.config import BOT_TOKEN, BOT_USERNAME, WEBAPP_URL
-from app.db import (
-    get_user,
-    set_user_referred_by,
-    add_referral,
-    reward_user_for_referral,
+from app.config import (
+    BOT_TOKEN,
+    BOT_USERNAME,
+    WEBAPP_URL,
+    TELEGRAM_API_URL,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_MAX_PENDING,
 )
+from app.storage import boosters, storage
+from app.achievements import record_progress
+from app.fulfilment import fulfil
+from app.stars import PRODUCTS
+from app.referrals import referral_writer
 from app.rating import level_from_xp, rank_name_from_level
+from bot.webhook import WebhookServer, check_webhook_secret, run_standalone
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_FAILED_MESSAGE = (
+    "⚠️ Оплата получена, но покупку пока не удалось выдать. Она не потеряется: "
+    "если не появится в течение нескольких минут, напиши в поддержку.\n"
+    "Код платежа: <code>{charge_id}</code>"
+)
 
 
 def main_menu_kb() -> InlineKeyboardMarkup:
@@ -44,13 +67,11 @@ async def handle_start(message: Message):
         except ValueError:
             ref_id = None
 
-    user = await get_user(message.from_user.id, message.from_user.username)
+    user = await storage.get_user(message.from_user.id, message.from_user.username)
 
-    # Реферальная логика
+    # Реферальная логика: запись, награда и ачивки — пачкой в фоне (app.referrals)
     if ref_id and ref_id != user.user_id and not user.referred_by:
-        await set_user_referred_by(user.user_id, ref_id)
-        await add_referral(ref_id, user.user_id)
-        await reward_user_for_referral(ref_id)
+        referral_writer.submit(ref_id, user.user_id)
 
     text = (
         f"🐼 Привет, {message.from_user.full_name}!\n\n"
@@ -67,7 +88,7 @@ async def handle_start(message: Message):
 
 
 async def handle_menu(message: Message):
-    user = await get_user(message.from_user.id, message.from_user.username)
+    user = await storage.get_user(message.from_user.id, message.from_user.username)
     text = (
         f"🐼 Твой профиль:\n\n"
         f"Статус: <b>{user.rank_name}</b>\n"
@@ -80,19 +101,109 @@ async def handle_menu(message: Message):
     await message.answer(text, reply_markup=main_menu_kb())
 
 
-async def main():
-    if not BOT_TOKEN:
-        raise RuntimeError("BOT_TOKEN is not set in .env")
-
-    bot = Bot(
+async def handle_pre_checkout(query: PreCheckoutQuery):
+    # invoice_payload = id продукта из app.stars.PRODUCTS
+    if query.invoice_payload in PRODUCTS:
+        await query.answer(ok=True)
+    else:
+        await query.answer(ok=False, error_message="Товар не найден")
+
+
+async def handle_successful_payment(message: Message):
+    payment = message.successful_payment
+    await storage.get_user(message.from_user.id, message.from_user.username)
+
+    # Telegram может доставить successful_payment повторно —
+    # charge_id делает выдачу идемпотентной
+    charge_id = payment.telegram_payment_charge_id
+    try:
+        user, msg, replayed = await fulfil(
+            message.from_user.id,
+            payment.invoice_payload,
+            charge_id=charge_id,
+        )
+    except ValueError as e:
+        # продукта нет в каталоге — повтор доставки не поможет, звёзды уже списаны
+        logger.error("payment %s (%s) not fulfilled: %s", charge_id, payment.invoice_payload, e)
+        await message.answer(PAYMENT_FAILED_MESSAGE.format(charge_id=charge_id))
+        return
+    except Exception:
+        await message.answer(PAYMENT_FAILED_MESSAGE.format(charge_id=charge_id))
+        # вебхук ответит Telegram ошибкой, и платёж придёт снова (bot.webhook)
+        raise
+
+    if not replayed:
+        # те же счётчики, что и у покупки через API: панда за Stars считается в pandas_owned
+        await record_progress(
+            user.user_id,
+            level=user.level,
+            pandas_owned=len(await storage.get_user_pandas(user.user_id)),
+        )
+    await message.answer(msg)
+
+
+def create_bot(api_url: str = TELEGRAM_API_URL) -> Bot:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    return Bot(
         BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
+
+
+def create_dispatcher(own_pool: bool = True) -> Dispatcher:
+    """
+    own_pool=False — бот живёт внутри API (WEBHOOK_IN_API): пулом соединений,
+    кэшем юзеров и реестром бустеров управляет lifespan FastAPI.
+    """
     dp = Dispatcher()
 
+    # пул соединений к БД живёт вместе с диспетчером; реестр бустеров — чтобы
+    # доход в ответах бота считался с бустером монет, как в API
+    if own_pool:
+        dp.startup.register(storage.init)
+        dp.startup.register(boosters.start)
+    dp.startup.register(referral_writer.start)
+    # очередь рефералов дописывается до закрытия пула
+    dp.shutdown.register(referral_writer.stop)
+    if own_pool:
+        dp.shutdown.register(boosters.stop)
+        dp.shutdown.register(storage.close)
+
     dp.message.register(handle_start, CommandStart())
     dp.message.register(handle_menu, Command("menu"))
+    dp.pre_checkout_query.register(handle_pre_checkout)
+    dp.message.register(handle_successful_payment, F.successful_payment)
+    return dp
+
+
+def create_webhook_server(own_pool: bool = True) -> WebhookServer:
+    check_webhook_secret(WEBHOOK_SECRET)
+    return WebhookServer(
+        create_bot(),
+        create_dispatcher(own_pool),
+        url=WEBHOOK_URL,
+        secret=WEBHOOK_SECRET,
+        workers=WEBHOOK_WORKERS,
+        max_pending=WEBHOOK_MAX_PENDING,
+    )
+
 
+async def main():
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN is not set in .env")
+    # ошибки хендлеров и вебхука (bot.webhook, aiogram) пишутся через logging
+    logging.basicConfig(level=logging.INFO)
+
+    if WEBHOOK_URL:
+        print(f"✅ TrafficPanda bot started (webhook on {WEBHOOK_HOST}:{WEBHOOK_PORT})")
+        await run_standalone(create_webhook_server(), WEBHOOK_HOST, WEBHOOK_PORT)
+        return
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    # getUpdates не работает, пока выставлен вебхук (например, после WEBHOOK_URL)
+    await bot.delete_webhook()
     print("✅ TrafficPanda bot started (polling)")
     await dp.start_polling(bot)
 
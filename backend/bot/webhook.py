@@ -0,0 +1,215 @@
+import asyncio
+import hmac
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+from urllib.parse import urlparse
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from pydantic import ValidationError
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+DEFAULT_PATH = "/telegram/webhook"
+# не секреты: пустой и прежний дефолт WEBHOOK_SECRET
+INSECURE_SECRETS = {"", "supersecret"}
+
+logger = logging.getLogger(__name__)
+
+
+def webhook_path(url: str) -> str:
+    return urlparse(url).path or DEFAULT_PATH
+
+
+def check_webhook_secret(secret: Optional[str]):
+    """Для старта вебхука: с пустым или известным секретом апдейты мог бы слать кто угодно."""
+    if secret is None or secret in INSECURE_SECRETS:
+        raise RuntimeError(
+            "Set WEBHOOK_SECRET to a random string to accept Telegram webhook updates"
+        )
+
+
+def update_key(update: Update) -> Hashable:
+    """Ключ очерёдности: чат, иначе юзер (pre_checkout_query и т.п.), иначе сам апдейт."""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat is not None:
+        return context.chat.id
+    if context.user is not None:
+        return context.user.id
+    return ("update", update.update_id)
+
+
+def is_payment(update: Update) -> bool:
+    """pre_checkout_query и successful_payment: их нельзя потерять после ответа Telegram."""
+    if update.pre_checkout_query is not None:
+        return True
+    return update.message is not None and update.message.successful_payment is not None
+
+
+class ChatOrderedPool:
+    """
+    Пул из workers воркеров: апдейты одного ключа (чата) обрабатываются строго
+    по очереди, разных — параллельно.
+
+    У каждого ключа своя очередь; в ready ключ стоит не больше одного раза,
+    поэтому два воркера никогда не берут один чат одновременно. После каждого
+    апдейта ключ уходит в конец ready — болтливый чат не занимает воркер целиком.
+    Всего в пуле не больше max_pending апдейтов, дальше submit ждёт.
+    """
+
+    def __init__(self, workers: int, max_pending: int, handle: Callable[[Update], Awaitable]):
+        self.workers = max(1, workers)
+        self._handle = handle
+        self._chains: Dict[Hashable, Deque[Update]] = {}
+        self._ready: "asyncio.Queue[Hashable]" = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, max_pending))
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def submit(self, key: Hashable, update: Update):
+        await self._slots.acquire()
+        self._pending += 1
+        self._idle.clear()
+        chain = self._chains.get(key)
+        if chain is None:
+            self._chains[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            chain.append(update)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            chain = self._chains[key]
+            update = chain.popleft()
+            try:
+                await self._handle(update)
+            except Exception:
+                logger.exception("update %s failed", update.update_id)
+            finally:
+                if chain:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chains[key]
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+                self._slots.release()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Дожидается принятых апдейтов (не дольше timeout) и гасит воркеры."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("webhook pool stopped with %d unprocessed updates", self._pending)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+class WebhookServer:
+    """
+    Приём апдейтов Telegram по вебхуку.
+
+    feed() не зависит от веб-фреймворка: его вызывают и эндпоинт FastAPI
+    (api.main при WEBHOOK_IN_API=1), и aiohttp-сервер из run_standalone().
+    Апдейт подтверждается сразу после постановки в пул — Telegram не ждёт
+    ответов хендлеров и не копит очередь на своей стороне. Платежи (is_payment)
+    обрабатываются прямо в запросе: 200 — только после выдачи, ошибка — 500,
+    и Telegram доставит апдейт снова (повтор выдачи отсекает charge_id).
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        url: str,
+        secret: str,
+        workers: int,
+        max_pending: int,
+    ):
+        check_webhook_secret(secret)
+        self.bot = bot
+        self.dp = dp
+        self.url = url
+        self.path = webhook_path(url)
+        self._secret = secret.encode()
+        self.pool = ChatOrderedPool(workers, max_pending, self._process)
+
+    async def _process(self, update: Update):
+        await self.dp.feed_update(self.bot, update)
+
+    async def feed(self, secret: Optional[str], body: bytes) -> int:
+        """Принимает тело запроса Telegram; возвращает HTTP-статус ответа."""
+        if secret is None or not hmac.compare_digest(secret.encode(), self._secret):
+            return 401
+        try:
+            update = Update.model_validate_json(body, context={"bot": self.bot})
+        except ValidationError:
+            return 400
+        if is_payment(update):
+            # из очереди пула платёж пропал бы при падении хендлера или остановке
+            try:
+                await self._process(update)
+            except Exception:
+                logger.exception(
+                    "payment update %s failed, asking Telegram to retry", update.update_id
+                )
+                return 500
+            return 200
+        await self.pool.submit(update_key(update), update)
+        return 200
+
+    async def startup(self, set_webhook: bool = True):
+        workflow_data = {"dispatcher": self.dp, "bots": [self.bot], **self.dp.workflow_data}
+        await self.dp.emit_startup(bot=self.bot, **workflow_data)
+        self.pool.start()
+        if set_webhook:
+            await self.bot.set_webhook(
+                self.url,
+                secret_token=self._secret.decode(),
+                allowed_updates=self.dp.resolve_used_update_types(),
+            )
+
+    async def shutdown(self):
+        # вебхук не снимаем: при перезапуске Telegram подержит апдейты и доставит их новому процессу
+        await self.pool.stop()
+        workflow_data = {"dispatcher": self.dp, "bots": [self.bot], **self.dp.workflow_data}
+        await self.dp.emit_shutdown(bot=self.bot, **workflow_data)
+        await self.bot.session.close()
+
+    async def handle_aiohttp(self, request: web.Request) -> web.Response:
+        status = await self.feed(request.headers.get(SECRET_HEADER), await request.read())
+        return web.Response(status=status)
+
+    def aiohttp_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_aiohttp)
+        return app
+
+
+async def run_standalone(server: WebhookServer, host: str, port: int):
+    """Отдельный процесс бота: aiohttp (уже есть как зависимость aiogram) на host:port."""
+    runner = web.AppRunner(server.aiohttp_app())
+    await runner.setup()
+    await server.startup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await asyncio.Event().wait()
+    finally:
+        # сначала перестаём принимать, потом дорабатываем принятое
+        await runner.cleanup()
+        await server.shutdown()
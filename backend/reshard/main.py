@@ -0,0 +1,135 @@
+"""
+Перекладывает данные из раскладки в --from шардов в раскладку в --to шардов
+(app.shards: юзер со своими строками — в шард по хешу user_id, строка referrals —
+в шард приглашённого). Старые файлы не трогаются; после проверки перезапустите
+сервисы с DB_SHARDS=<to>.
+
+    cd backend
+    python -m reshard.main --from 1 --to 4
+    python -m reshard.main --from 4 --to 8 --db /data/trafficpanda.db
+
+Запускать при остановленных API, боте и writer.main: записи во время переноса потеряются.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+from app.config import DB_PATH
+from app.db import init_db
+from app.pool import close_pool
+from app.shards import shard_index, shard_paths
+
+# по какому столбцу строка выбирает шард; остальные таблицы — по user_id
+ROUTE_COLUMN = {"referrals": "invited_id"}
+# AUTOINCREMENT-id из разных шардов пересекаются: в новом файле они выдаются заново
+# (реестр бустеров после перезапуска читает каждый шард с нуля)
+SKIP_COLUMNS = {"star_purchases": {"id"}, "user_boosters": {"id"}}
+# не копируются: их ведут триггеры целевых файлов по мере вставки юзеров
+DERIVED_TABLES = {"users_total"}
+BATCH = 10_000
+
+
+def user_tables(conn: sqlite3.Connection) -> Dict[str, str]:
+    return dict(
+        (name, sql)
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+        if name not in DERIVED_TABLES
+    )
+
+
+def count_rows(paths: List[str], table: str) -> int:
+    total = 0
+    for path in paths:
+        conn = sqlite3.connect(path)
+        if table in user_tables(conn):
+            total += conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.close()
+    return total
+
+
+def copy_table(source: sqlite3.Connection, targets: List[sqlite3.Connection], table: str) -> int:
+    columns = [
+        row[1]
+        for row in source.execute(f"PRAGMA table_info({table})")
+        if row[1] not in SKIP_COLUMNS.get(table, ())
+    ]
+    key = columns.index(ROUTE_COLUMN.get(table, "user_id"))
+    names = ", ".join(columns)
+    insert = f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))})"
+
+    copied = 0
+    # по rowid: новые AUTOINCREMENT-id идут в прежнем порядке
+    cursor = source.execute(f"SELECT {names} FROM {table} ORDER BY rowid")
+    while rows := cursor.fetchmany(BATCH):
+        by_shard: Dict[int, list] = defaultdict(list)
+        for row in rows:
+            by_shard[shard_index(row[key], len(targets))].append(row)
+        for index, shard_rows in by_shard.items():
+            targets[index].executemany(insert, shard_rows)
+        copied += len(rows)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from", dest="source", type=int, required=True, help="шардов сейчас")
+    parser.add_argument("--to", dest="target", type=int, required=True, help="шардов станет")
+    parser.add_argument("--db", default=DB_PATH, help="DB_PATH, от которого считаются имена шардов")
+    args = parser.parse_args()
+
+    sources = shard_paths(args.db, args.source)
+    targets = shard_paths(args.db, args.target)
+    if args.source == args.target:
+        sys.exit("--from и --to совпадают")
+    missing = [p for p in sources if not os.path.exists(p)]
+    if missing:
+        sys.exit(f"Нет файлов исходной раскладки: {', '.join(missing)}")
+    busy = [p for p in targets if os.path.exists(p) and count_rows([p], "users")]
+    if busy:
+        sys.exit(f"Целевые файлы уже с данными: {', '.join(busy)}")
+
+    async def migrate():
+        # исходные — до актуальной схемы (столбцы совпадут), целевые — с нуля
+        await init_db(sources)
+        await init_db(targets)
+        await close_pool()
+
+    asyncio.run(migrate())
+
+    target_conns = [sqlite3.connect(p) for p in targets]
+    tables: Dict[str, str] = {}
+    for path in sources:
+        source = sqlite3.connect(path)
+        for table, sql in user_tables(source).items():
+            for conn in target_conns:
+                # например course_progress_bits, если текущий режим прогресса — rows
+                if table not in user_tables(conn):
+                    conn.execute(sql)
+            tables[table] = sql
+            copied = copy_table(source, target_conns, table)
+            print(f"{path} {table}: {copied}")
+        source.close()
+    for conn in target_conns:
+        conn.commit()
+        conn.close()
+
+    ok = True
+    for table in sorted(tables):
+        before, after = count_rows(sources, table), count_rows(targets, table)
+        ok &= before == after
+        print(f"{table:20} {before:10} -> {after:10} {'ok' if before == after else 'MISMATCH'}")
+    if not ok:
+        sys.exit("Число строк не сошлось — новые файлы не использовать")
+    print(f"✅ {len(sources)} -> {len(targets)} шардов: {', '.join(targets)}")
+    print(f"Перезапустите сервисы с DB_SHARDS={args.target}")
+
+
+if __name__ == "__main__":
+    main()
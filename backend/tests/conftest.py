@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# app.config читает окружение при импорте: тестам — своя временная БД
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "test.db")
+# ключ сессий выводится из токена бота; initData тестов подписывается им же
+os.environ["BOT_TOKEN"] = "123456:test-token"
+os.environ.pop("SESSION_SECRET", None)
+os.environ.pop("AUTH_REQUIRED", None)
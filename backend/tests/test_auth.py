@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import auth
+from app.auth import (
+    AuthError,
+    encode_session,
+    issue_session,
+    profile_version,
+    verify_init_data,
+    verify_session,
+    webapp_secret_key,
+)
+from app.config import BOT_TOKEN
+
+
+def init_data(user_id: int, username: str, auth_date: int = None) -> str:
+    fields = {
+        "auth_date": str(int(time.time()) if auth_date is None else auth_date),
+        "query_id": "q",
+        "user": json.dumps({"id": user_id, "first_name": "Panda", "username": username}),
+    }
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields["hash"] = hmac.new(
+        webapp_secret_key(BOT_TOKEN), check_string.encode(), hashlib.sha256
+    ).hexdigest()
+    return urlencode(fields)
+
+
+def token_for(user_id: int, username: str = "panda", ttl: int = 3600, now: int = None) -> str:
+    return encode_session(issue_session(user_id, profile_version(username), ttl=ttl, now=now))
+
+
+def request_with(token: str = None) -> Request:
+    headers = [] if token is None else [(b"authorization", f"Bearer {token}".encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+# ===== initData =====
+
+def test_init_data_roundtrip():
+    user = verify_init_data(init_data(5, "panda"))
+    assert (user.user_id, user.username) == (5, "panda")
+
+
+def test_tampered_hash_is_rejected():
+    data = init_data(5, "panda")
+    tampered = data[:-1] + ("0" if data[-1] != "0" else "1")
+    with pytest.raises(AuthError, match="signature"):
+        verify_init_data(tampered)
+
+
+def test_tampered_user_is_rejected():
+    # подпись от одного юзера, id — другого
+    data = init_data(5, "panda").replace("%22id%22%3A+5", "%22id%22%3A+6")
+    assert data != init_data(5, "panda")
+    with pytest.raises(AuthError, match="signature"):
+        verify_init_data(data)
+
+
+def test_stale_auth_date_is_rejected():
+    now = int(time.time())
+    data = init_data(5, "panda", auth_date=now - 100)
+    assert verify_init_data(data, max_age=100, now=now).user_id == 5
+    with pytest.raises(AuthError, match="expired"):
+        verify_init_data(data, max_age=100, now=now + 1)
+
+
+# ===== Токен сессии =====
+
+def test_session_roundtrip():
+    session = verify_session(token_for(5))
+    assert (session.user_id, session.profile_version) == (5, profile_version("panda"))
+
+
+def test_expired_session_is_rejected():
+    token = token_for(5, ttl=60, now=1000)
+    assert verify_session(token, now=1059).user_id == 5
+    with pytest.raises(AuthError, match="expired"):
+        verify_session(token, now=1060)
+
+
+@pytest.mark.parametrize("part, value", [(0, "6"), (1, profile_version("other")), (2, "9999999999")])
+def test_tampered_session_is_rejected(part, value):
+    # user_id, profile_version и expires_at закрыты подписью
+    parts = token_for(5).split(".")
+    parts[part] = value
+    with pytest.raises(AuthError, match="Invalid"):
+        verify_session(".".join(parts))
+
+
+def test_foreign_key_is_rejected():
+    token = encode_session(issue_session(5, "v"), key=b"other key")
+    with pytest.raises(AuthError):
+        verify_session(token)
+
+
+def test_without_session_key_every_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(auth, "SESSION_SECRET", "")
+    monkeypatch.setattr(auth, "BOT_TOKEN", "")
+    key = auth._session_key()
+    assert key is None
+    for token in (token_for(5), "5.v.9999999999.", "5.v.9999999999.x", ""):
+        with pytest.raises(AuthError):
+            verify_session(token, key=key)
+    with pytest.raises(AuthError):
+        encode_session(issue_session(5, "v"), key=key)
+
+    monkeypatch.setattr(auth, "SESSION_KEY", key)
+    with pytest.raises(RuntimeError):
+        auth.check_session_key()
+
+
+# ===== API =====
+
+def test_token_of_one_user_is_refused_for_another():
+    from api.main import authorize
+
+    token = token_for(5)
+    authorize(request_with(token), 5)
+    with pytest.raises(HTTPException) as e:
+        authorize(request_with(token), 6)
+    assert e.value.status_code == 403
+    with pytest.raises(HTTPException) as e:
+        authorize(request_with(), 5)
+    assert e.value.status_code == 401
+    with pytest.raises(HTTPException) as e:
+        authorize(request_with(token_for(5, ttl=-1)), 5)
+    assert e.value.status_code == 401
+
+
+def test_changed_profile_version_issues_new_session():
+    from api.main import app
+
+    async def scenario():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                r = await client.post("/auth/session", json={"init_data": init_data(701, "panda")})
+                assert r.status_code == 200
+                first = r.json()
+                old = {"Authorization": f"Bearer {first['token']}"}
+                assert (await client.get("/profile/701", headers=old)).json()["username"] == "panda"
+                assert (await client.get("/profile/702", headers=old)).status_code == 403
+
+                # username сменился: токен перевыпускается с новым profile_version,
+                # а username в БД обновляется, хотя старый токен ещё жив
+                r = await client.post(
+                    "/auth/session", headers=old, json={"init_data": init_data(701, "bamboo")}
+                )
+                second = r.json()
+                assert second["profile_version"] == profile_version("bamboo")
+                assert second["profile_version"] != first["profile_version"]
+                new = {"Authorization": f"Bearer {second['token']}"}
+                assert (await client.get("/profile/701", headers=new)).json()["username"] == "bamboo"
+
+                stale = init_data(701, "bamboo", auth_date=int(time.time()) - 10 ** 6)
+                assert (await client.post("/auth/session", json={"init_data": stale})).status_code == 401
+
+    asyncio.run(scenario())
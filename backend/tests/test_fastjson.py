@@ -0,0 +1,38 @@
+import pytest
+
+from app import fastjson
+from app.fastjson import dumps, dumps_stdlib
+from bench.json_encode import legacy, payloads
+
+# ответы API, на которых меряет bench/json_encode.py: /bootstrap, /catalog, /rating...
+PAYLOADS = payloads()
+
+# значения, на которых сериализаторы чаще всего расходятся
+EDGE_CASES = {
+    "russian": {"s": "Привет, панда 🐼 \"кавычки\" \\ \n\t \u0000\x7f", "ранг": "Мидл-арбитражник"},
+    "ints": {"i": [0, -1, 2 ** 53 + 1, 2 ** 63 - 1, -(2 ** 63)], "big": 2 ** 70},
+    # float — только в диапазоне, где форматы совпадают (см. app.fastjson.dumps)
+    "floats": {"f": [0.1, 1.5, -0.0, 0.01, 12.34, 99.99, 0.0001, 123456789.125, 1e15]},
+    "none": {"b": [True, False, None], "referred_by": None, "nested": {"a": [{"b": []}, {}]}},
+    "tuple": {"t": (1, "x")},
+}
+
+CASES = {**PAYLOADS, **EDGE_CASES}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_dumps_matches_fastapi_bytes(name):
+    payload = CASES[name]
+    expected = legacy(payload)
+    assert dumps_stdlib(payload) == expected
+    assert dumps(payload) == expected
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_dumps_without_orjson(name, monkeypatch):
+    monkeypatch.setattr(fastjson, "orjson", None)
+    assert dumps(CASES[name]) == legacy(CASES[name])
+
+
+def test_payloads_cover_heavy_endpoints():
+    assert {"/bootstrap", "/catalog", "/rating"} <= set(PAYLOADS)
@@ -0,0 +1,118 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app import db, fulfilment
+from app.boosters import COINS_BOOSTER
+from app.fulfilment import REPLAY_MESSAGE, fulfil
+from app.storage import storage
+
+# coins_small: coins:50000
+COINS = 50_000
+
+
+def run(user_id: int, scenario):
+    """Сценарий как в боте: юзер уже заведён (/start), кэша юзеров нет."""
+
+    async def main():
+        fulfilment._recent_charges.clear()
+        await storage.init()
+        try:
+            await storage.get_user(user_id)
+            await scenario()
+        finally:
+            await storage.close()
+
+    asyncio.run(main())
+
+
+def purchases(user_id: int, charge_id: str) -> int:
+    conn = sqlite3.connect(db.user_db(user_id))
+    try:
+        return conn.execute(
+            "SELECT COUNT(*) FROM star_purchases WHERE charge_id = ?", (charge_id,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_repeated_charge_is_granted_once():
+    async def scenario():
+        user, msg, replayed = await fulfil(801, "coins_small", "charge-801")
+        assert (user.coins, replayed) == (COINS, False)
+        user, msg, replayed = await fulfil(801, "coins_small", "charge-801")
+        assert (user.coins, msg, replayed) == (COINS, REPLAY_MESSAGE, True)
+
+    run(801, scenario)
+    assert purchases(801, "charge-801") == 1
+
+
+def test_concurrent_charge_is_granted_once():
+    async def scenario():
+        results = await asyncio.gather(
+            *(fulfil(802, "coins_small", "charge-802") for _ in range(5))
+        )
+        assert sorted(replayed for _, _, replayed in results) == [False] + [True] * 4
+        assert (await storage.get_user(802)).coins == COINS
+
+    run(802, scenario)
+    assert purchases(802, "charge-802") == 1
+
+
+@pytest.mark.parametrize("index_only", [False, True])
+def test_replay_after_restart_is_caught_by_db(index_only, monkeypatch):
+    user_id = 803 + index_only
+    charge_id = f"charge-{user_id}"
+
+    async def scenario():
+        await fulfil(user_id, "coins_small", charge_id)
+        # новый процесс: фильтра недавних charge_id нет
+        fulfilment._recent_charges.clear()
+        if index_only:
+            # проверка прошла до записи параллельного повтора — ловит уникальный индекс
+            async def not_found(charge_id):
+                return False
+
+            monkeypatch.setattr(storage, "star_purchase_exists", not_found)
+        user, msg, replayed = await fulfil(user_id, "coins_small", charge_id)
+        assert (user.coins, msg, replayed) == (COINS, REPLAY_MESSAGE, True)
+        assert charge_id in fulfilment._recent_charges
+
+    run(user_id, scenario)
+    assert purchases(user_id, charge_id) == 1
+
+
+def test_without_charge_id_every_call_grants():
+    async def scenario():
+        await fulfil(805, "coins_small")
+        user, _, replayed = await fulfil(805, "coins_small")
+        assert (user.coins, replayed) == (2 * COINS, False)
+
+    run(805, scenario)
+
+
+def test_purchase_accrues_income_with_coins_booster_from_db():
+    # реестр бустеров не запущен, как в боте без него: множитель берётся из user_boosters
+    async def scenario():
+        now = int(time.time())
+        conn = sqlite3.connect(db.user_db(806))
+        try:
+            conn.execute(
+                "UPDATE users SET hourly_income = 100, last_accrued_at = ?, income_units = 0 "
+                "WHERE user_id = 806",
+                (now - 3600,),
+            )
+            conn.execute(
+                "INSERT INTO user_boosters (user_id, kind, multiplier, expires_at) "
+                "VALUES (806, ?, 2, ?)",
+                (COINS_BOOSTER, now + 3600),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        user, _, _ = await fulfil(806, "coins_small", "charge-806")
+        assert user.coins == COINS + 200
+
+    run(806, scenario)
@@ -0,0 +1,60 @@
+from app.income import OFFLINE_CAP_SECONDS, accrue_income
+from app.models import User
+
+T0 = 1_700_000_000
+
+
+def make_user(hourly_income: int = 10) -> User:
+    return User(
+        user_id=1,
+        username="u",
+        coins=0,
+        xp=0,
+        hourly_income=hourly_income,
+        level=1,
+        rank_name="Новичок",
+        referred_by=None,
+        last_accrued_at=T0,
+    )
+
+
+def read_every(user: User, step: int, total: int, **kwargs) -> int:
+    """Начисление при каждом чтении, как делает get_user."""
+    for now in range(T0 + step, T0 + total + 1, step):
+        accrue_income(user, now=now, **kwargs)
+    return user.coins
+
+
+def test_frequent_reads_lose_nothing():
+    # 10 монет/ч, 9000 с, чтение каждые 500 с — ровно 25 монет, как одним чтением
+    assert read_every(make_user(10), 500, 9000) == 25
+    once = make_user(10)
+    accrue_income(once, now=T0 + 9000)
+    assert once.coins == 25
+
+
+def test_reads_every_second_match_single_read():
+    for income in (7, 10, 13, 10_000):
+        frequent = make_user(income)
+        read_every(frequent, 1, 3000)
+        once = make_user(income)
+        accrue_income(once, now=T0 + 3000)
+        assert (frequent.coins, frequent.income_units) == (once.coins, once.income_units)
+
+
+def test_boosted_frequent_reads():
+    frequent = make_user(7)
+    read_every(frequent, 3, 1800, multiplier=2, boost_until=T0 + 900)
+    # 900 с по 14/ч + 900 с по 7/ч = 5.25 монеты
+    assert frequent.coins == 5
+    assert frequent.income_units == 900
+
+
+def test_offline_cap_burns_extra_time():
+    user = make_user(10)
+    user.income_units = 1800
+    accrue_income(user, now=T0 + OFFLINE_CAP_SECONDS + 3600)
+    # за лимит офлайна — 30 монет, плюс ранее накопленные полмонеты
+    assert user.coins == 30
+    assert user.income_units == 1800
+    assert user.last_accrued_at == T0 + OFFLINE_CAP_SECONDS + 3600
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import db
+from app.pool import close_pool
+from app.shop import PANDAS, buy_panda
+
+TRAFFIC = PANDAS["traffic"].price
+CRYPTO = PANDAS["crypto"].price
+
+
+def run(scenario):
+    """Сценарий с включённым кэшем, как в API; в конце кэш сброшен в БД."""
+
+    async def main():
+        await db.init_db()
+        await db.user_cache.start()
+        try:
+            await scenario()
+        finally:
+            await db.user_cache.stop()
+            await db.stop_writers()
+            await close_pool()
+
+    asyncio.run(main())
+
+
+def query(user_id: int, sql: str):
+    conn = sqlite3.connect(db.user_db(user_id))
+    try:
+        return conn.execute(sql, (user_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def state(user_id: int):
+    """(coins, xp, hourly_income, панды) — как в БД."""
+    (coins, xp, income), = query(
+        user_id, "SELECT coins, xp, hourly_income FROM users WHERE user_id = ?"
+    )
+    pandas = [p for p, in query(
+        user_id, "SELECT panda_id FROM panda_purchases WHERE user_id = ? ORDER BY panda_id"
+    )]
+    return coins, xp, income, pandas
+
+
+async def user_with(user_id: int, coins: int = 0, xp: int = 0):
+    user = await db.get_user(user_id)
+    user.coins += coins
+    user.xp += xp
+    await db.update_user(user)
+    return user
+
+
+def test_concurrent_buys_do_not_overspend():
+    async def scenario():
+        # хватает на одну панду из двух
+        user = await user_with(1101, coins=CRYPTO)
+        results = await asyncio.gather(
+            buy_panda(user, "traffic"), buy_panda(user, "crypto"), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        assert len(errors) == 1 and str(errors[0]) == "Not enough coins"
+
+    run(scenario)
+    coins, _, _, pandas = state(1101)
+    assert coins >= 0 and len(pandas) == 1
+    assert coins == CRYPTO - PANDAS[pandas[0]].price
+
+
+def test_concurrent_buys_of_same_panda_charge_once():
+    async def scenario():
+        user = await user_with(1102, coins=3 * TRAFFIC)
+        results = await asyncio.gather(
+            *(buy_panda(user, "traffic") for _ in range(3)), return_exceptions=True
+        )
+        errors = [str(r) for r in results if isinstance(r, Exception)]
+        assert errors == ["Panda already purchased"] * 2
+
+    run(scenario)
+    coins, _, income, pandas = state(1102)
+    assert (coins, pandas) == (2 * TRAFFIC, ["traffic"])
+
+
+@pytest.mark.parametrize(
+    "user_id, coins, owned, error",
+    [
+        (1103, TRAFFIC - 1, [], "Not enough coins"),
+        (1104, 2 * TRAFFIC, ["traffic"], "Panda already purchased"),
+    ],
+)
+def test_failed_buy_changes_nothing(user_id, coins, owned, error):
+    async def scenario():
+        user = await user_with(user_id, coins=coins, xp=500)
+        for panda_id in owned:
+            user = await buy_panda(user, panda_id)
+        await db.user_cache.flush()
+        before = state(user_id)
+        with pytest.raises(ValueError, match=error):
+            await buy_panda(user, "traffic")
+        await db.user_cache.flush()
+        assert state(user_id) == before
+        assert (await db.get_user(user_id)).coins == before[0]
+
+    run(scenario)
+
+
+def test_buy_sees_unflushed_cached_changes():
+    async def scenario():
+        # монеты есть только в кэше: перед покупкой они сбрасываются в БД
+        await user_with(1105, coins=TRAFFIC, xp=700)
+        assert db.user_cache.dirty_count == 1
+        user = await buy_panda(await db.get_user(1105), "traffic")
+        assert (user.coins, user.xp) == (0, 700)
+        assert db.user_cache.dirty_count == 0
+        assert state(1105)[:2] == (0, 700)
+
+    run(scenario)
+    coins, xp, income, pandas = state(1105)
+    assert (coins, xp, pandas) == (0, 700, ["traffic"])
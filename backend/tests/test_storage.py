@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.memory_storage import MemoryStorage
+from app.shop import PANDAS
+from app.sqlite_storage import SQLiteStorage
+from app.storage import DuplicatePurchase
+
+# у SQLite общая на все тесты БД: у сценария свои user_id
+BASE = 3000
+INVITER, FRIEND, OTHER_INVITER, BUYER, FRIEND_2, FRIEND_3 = (BASE + i for i in range(1, 7))
+USERS = (INVITER, FRIEND, OTHER_INVITER, BUYER, FRIEND_2, FRIEND_3)
+
+
+def user_state(user):
+    # income_units не сравниваем: пассивный доход зависит от момента чтения
+    return (user.coins, user.xp, user.hourly_income, user.level, user.rank_name, user.referred_by)
+
+
+async def scenario(storage):
+    out = []
+    for user_id in USERS:
+        await storage.get_user(user_id, f"u{user_id}")
+
+    # покупка панды: не хватает, хватает, повтор
+    buyer = await storage.get_user(BUYER)
+    for coins in (0, PANDAS["traffic"].price):
+        buyer.coins += coins
+        await storage.update_user(buyer)
+        try:
+            out.append(("buy", user_state(await storage.apply_purchase(
+                BUYER, price=PANDAS["traffic"].price, panda_id="traffic", income_bonus=50
+            ))))
+        except ValueError as e:
+            out.append(("buy", str(e)))
+    try:
+        await storage.apply_purchase(BUYER, price=0, panda_id="traffic")
+    except ValueError as e:
+        out.append(("buy again", str(e)))
+
+    # рефералы: повтор приглашённого и самоприглашение не засчитываются
+    counts = await storage.credit_referrals(
+        [
+            (INVITER, FRIEND),
+            (INVITER, FRIEND_2),
+            (OTHER_INVITER, FRIEND),
+            (OTHER_INVITER, FRIEND_3),
+            (INVITER, INVITER),
+        ],
+        coins=1000,
+        xp=300,
+    )
+    out.append(("referrals", sorted((k - BASE, v) for k, v in counts.items())))
+    out.append(("add referral", await storage.add_referral(OTHER_INVITER, FRIEND_2)))
+
+    # бустер и Stars: повтор charge_id ничего не начисляет
+    user = await storage.apply_purchase(INVITER, booster=("coins", 2, 3600))
+    out.append(("booster", user_state(user)))
+    star = ("coins:500", 10, "coins_small", f"charge-{BASE}")
+    out.append(("stars", user_state(await storage.apply_purchase(INVITER, coins=500, star_purchase=star))))
+    try:
+        await storage.apply_purchase(INVITER, coins=500, star_purchase=star)
+    except DuplicatePurchase:
+        out.append(("stars", "duplicate"))
+
+    for user_id in USERS:
+        snapshot = await storage.get_user_snapshot(user_id)
+        out.append((
+            user_id - BASE,
+            user_state(snapshot.user),
+            snapshot.pandas,
+            snapshot.referrals_count,
+        ))
+
+    # рейтинг: порядок юзеров сценария среди всех
+    top = await storage.get_top_users(10_000)
+    out.append(("rating", [u.user_id - BASE for u in top if u.user_id in USERS]))
+    ranks = [(await storage.get_rating_neighbourhood(u, 0))[0] for u in USERS]
+    out.append(("ranks", sorted(range(len(USERS)), key=lambda i: ranks[i])))
+    return out
+
+
+def run(storage):
+    async def main():
+        await storage.init()
+        try:
+            return await scenario(storage)
+        finally:
+            await storage.close()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(scope="module")
+def memory_result():
+    return run(MemoryStorage())
+
+
+@pytest.mark.parametrize("engine", [SQLiteStorage])
+def test_engines_agree(engine, memory_result):
+    assert run(engine()) == memory_result
+
@@ -0,0 +1,130 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from app import db
+from app.pool import close_pool
+
+
+def run(scenario):
+    """Сценарий с включённым кэшем, как в API; в конце кэш сброшен в БД."""
+
+    async def main():
+        await db.init_db()
+        await db.user_cache.start()
+        try:
+            await scenario()
+        finally:
+            await db.user_cache.stop()
+            await db.stop_writers()
+            await close_pool()
+
+    asyncio.run(main())
+
+
+def row(user_id: int, columns: str = "coins, xp"):
+    conn = sqlite3.connect(db.user_db(user_id))
+    try:
+        return conn.execute(f"SELECT {columns} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_failed_purchase_keeps_cached_changes():
+    async def scenario():
+        user = await db.get_user(101)
+        user.xp += 1000
+        await db.update_user(user)
+        with pytest.raises(ValueError, match="Not enough coins"):
+            await db.apply_purchase(101, price=10**9)
+
+    run(scenario)
+    assert row(101, "xp") == (1000,)
+
+
+def external_write(user_id: int, sql: str):
+    """Запись мимо кэша — как бот, скрипт или другой воркер."""
+    conn = sqlite3.connect(db.user_db(user_id))
+    try:
+        conn.execute(sql, (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_external_write_survives_flush():
+    async def scenario():
+        user = await db.get_user(201)
+        external_write(201, "UPDATE users SET coins = coins + 50000 WHERE user_id = ?")
+        user.coins += 7
+        user.xp += 30
+        await db.update_user(user)
+        await db.user_cache.flush()
+        # строку перечитали: в кэше и то и другое
+        user = await db.get_user(201)
+        assert (user.coins, user.xp) == (50007, 30)
+
+    run(scenario)
+    assert row(201) == (50007, 30)
+
+
+def test_flush_writes_whole_row_without_external_writes():
+    async def scenario():
+        for _ in range(3):
+            user = await db.get_user(301)
+            user.coins += 5
+            user.hourly_income += 1
+            await db.update_user(user)
+            await db.user_cache.flush()
+
+    run(scenario)
+    assert row(301, "coins, hourly_income, version") == (15, 13, 3)
+
+
+def test_changes_made_during_external_write_are_added_once():
+    async def scenario():
+        user = await db.get_user(401)
+        user.xp += 10
+        await db.update_user(user)
+        external_write(401, "UPDATE users SET xp = xp + 100 WHERE user_id = ?")
+        user = await db.get_user(401)
+        user.xp += 20
+        await db.update_user(user)
+        await db.user_cache.flush()
+        await db.user_cache.flush()
+
+    run(scenario)
+    assert row(401, "xp, level") == (130, db.level_from_xp(130))
+
+
+def test_clean_entry_sees_external_write_after_ttl():
+    async def scenario():
+        db.user_cache.ttl = 0.05
+        try:
+            assert (await db.get_user(501)).coins == 0
+            external_write(501, "UPDATE users SET coins = coins + 50000 WHERE user_id = ?")
+            await asyncio.sleep(0.1)
+            assert (await db.get_user(501)).coins == 50000
+        finally:
+            db.user_cache.ttl = 1.0
+
+    run(scenario)
+
+
+def test_flushed_entry_sees_external_write_after_ttl():
+    async def scenario():
+        db.user_cache.ttl = 0.05
+        try:
+            user = await db.get_user(502)
+            user.xp += 10
+            await db.update_user(user)
+            await db.user_cache.flush()
+            external_write(502, "UPDATE users SET coins = coins + 70 WHERE user_id = ?")
+            await asyncio.sleep(0.1)
+            user = await db.get_user(502)
+            assert (user.coins, user.xp) == (70, 10)
+        finally:
+            db.user_cache.ttl = 1.0
+
+    run(scenario)
@@ -0,0 +1,198 @@
+import asyncio
+import random
+from collections import defaultdict
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bot.webhook import SECRET_HEADER, ChatOrderedPool, WebhookServer
+
+SECRET = "test-secret"
+TOKEN = "123456:test-token"
+
+
+def message_update(update_id: int, chat_id: int, text: str = "hi") -> bytes:
+    return (
+        '{"update_id": %d, "message": {"message_id": %d, "date": 0, '
+        '"chat": {"id": %d, "type": "private"}, '
+        '"from": {"id": %d, "is_bot": false, "first_name": "u"}, "text": "%s"}}'
+        % (update_id, update_id, chat_id, chat_id, text)
+    ).encode()
+
+
+def make_server(secret: str = SECRET, workers: int = 4, max_pending: int = 100) -> WebhookServer:
+    return WebhookServer(
+        Bot(TOKEN),
+        Dispatcher(),
+        url="https://example.com/telegram/webhook",
+        secret=secret,
+        workers=workers,
+        max_pending=max_pending,
+    )
+
+
+@pytest.mark.parametrize("secret", ["", "supersecret"])
+def test_refuses_to_start_without_secret(secret):
+    with pytest.raises(RuntimeError):
+        make_server(secret)
+
+
+@pytest.mark.parametrize("header", [None, "", "wrong", SECRET + "x"])
+def test_wrong_secret_never_reaches_dispatcher(header):
+    async def scenario():
+        server = make_server()
+        seen = []
+
+        async def process(update):
+            seen.append(update.update_id)
+
+        server._process = process
+        server.pool._handle = process
+        server.pool.start()
+        try:
+            assert await server.feed(header, message_update(1, 10)) == 401
+            assert await server.feed(SECRET, message_update(2, 10)) == 200
+        finally:
+            await server.pool.stop()
+            await server.bot.session.close()
+        return seen
+
+    assert asyncio.run(scenario()) == [2]
+
+
+def test_aiohttp_handler_checks_secret_header():
+    from aiohttp.test_utils import TestClient, TestServer
+
+    async def scenario():
+        server = make_server()
+        seen = []
+
+        async def process(update):
+            seen.append(update.update_id)
+
+        server.pool._handle = process
+        server.pool.start()
+        client = TestClient(TestServer(server.aiohttp_app()))
+        await client.start_server()
+        try:
+            body = message_update(1, 10)
+            missing = await client.post(server.path, data=body)
+            wrong = await client.post(server.path, data=body, headers={SECRET_HEADER: "nope"})
+            right = await client.post(
+                server.path, data=message_update(2, 10), headers={SECRET_HEADER: SECRET}
+            )
+            statuses = (missing.status, wrong.status, right.status)
+        finally:
+            await client.close()
+            await server.pool.stop()
+            await server.bot.session.close()
+        return statuses, seen
+
+    assert asyncio.run(scenario()) == ((401, 401, 200), [2])
+
+
+def parse(body: bytes) -> Update:
+    return Update.model_validate_json(body)
+
+
+def payment_update(update_id: int, chat_id: int) -> bytes:
+    return (
+        '{"update_id": %d, "message": {"message_id": %d, "date": 0, '
+        '"chat": {"id": %d, "type": "private"}, '
+        '"from": {"id": %d, "is_bot": false, "first_name": "u"}, '
+        '"successful_payment": {"currency": "XTR", "total_amount": 100, '
+        '"invoice_payload": "coins:50000", "telegram_payment_charge_id": "c%d", '
+        '"provider_payment_charge_id": ""}}}'
+        % (update_id, update_id, chat_id, chat_id, update_id)
+    ).encode()
+
+
+def test_pool_keeps_order_within_chat():
+    rnd = random.Random(7)
+    chats = [10, 20, 30, 40, 50]
+
+    async def scenario():
+        handled = defaultdict(list)
+        running = set()
+
+        async def handle(update):
+            chat_id = update.message.chat.id
+            assert chat_id not in running  # один чат — не больше одного воркера
+            running.add(chat_id)
+            await asyncio.sleep(rnd.random() / 500)
+            running.discard(chat_id)
+            handled[chat_id].append(update.update_id)
+
+        pool = ChatOrderedPool(workers=4, max_pending=8, handle=handle)
+        pool.start()
+        sent = defaultdict(list)
+        for update_id in range(1, 201):
+            chat_id = rnd.choice(chats)
+            sent[chat_id].append(update_id)
+            await pool.submit(chat_id, parse(message_update(update_id, chat_id)))
+        await pool.stop()
+        return sent, handled
+
+    sent, handled = asyncio.run(scenario())
+    assert handled == sent
+
+
+def test_pool_survives_failing_handler():
+    async def scenario():
+        handled = []
+
+        async def handle(update):
+            if update.update_id == 2:
+                raise RuntimeError("boom")
+            handled.append(update.update_id)
+
+        pool = ChatOrderedPool(workers=2, max_pending=10, handle=handle)
+        pool.start()
+        for update_id in range(1, 5):
+            await pool.submit(10, parse(message_update(update_id, 10)))
+        await pool.stop()
+        return handled, pool.pending
+
+    assert asyncio.run(scenario()) == ([1, 3, 4], 0)
+
+
+def test_pool_stop_drains_queue():
+    async def scenario():
+        handled = []
+
+        async def handle(update):
+            await asyncio.sleep(0.001)
+            handled.append(update.update_id)
+
+        pool = ChatOrderedPool(workers=2, max_pending=100, handle=handle)
+        pool.start()
+        for update_id in range(1, 51):
+            await pool.submit(update_id % 3, parse(message_update(update_id, update_id % 3 + 1)))
+        assert pool.pending > 0
+        await pool.stop()
+        return sorted(handled), pool.pending
+
+    assert asyncio.run(scenario()) == (list(range(1, 51)), 0)
+
+
+@pytest.mark.parametrize("fail, status", [(False, 200), (True, 500)])
+def test_payment_is_processed_inline(fail, status):
+    async def scenario():
+        server = make_server()
+        handled = []
+
+        async def process(update):
+            if fail:
+                raise RuntimeError("db down")
+            handled.append(update.update_id)
+
+        server._process = process
+        # пул не запущен: платёж, ушедший в очередь, не был бы обработан
+        try:
+            result = await server.feed(SECRET, payment_update(1, 10))
+        finally:
+            await server.bot.session.close()
+        return result, handled, server.pool.pending
+
+    assert asyncio.run(scenario()) == (status, [] if fail else [1], 0)
@@ -0,0 +1,38 @@
+import asyncio
+import signal
+
+from app.config import DB_WRITER_MAX_BATCH, DB_WRITER_SOCKET
+from app.db import SHARDS, init_db
+from app.pool import close_pool
+from app.shards import shard_paths
+from app.writer import WriteActor, WriterServer
+
+
+async def main():
+    # схему создаёт/мигрирует сам сервис; клиенты (API, бот) с DB_WRITER=unix
+    # шлют сюда записи, а читают файл напрямую
+    await init_db()
+    # по сокету и актору на шард: шарды пишутся параллельно, каждый своей транзакцией
+    servers = [
+        WriterServer(socket_path, WriteActor(DB_WRITER_MAX_BATCH, path))
+        for path, socket_path in zip(SHARDS, shard_paths(DB_WRITER_SOCKET, len(SHARDS)))
+    ]
+    for server in servers:
+        await server.start()
+        print(f"✅ DB writer started on {server.path} ({server.actor.path})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # принятые записи дописываются до закрытия пула
+        for server in servers:
+            await server.stop()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -106,6 +106,45 @@ type FriendsData = {
   referral_link: string | null;
 };
 
+// Статический контент: грузится один раз по версии и кэшируется браузером
+type Catalog = {
+  version: string;
+  pandas: { items: Omit<PandaItem, "owned" | "can_afford">[] };
+  course: { items: CourseStep[] };
+  skills: { items: Skill[] };
+  story: { items: StoryChapter[] };
+  stars_products: { items: StarsProduct[] };
+  tasks: TasksResponse;
+};
+
+// Ответы per-user эндпоинтов: только id и состояние, тексты — в каталоге
+type ShopState = {
+  catalog_version: string;
+  items: { id: string; owned: boolean; can_afford: boolean }[];
+  coins: number;
+  hourly_income: number;
+};
+
+type CourseState = {
+  catalog_version: string;
+  completed_step_ids: string[];
+  next_step_id: string | null;
+  total_steps: number;
+};
+
+type UnlockedIds = { catalog_version: string; unlocked_ids: string[] };
+
+type BootstrapResponse = {
+  catalog_version: string;
+  profile: Profile;
+  shop: ShopState;
+  course_progress: CourseState;
+  rating: { items: RatingUser[] };
+  story: UnlockedIds;
+  skills: UnlockedIds;
+  friends: FriendsData;
+};
+
 type Tab =
   | "profile"
   | "shop"
@@ -117,24 +156,110 @@ type Tab =
   | "friends"
   | "premium";
 
-// ===================== TELEGRAM USER =========================
+// ===================== CATALOG ===============================
+
+async function loadCatalog(version: string): Promise<Catalog> {
+  // URL с версией отдаётся с immutable — повторные открытия не ходят в сеть
+  const { data } = await axios.get<Catalog>(`${API_BASE}/catalog`, {
+    params: { v: version },
+  });
+  return data;
+}
+
+function pickByIds<T extends { id: string }>(items: T[], ids: string[]): T[] {
+  const wanted = new Set(ids);
+  return items.filter((item) => wanted.has(item.id));
+}
+
+function joinShop(catalog: Catalog, state: ShopState): ShopResponse {
+  const byId = new Map(state.items.map((i) => [i.id, i]));
+  return {
+    items: catalog.pandas.items
+      .filter((p) => byId.has(p.id))
+      .map((p) => ({ ...p, ...byId.get(p.id)! })),
+    coins: state.coins,
+    hourly_income: state.hourly_income,
+  };
+}
+
+function joinCourse(catalog: Catalog, state: CourseState): CourseProgress {
+  return {
+    completed_step_ids: state.completed_step_ids,
+    next_step:
+      catalog.course.items.find((s) => s.id === state.next_step_id) || null,
+    total_steps: state.total_steps,
+  };
+}
+
+// ===================== TELEGRAM AUTH =========================
+
+type AuthSession = {
+  token: string;
+  user_id: number;
+  profile_version: string;
+  expires_at: number;
+};
+
+const SESSION_STORAGE_KEY = "tp_session";
+
+function storedSession(): AuthSession | null {
+  try {
+    return JSON.parse(sessionStorage.getItem(SESSION_STORAGE_KEY) || "null");
+  } catch {
+    return null;
+  }
+}
 
-function getTelegramUserId(): number | null {
+// initData проверяется бэкендом один раз; дальше все запросы идут с токеном сессии
+async function authenticate(): Promise<number | null> {
   const tg = (window as any).Telegram?.WebApp;
-  if (tg?.initDataUnsafe?.user?.id) return tg.initDataUnsafe.user.id;
+  const initData: string | undefined = tg?.initData;
+  if (initData) {
+    // живой токен шлём с собой — тогда бэкенд продлит сессию, не трогая БД
+    const prev = storedSession();
+    const { data } = await axios.post<AuthSession>(
+      `${API_BASE}/auth/session`,
+      { init_data: initData },
+      prev ? { headers: { Authorization: `Bearer ${prev.token}` } } : undefined
+    );
+    sessionStorage.setItem(SESSION_STORAGE_KEY, JSON.stringify(data));
+    axios.defaults.headers.common["Authorization"] = `Bearer ${data.token}`;
+    return data.user_id;
+  }
 
+  // локальная отладка вне Telegram (API с AUTH_REQUIRED=0)
   const q = new URLSearchParams(window.location.search);
   if (q.get("user_id")) return Number(q.get("user_id"));
 
   return null;
 }
 
+// токен истёк, пока Mini App была открыта, — переавторизуемся и повторяем запрос
+axios.interceptors.response.use(undefined, async (error) => {
+  const config = error.config;
+  if (
+    error.response?.status === 401 &&
+    config &&
+    !config._retried &&
+    !String(config.url).endsWith("/auth/session")
+  ) {
+    config._retried = true;
+    sessionStorage.removeItem(SESSION_STORAGE_KEY);
+    if (await authenticate()) {
+      config.headers["Authorization"] = axios.defaults.headers.common["Authorization"];
+      return axios(config);
+    }
+  }
+  return Promise.reject(error);
+});
+
 // ===================== MAIN APP ==============================
 
 const App: React.FC = () => {
   const [tab, setTab] = useState<Tab>("profile");
 
   const [userId, setUserId] = useState<number | null>(null);
+  const [catalog, setCatalog] = useState<Catalog | null>(null);
   const [profile, setProfile] = useState<Profile | null>(null);
   const [shop, setShop] = useState<ShopResponse | null>(null);
   const [tasks, setTasks] = useState<Task[] | null>(null);
@@ -155,50 +280,40 @@ const App: React.FC = () => {
   // ============================================================
 
   useEffect(() => {
-    const id = getTelegramUserId();
-    if (!id) {
-      setToast(
-        "Не удалось получить user_id — MiniApp должен запускаться из Telegram."
-      );
-      setLoading(false);
-      return;
-    }
+    async function loadAll() {
+      let id: number | null = null;
+      try {
+        id = await authenticate();
+      } catch (err) {
+        console.error(err);
+      }
+      if (!id) {
+        setToast(
+          "Не удалось авторизоваться — MiniApp должен запускаться из Telegram."
+        );
+        setLoading(false);
+        return;
+      }
 
-    setUserId(id);
+      setUserId(id);
 
-    async function loadAll() {
       try {
-        const [
-          pRes,
-          shRes,
-          tRes,
-          cRes,
-          rRes,
-          sRes,
-          skRes,
-          frRes,
-          prRes,
-        ] = await Promise.all([
-          axios.get<Profile>(`${API_BASE}/profile/${id}`),
-          axios.get<ShopResponse>(`${API_BASE}/shop/pandas/${id}`),
-          axios.get<TasksResponse>(`${API_BASE}/tasks/${id}`),
-          axios.get<CourseProgress>(`${API_BASE}/course-progress/${id}`),
-          axios.get<{ items: RatingUser[] }>(`${API_BASE}/rating`),
-          axios.get<{ items: StoryChapter[] }>(`${API_BASE}/story/${id}`),
-          axios.get<{ items: Skill[] }>(`${API_BASE}/skills/${id}`),
-          axios.get<FriendsData>(`${API_BASE}/friends/${id}`),
-          axios.get<{ items: StarsProduct[] }>(`${API_BASE}/stars/products`),
-        ]);
-
-        setProfile(pRes.data);
-        setShop(shRes.data);
-        setTasks(tRes.data.items);
-        setCourse(cRes.data);
-        setRating(rRes.data.items);
-        setStory(sRes.data.items);
-        setSkills(skRes.data.items);
-        setFriends(frRes.data);
-        setProducts(prRes.data.items);
+        // Один запрос вместо девяти: бэкенд читает юзера из БД один раз
+        const { data } = await axios.get<BootstrapResponse>(
+          `${API_BASE}/bootstrap/${id}`
+        );
+        const cat = await loadCatalog(data.catalog_version);
+
+        setCatalog(cat);
+        setProfile(data.profile);
+        setShop(joinShop(cat, data.shop));
+        setTasks(cat.tasks.items);
+        setCourse(joinCourse(cat, data.course_progress));
+        setRating(data.rating.items);
+        setStory(pickByIds(cat.story.items, data.story.unlocked_ids));
+        setSkills(pickByIds(cat.skills.items, data.skills.unlocked_ids));
+        setFriends(data.friends);
+        setProducts(cat.stars_products.items);
       } catch (err) {
         console.error(err);
         setToast("Ошибка загрузки данных");
@@ -215,7 +330,7 @@ const App: React.FC = () => {
   // ============================================================
 
   async function buy(pandaId: string) {
-    if (!userId) return;
+    if (!userId || !catalog) return;
     setBuying(pandaId);
     try {
       await axios.post(`${API_BASE}/shop/buy`, {
@@ -224,10 +339,10 @@ const App: React.FC = () => {
       });
       const [pRes, shRes] = await Promise.all([
         axios.get<Profile>(`${API_BASE}/profile/${userId}`),
-        axios.get<ShopResponse>(`${API_BASE}/shop/pandas/${userId}`),
+        axios.get<ShopState>(`${API_BASE}/shop/pandas/${userId}`),
       ]);
       setProfile(pRes.data);
-      setShop(shRes.data);
+      setShop(joinShop(catalog, shRes.data));
       setToast("Панда куплена! 🐼");
     } catch (e: any) {
       setToast(e.response?.data?.detail || "Ошибка покупки");
@@ -241,7 +356,7 @@ const App: React.FC = () => {
   // ============================================================
 
   async function answerCourse(optionIndex: number) {
-    if (!userId || !course?.next_step) return;
+    if (!userId || !catalog || !course?.next_step) return;
     setAnswering(true);
     try {
       const res = await axios.post(`${API_BASE}/course/answer`, {
@@ -252,13 +367,11 @@ const App: React.FC = () => {
 
       setToast(res.data.message);
       setProfile(res.data.profile);
-      setCourse(res.data.course_progress);
+      setCourse(joinCourse(catalog, res.data.course_progress));
 
       // refresh story
-      const st = await axios.get<{ items: StoryChapter[] }>(
-        `${API_BASE}/story/${userId}`
-      );
-      setStory(st.data.items);
+      const st = await axios.get<UnlockedIds>(`${API_BASE}/story/${userId}`);
+      setStory(pickByIds(catalog.story.items, st.data.unlocked_ids));
     } catch (e: any) {
       setToast(e.response?.data?.detail || "Ошибка ответа");
     } finally {
@@ -272,10 +385,13 @@ const App: React.FC = () => {
 
   async function startMockStarsBuy(productId: string) {
     if (!userId) return;
+    // один ключ на нажатие: повтор запроса не выдаст покупку второй раз
+    const idempotencyKey = crypto.randomUUID();
     try {
       const res = await axios.post(`${API_BASE}/stars/mock-buy`, {
         user_id: userId,
         product_id: productId,
+        idempotency_key: idempotencyKey,
       });
       setProfile(res.data.profile);
       setToast(res.data.message || "Покупка успешно обработана (mock)");